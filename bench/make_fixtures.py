@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Build Wikipedia pages for the stand-in server from the MusicBrainz
+database, for the first entities that wp_links_artists.py or wp_links_rgs.py
+will look at. A share of the pages (--match-rate) mention enough albums or
+tracks to be linked, the others are about something else. Another share
+(--missing-rate) has no page at all, although Solr finds one.
+
+    bench/make_fixtures.py artists 200 > artists.json
+"""
+
+import os
+import sys
+import json
+import random
+from optparse import OptionParser
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import config as cfg
+
+
+# Same selection as wp_links_artists.py for English
+artists_query = """
+SELECT a.id, a.name
+FROM s_artist a
+LEFT JOIN country c ON c.id = a.country
+LEFT JOIN bot_wp_artist_link b ON a.gid = b.gid AND b.lang = 'en'
+WHERE a.id > 2 AND b.gid IS NULL AND a.id NOT IN (
+    SELECT l.entity0
+    FROM l_artist_url l
+    JOIN url u ON l.entity1 = u.id AND u.url LIKE 'http://en.wikipedia.org/wiki/%%'
+    WHERE l.link IN (SELECT id FROM link WHERE link_type = 179))
+ORDER BY c.iso_code NULLS LAST, a.id
+LIMIT %s
+"""
+
+artist_albums_query = """
+SELECT rg.name
+FROM s_release_group rg
+JOIN artist_credit_name acn ON rg.artist_credit = acn.artist_credit
+WHERE acn.artist = %s
+"""
+
+# Same selection as wp_links_rgs.py for English
+rgs_query = """
+SELECT rg.id, rg.name, ac.name
+FROM s_release_group rg
+JOIN s_artist_credit ac ON rg.artist_credit = ac.id
+LEFT JOIN bot_wp_rg_link b ON rg.gid = b.gid AND b.lang = 'en'
+WHERE rg.artist_credit > 2 AND b.gid IS NULL
+    AND (rg.type IS NULL OR rg.type IN (SELECT id FROM release_group_type WHERE name IN ('Album', 'EP', 'Live', 'Remix', 'Compilation', 'Soundtrack')))
+    AND rg.id NOT IN (
+        SELECT l.entity0
+        FROM l_release_group_url l
+        JOIN url u ON l.entity1 = u.id AND u.url LIKE 'http://en.wikipedia.org/wiki/%%'
+        WHERE l.link IN (SELECT id FROM link WHERE link_type = 89))
+ORDER BY rg.artist_credit, rg.id
+LIMIT %s
+"""
+
+rg_tracks_query = """
+SELECT DISTINCT t.name
+FROM s_track t
+JOIN tracklist tl ON t.tracklist = tl.id
+JOIN medium m ON tl.id = m.tracklist
+JOIN release r ON m.release = r.id
+WHERE r.release_group = %s
+"""
+
+
+def artist_page(name, albums, match):
+    text = u"{{Infobox musical artist\n| name = %s\n}}\n'''%s''' is a musician.\n\n" % (name, name)
+    if match:
+        text += u'== Discography ==\n' + u''.join(u'* \'\'%s\'\'\n' % (album,) for album in albums)
+    else:
+        text += u'%s is best known for work outside of music.\n' % (name,)
+    return text + u'\n[[Category:Musicians]]\n'
+
+
+def rg_page(name, artist, tracks, match):
+    text = u"{{Infobox album\n| name = %s\n| artist = %s\n}}\n'''%s''' is an album by %s.\n\n" % (name, artist, name, artist)
+    if match:
+        text += u'== Track listing ==\n' + u''.join(u'# "%s"\n' % (track,) for track in tracks)
+        return text + u'\n[[Category:%s albums]]\n' % (artist,)
+    return text + u'\n[[Category:Films]]\n'
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] artists|rgs <count>')
+    parser.add_option('--match-rate', type='float', default=0.2, help='share of pages that should be linked')
+    parser.add_option('--missing-rate', type='float', default=0.1, help='share of pages that are missing')
+    parser.add_option('--seed', type='int', default=1)
+    options, args = parser.parse_args()
+    if len(args) != 2 or args[0] not in ('artists', 'rgs'):
+        parser.error('expected artists|rgs and a count')
+    kind, count = args[0], int(args[1])
+    rnd = random.Random(options.seed)
+
+    engine = sqlalchemy.create_engine(cfg.MB_DB)
+    db = engine.connect()
+    db.execute("SET search_path TO musicbrainz")
+
+    pages = {}
+    if kind == 'artists':
+        for id, name in db.execute(artists_query, (count,)):
+            if rnd.random() < options.missing_rate:
+                pages[name] = None
+                continue
+            albums = [r[0] for r in db.execute(artist_albums_query, (id,))]
+            pages[name] = artist_page(name, albums, rnd.random() < options.match_rate)
+    else:
+        for id, name, artist in db.execute(rgs_query, (count,)):
+            if rnd.random() < options.missing_rate:
+                pages[name] = None
+                continue
+            tracks = [r[0] for r in db.execute(rg_tracks_query, (id,))]
+            pages[name] = rg_page(name, artist, tracks, rnd.random() < options.match_rate)
+    json.dump({'pages': {'en': pages}}, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
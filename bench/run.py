@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""Run a bot end to end against the stand-in server and report its
+throughput.
+
+    bench/run.py --fixtures artists.json --wp-latency 0.1 wp_links_artists.py en
+
+The bot runs in a scratch directory with its own config.py (the database
+from the real config, everything else pointing to the stand-in), an empty
+wiki-cache and an empty edit queue. It gets --duration seconds to find
+matches, then submit_edits.py gets the same time to submit the queued edits
+under the normal rate limits. For each phase the wall and CPU time of the
+bot process and the requests it made are reported.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import subprocess
+from optparse import OptionParser
+
+from standin import StandIn, start
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo)
+import config as cfg
+from editqueue import EditQueue
+
+# Runs a script from the repository with the scratch directory first on the
+# path, so it picks up the config.py written there
+LAUNCHER = """
+import sys, runpy
+sys.path.insert(1, sys.argv[1])
+sys.argv = sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+
+def write_config(workdir, base):
+    f = open(os.path.join(workdir, 'config.py'), 'w')
+    for name, value in [
+            ('MB_SITE', base),
+            ('MB_USERNAME', 'bench'),
+            ('MB_PASSWORD', 'bench'),
+            ('MB_EDITOR_ID', None),
+            ('MB_DB', cfg.MB_DB),
+            ('WWW_USER_AGENT', None),
+            ('WP_API_URL', base + '/%s/w/api.php'),
+            ('SOLR_URL', base + '/solr/wikipedia%s'),
+            ('TRACE_FILE', 'trace.jsonl')]:
+        f.write('%s = %r\n' % (name, value))
+    f.close()
+
+
+def run_phase(standin, workdir, name, args, duration):
+    # Returns (wall time, user CPU time, system CPU time, request counters)
+    standin.reset_stats()
+    log = open(os.path.join(workdir, name + '.log'), 'w')
+    start_time = time.time()
+    # HOME points to the scratch directory too, so the cookie and rate limit
+    # files of the client don't end up in the real home directory
+    process = subprocess.Popen([sys.executable, '-c', LAUNCHER, repo, os.path.join(repo, args[0])] + args[1:],
+                               cwd=workdir, stdout=log, stderr=subprocess.STDOUT, env=dict(os.environ, HOME=workdir))
+    timer = threading.Timer(duration, lambda: os.kill(process.pid, signal.SIGINT))
+    timer.start()
+    pid, status, rusage = os.wait4(process.pid, 0)
+    timer.cancel()
+    wall = time.time() - start_time
+    log.close()
+    return wall, rusage.ru_utime, rusage.ru_stime, standin.reset_stats()
+
+
+def report(name, wall, utime, stime, stats):
+    print '%s: %.1f s wall, %.1f s user, %.1f s system CPU' % (name, wall, utime, stime)
+    for key in sorted(stats):
+        print '    %-30s %d' % (key, stats[key])
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] <script> [script args]')
+    parser.add_option('--fixtures', help='JSON file with Wikipedia pages, see make_fixtures.py')
+    parser.add_option('--mb-latency', type='float', default=0.0, help='seconds added to MusicBrainz responses')
+    parser.add_option('--wp-latency', type='float', default=0.0, help='seconds added to MediaWiki API responses')
+    parser.add_option('--solr-latency', type='float', default=0.0, help='seconds added to Solr responses')
+    parser.add_option('--page-size', type='int', default=20000, help='size of generated Wikipedia pages')
+    parser.add_option('--wp-lag', type='int', default=0, help='replication lag reported by the MediaWiki API')
+    parser.add_option('--duration', type='int', default=300, help='seconds each phase may run')
+    parser.add_option('--keep', action='store_true', help="don't remove the scratch directory")
+    parser.disable_interspersed_args()
+    options, args = parser.parse_args()
+    if not args:
+        parser.error('no script given')
+
+    fixtures = json.load(open(options.fixtures)) if options.fixtures else None
+    standin = StandIn(fixtures, {'mb': options.mb_latency, 'wp': options.wp_latency, 'solr': options.solr_latency},
+                      options.page_size)
+    standin.lag = options.wp_lag
+    server, base = start(standin)
+
+    workdir = tempfile.mkdtemp(prefix='mbbot-bench-')
+    try:
+        write_config(workdir, base)
+        os.symlink(os.path.join(os.path.abspath(repo), 'Scripts.txt'), os.path.join(workdir, 'Scripts.txt'))
+
+        match = run_phase(standin, workdir, 'match', args, options.duration)
+        report(args[0], *match)
+        queued = sum(EditQueue(os.path.join(workdir, 'edit_queue.db')).counts().values())
+
+        submit = run_phase(standin, workdir, 'submit', ['submit_edits.py', '--once', '--window', '0'], options.duration)
+        report('submit_edits.py', *submit)
+
+        edits = submit[3].get('mb.edits', 0)
+        fetches = match[3].get('wp.titles', 0)
+        print 'queued edits: %d, submitted edits: %d' % (queued, edits)
+        print 'edits per minute: %.1f (matching), %.1f (submitting)' % (
+            queued * 60.0 / match[0], edits * 60.0 / submit[0])
+        if queued:
+            print 'Wikipedia fetches per edit: %.1f, matching CPU per edit: %.3f s' % (
+                fetches * 1.0 / queued, (match[1] + match[2]) / queued)
+    finally:
+        server.shutdown()
+        if options.keep:
+            print 'scratch directory:', workdir
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,503 @@
+#!/usr/bin/env python
+"""Stand-in HTTP server for the services the bots talk to, so their
+throughput can be measured without touching production.
+
+One server answers for all three services:
+
+    MusicBrainz      http://127.0.0.1:<port>/...
+    MediaWiki API    http://127.0.0.1:<port>/<lang>/w/api.php
+    Solr             http://127.0.0.1:<port>/solr/wikipedia<suffix>/select
+
+Wikipedia pages come from a fixtures file (see make_fixtures.py), other
+titles get a generated page that doesn't match anything, and Solr finds such
+titles for every query that doesn't match a page from the fixtures. Titles
+that are null in the fixtures are missing pages, which Solr still finds, like
+pages deleted since the search index was built. Every
+response can be delayed per service to simulate network and server latency.
+GET /_stats returns the request counters as JSON, /_stats?reset=1 also
+resets them.
+"""
+
+import re
+import time
+import json
+import gzip
+import uuid
+import zlib
+import random
+import urllib
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+from StringIO import StringIO
+from optparse import OptionParser
+from xml.sax.saxutils import escape, quoteattr
+
+
+def normalize_title(title):
+    title = title.replace('_', ' ').strip()
+    return title[:1].upper() + title[1:]
+
+
+def title_key(title):
+    # Solr matches the bots' queries against page titles without the
+    # disambiguation suffix, roughly like mangle_name() in utils.py
+    title = re.sub(r' \(.+\)$', '', title)
+    return re.sub(r'\W', '', title.lower(), flags=re.UNICODE)
+
+
+def generated_page(title, size):
+    # Page that looks like an article but doesn't mention anything useful
+    rnd = random.Random(title)
+    words = ['music', 'band', 'record', 'label', 'tour', 'member', 'release', 'chart', 'single', 'studio']
+    text = [u"'''%s''' is a subject of this generated article.\n\n" % (title,)]
+    length = len(text[0])
+    while length < size:
+        sentence = u' '.join(rnd.choice(words) for i in range(12)).capitalize() + u'. '
+        text.append(sentence)
+        length += len(sentence)
+    text.append(u'\n\n[[Category:Generated pages]]\n')
+    return u''.join(text)
+
+
+class StandIn(object):
+    # State shared by all request handlers
+
+    def __init__(self, fixtures=None, latency=None, page_size=20000, solr_rows=2):
+        self.pages = {}
+        self.solr_index = {}
+        for lang, pages in (fixtures or {}).get('pages', {}).items():
+            self.pages[lang] = dict((normalize_title(t), text) for (t, text) in pages.items())
+            index = self.solr_index[lang] = {}
+            for title in self.pages[lang]:
+                index.setdefault(title_key(title), []).append(title)
+        self.latency = {'mb': 0.0, 'wp': 0.0, 'solr': 0.0}
+        self.latency.update(latency or {})
+        self.page_size = page_size
+        self.solr_rows = solr_rows
+        # replication lag reported to MediaWiki API requests with maxlag
+        self.lag = 0
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.sessions = set()
+        self.edits = []
+        self.merge_queues = {}
+        self.relationships = set()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] = self.stats.get(name, 0) + n
+
+    def reset_stats(self):
+        with self.lock:
+            stats, self.stats = self.stats, {}
+        return stats
+
+    def page(self, lang, title):
+        # Returns None for missing pages
+        pages = self.pages.get(lang, {})
+        if title in pages:
+            return pages[title]
+        return generated_page(title, self.page_size)
+
+    def add_edit(self, edit_type, details):
+        with self.lock:
+            edit_id = len(self.edits) + 1
+            self.edits.append((edit_id, edit_type, details))
+            self.stats['mb.edits'] = self.stats.get('mb.edits', 0) + 1
+        return edit_id
+
+
+FORM_CREATE_URL = '''<html><body>%(error)s<form method="POST" action="%(action)s">
+<select name="ar.link_type_id">%(link_types)s</select>
+<input name="ar.url" value="" /><textarea name="ar.edit_note"></textarea>
+<input type="checkbox" name="ar.as_auto_editor" value="1" />
+</form></body></html>'''
+
+FORM_EDIT_ARTIST = '''<html><body><form method="POST" action="%(action)s">
+<select name="edit-artist.country_id"><option value="" selected="selected"></option>%(numbers)s</select>
+<select name="edit-artist.type_id"><option value="" selected="selected"></option>%(numbers)s</select>
+<select name="edit-artist.gender_id"><option value="" selected="selected"></option>%(numbers)s</select>
+<input name="edit-artist.begin_date.year" value="" /><input name="edit-artist.begin_date.month" value="" /><input name="edit-artist.begin_date.day" value="" />
+<input name="edit-artist.end_date.year" value="" /><input name="edit-artist.end_date.month" value="" /><input name="edit-artist.end_date.day" value="" />
+<input name="edit-artist.comment" value="" /><input name="edit-artist.name" value="" /><input name="edit-artist.sort_name" value="" />
+<textarea name="edit-artist.edit_note"></textarea>
+<input type="checkbox" name="edit-artist.as_auto_editor" value="1" />
+</form></body></html>'''
+
+FORM_EDIT_URL = '''<html><body><form method="POST" action="%(action)s">
+<input name="edit-url.url" value=%(url)s /><textarea name="edit-url.edit_note"></textarea>
+<input type="checkbox" name="edit-url.as_auto_editor" value="1" />
+</form></body></html>'''
+
+FORM_EDIT_RELATIONSHIP = '''<html><body><form method="POST" action="%(action)s">
+<select name="ar.link_type_id">%(link_types)s</select>
+<input name="ar.begin_date.year" /><input name="ar.begin_date.month" /><input name="ar.begin_date.day" />
+<input name="ar.end_date.year" /><input name="ar.end_date.month" /><input name="ar.end_date.day" />
+<textarea name="ar.edit_note"></textarea><input type="checkbox" name="ar.as_auto_editor" value="1" />
+</form></body></html>'''
+
+FORM_CONFIRM = '''<html><body><form method="POST" action="%(action)s">
+<textarea name="confirm.edit_note"></textarea>
+</form></body></html>'''
+
+# steps of the release editor, the fields of a step are only on its page
+FORM_RELEASE_STEPS = {
+    'information': '''<select name="script_id"><option value="">-</option>%(numbers)s</select>
+<select name="language_id"><option value="">-</option>%(numbers)s</select>
+<input name="name" value="" /><input name="barcode" value="" /><input type="checkbox" name="barcode_confirm" value="1" />''',
+    'tracklist': '''<select name="mediums.0.format_id"><option value="">-</option>%(numbers)s</select>''',
+    'editnote': '''<textarea name="edit_note"></textarea><input type="checkbox" name="as_auto_editor" value="1" />''',
+}
+
+FORM_RELEASE = '''<html><body><form method="POST" action="%(action)s">%(fields)s
+<input type="submit" name="step_tracklist" value="Tracklist" />
+<input type="submit" name="step_editnote" value="Edit note" />
+<input type="submit" name="save" value="Save" />
+</form></body></html>'''
+
+THANK_YOU = '<p>Thank you, your edit has been entered into the edit queue for peer review.</p>'
+
+NUMBERS = ''.join('<option value="%d">%d</option>' % (i, i) for i in range(1, 300))
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    standin = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.handle_request(self.rfile.read(length))
+
+    def send(self, code, body='', content_type='text/html; charset=utf-8', headers=()):
+        if isinstance(body, unicode):
+            body = body.encode('utf8')
+        gzipped = False
+        if len(body) > 1024 and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6)
+            f.write(body)
+            f.close()
+            body = buf.getvalue()
+            gzipped = True
+        self.send_response(code)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(body)
+        self.standin.count('bytes_sent', len(body))
+
+    def redirect(self, location, code=302, headers=()):
+        self.send(code, '', headers=[('Location', location)] + list(headers))
+
+    def handle_request(self, body):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+        if url.path == '/_stats':
+            stats = self.standin.reset_stats() if query.get('reset') else dict(self.standin.stats)
+            return self.send(200, json.dumps(stats), 'application/json')
+        if url.path.startswith('/solr/'):
+            service = 'solr'
+        elif url.path.endswith('/w/api.php'):
+            service = 'wp'
+        else:
+            service = 'mb'
+        self.standin.count(service + '.requests')
+        if self.standin.latency[service]:
+            time.sleep(self.standin.latency[service])
+        params = dict(query)
+        if body is not None and not url.path.startswith('/ws/'):
+            params.update(urlparse.parse_qsl(body, keep_blank_values=True))
+        getattr(self, 'handle_' + service)(url.path, params, body)
+
+    # Solr
+
+    def handle_solr(self, path, params, body):
+        m = re.match(r'^/solr/wikipedia(?:_([a-z]+))?/select', path)
+        if m is None:
+            return self.send(404, 'no such core')
+        lang = m.group(1) or 'en'
+        q = params.get('q', '').decode('utf8').replace('\\', '')
+        titles = self.standin.solr_index.get(lang, {}).get(title_key(q))
+        if titles is None:
+            titles = [q, u'%s (band)' % (q,), u'%s (album)' % (q,)][:self.standin.solr_rows]
+        titles = titles[:int(params.get('rows', 10))]
+        docs = ''.join('<doc><str name="id">%s</str><str name="name">%s</str></doc>' % (
+            escape(t.replace(' ', '_')), escape(t)) for t in titles)
+        self.send(200, u'<?xml version="1.0" encoding="UTF-8"?>\n<response><lst name="responseHeader">'
+                  u'<int name="status">0</int><int name="QTime">1</int></lst>'
+                  u'<result name="response" numFound="%d" start="0">%s</result></response>' % (len(titles), docs),
+                  'application/xml; charset=utf-8')
+
+    # MediaWiki API
+
+    def handle_wp(self, path, params, body):
+        lang = path.split('/')[1]
+        self.standin.count('wp.' + params.get('action', '') + '.' + (params.get('prop') or params.get('list') or ''))
+        if 'maxlag' in params and self.standin.lag > int(params['maxlag']):
+            self.standin.count('wp.lagged')
+            error = {'code': 'maxlag', 'info': 'Waiting for db1: %d seconds lagged' % (self.standin.lag,)}
+            return self.send(200, json.dumps({'error': error}), 'application/json',
+                             headers=[('Retry-After', '5'), ('X-Database-Lag', str(self.standin.lag))])
+        if params.get('action') != 'query':
+            return self.send(200, json.dumps({'error': {'code': 'unsupported'}}), 'application/json')
+        result = {}
+        if params.get('list') == 'embeddedin':
+            result['embeddedin'] = []
+        if 'titles' in params:
+            self.wp_pages(lang, params, result)
+        self.send(200, json.dumps({'query': result}), 'application/json')
+
+    def wp_pages(self, lang, params, result):
+        titles = params['titles'].decode('utf8').split('|')
+        self.standin.count('wp.titles', len(titles))
+        props = params.get('prop', '').split('|')
+        pages = {}
+        seen = set()
+        missing = 0
+        for title in titles:
+            name = normalize_title(title)
+            if name != title:
+                result.setdefault('normalized', []).append({'from': title, 'to': name})
+            text = self.standin.page(lang, name)
+            if text is not None and 'redirects' in params:
+                m = re.match(r'#REDIRECT\s*\[\[([^\]|#]+)', text, re.I)
+                if m is not None:
+                    target = normalize_title(m.group(1))
+                    result.setdefault('redirects', []).append({'from': name, 'to': target})
+                    name, text = target, self.standin.page(lang, target)
+            # each page is listed once, however many titles lead to it
+            if name in seen:
+                continue
+            seen.add(name)
+            if text is None:
+                missing += 1
+                pages[str(-missing)] = {'ns': 0, 'title': name, 'missing': ''}
+                continue
+            pageid = zlib.crc32(name.encode('utf8')) & 0x7fffffff
+            revid = zlib.crc32(text.encode('utf8')) & 0x7fffffff
+            page = {'pageid': pageid, 'ns': 0, 'title': name}
+            if 'info' in props:
+                page['lastrevid'] = revid
+                page['touched'] = '2012-01-01T00:00:00Z'
+                page['length'] = len(text)
+            if 'revisions' in props:
+                page['revisions'] = [{'revid': revid, '*': text}]
+            pages[str(pageid)] = page
+        result['pages'] = pages
+
+    # MusicBrainz
+
+    def session(self):
+        for part in self.headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'musicbrainz_server_session' and value in self.standin.sessions:
+                return value
+        return None
+
+    def base(self):
+        return 'http://%s' % (self.headers['Host'],)
+
+    def handle_mb(self, path, params, body):
+        standin = self.standin
+        base = self.base()
+        if path == '/login':
+            if body is None:
+                return self.send(200, '<html><body><form method="POST" action="/login">'
+                                 '<input name="username" /><input type="password" name="password" /></form></body></html>')
+            session = uuid.uuid4().hex
+            with standin.lock:
+                standin.sessions.add(session)
+            standin.count('mb.logins')
+            return self.redirect(base + '/user/' + params['username'],
+                                 headers=[('Set-Cookie', 'musicbrainz_server_session=%s; Path=/' % (session,))])
+        if path.startswith('/ws/2/'):
+            return self.handle_ws(path, params, body)
+        if path == '/':
+            return self.send(200, '<html><body>MusicBrainz stand-in</body></html>')
+        if path == '/search/edits':
+            return self.edit_list(params, standin.edits)
+        m = re.match(r'^/user/([^/]+)(/edits(/open)?)?$', path)
+        if m is not None:
+            if m.group(2):
+                return self.edit_list(params, standin.edits)
+            return self.send(200, '<html><body>%s</body></html>' % (escape(m.group(1)),))
+        if self.session() is None:
+            return self.redirect(base + '/login?uri=' + urllib.quote(self.path))
+
+        if path == '/edit/relationship/create_url':
+            return self.create_url(params, body)
+        m = re.match(r'^/(artist|label|release-group|release|recording|work|url)/([0-9a-f-]{36})$', path)
+        if m is not None:
+            return self.send(200, '<html><body>%s<h1>%s</h1></body></html>' % (THANK_YOU, m.group(2)))
+        m = re.match(r'^/artist/([0-9a-f-]{36})/edit$', path)
+        if m is not None:
+            if body is None:
+                return self.send(200, FORM_EDIT_ARTIST % {'action': self.path, 'numbers': NUMBERS})
+            standin.add_edit('Edit artist', m.group(1))
+            return self.redirect(base + '/artist/' + m.group(1), 303)
+        if path == '/artist/create':
+            if body is None:
+                return self.send(200, FORM_EDIT_ARTIST % {'action': self.path, 'numbers': NUMBERS})
+            gid = str(uuid.uuid4())
+            standin.add_edit('Add artist', gid)
+            return self.redirect(base + '/artist/' + gid, 303)
+        m = re.match(r'^/url/([0-9a-f-]{36})/edit$', path)
+        if m is not None:
+            if body is None:
+                return self.send(200, FORM_EDIT_URL % {'action': self.path, 'url': quoteattr('http://example.com/%s' % m.group(1))})
+            standin.add_edit('Edit URL', m.group(1))
+            return self.redirect(base + '/url/' + m.group(1), 303)
+        if path == '/edit/relationship/edit':
+            if body is None:
+                return self.send(200, FORM_EDIT_RELATIONSHIP % {'action': self.path, 'link_types': NUMBERS})
+            standin.add_edit('Edit relationship', params.get('id', ''))
+            return self.redirect(base + '/', 303)
+        if path == '/edit/relationship/delete':
+            if body is None:
+                return self.send(200, FORM_CONFIRM % {'action': self.path})
+            standin.add_edit('Remove relationship', params.get('id', ''))
+            return self.redirect(base + '/', 303)
+        if path == '/release/add' or re.match(r'^/release/[0-9a-f-]{36}/edit$', path):
+            return self.release_editor(path, params, body)
+        if path == '/edit/enter_votes':
+            standin.count('mb.edit_notes', len([k for k in params if k.endswith('.edit_note')]))
+            return self.redirect(params.get('url', base + '/'))
+        m = re.match(r'^/edit/([0-9]+)/cancel$', path)
+        if m is not None:
+            if body is None:
+                return self.send(200, FORM_CONFIRM % {'action': self.path})
+            standin.count('mb.cancelled')
+            return self.redirect(base + '/edit/' + m.group(1), 303)
+        m = re.match(r'^/([a-z-]+)/merge(_queue)?$', path)
+        if m is not None:
+            return self.merge(m.group(1), bool(m.group(2)), params)
+        self.send(404, 'not found')
+
+    def edit_list(self, params, edits):
+        # newest first, 10 edits per page
+        page_no = int(params.get('page', '1') or '1')
+        edits = list(reversed(edits))
+        shown = edits[(page_no - 1) * 10:page_no * 10]
+        html = ['<html><body><p>Found %d edits</p>' % (len(edits),)]
+        for edit_id, edit_type, details in shown:
+            html.append('<div class="edit-list"><h2><a href="%s/edit/%d">%s</a></h2>'
+                        '<div class="edit-details">%s</div></div>' % (self.base(), edit_id, edit_type, escape(details)))
+        html.append('</body></html>')
+        self.send(200, ''.join(html))
+
+    def create_url(self, params, body):
+        entity_type = params.get('type', 'artist')
+        link_types = ''.join('<option value="%d">%d</option>' % (i, i) for i in range(1, 400))
+        if body is None:
+            return self.send(200, FORM_CREATE_URL % {'action': quoteattr(self.path)[1:-1], 'link_types': link_types, 'error': ''})
+        key = (params.get('entity'), params.get('ar.link_type_id'), params.get('ar.url'))
+        with self.standin.lock:
+            exists = key in self.standin.relationships
+            self.standin.relationships.add(key)
+        if exists:
+            return self.send(200, FORM_CREATE_URL % {'action': quoteattr(self.path)[1:-1], 'link_types': link_types,
+                                                     'error': '<p>A relationship between these entities already exists.</p>'})
+        self.standin.add_edit('Add relationship', '%s %s' % (params.get('entity'), params.get('ar.url')))
+        self.redirect('%s/%s/%s' % (self.base(), entity_type.replace('_', '-'), params.get('entity')), 303)
+
+    def release_editor(self, path, params, body):
+        if body is not None and 'save' in params:
+            gid = path.split('/')[2] if path != '/release/add' else str(uuid.uuid4())
+            self.standin.add_edit('Edit release' if path != '/release/add' else 'Add release', gid)
+            return self.redirect('%s/release/%s' % (self.base(), gid), 303)
+        if body is None or path == '/release/add' and 'step_editnote' not in params:
+            step = 'information'
+        elif 'step_tracklist' in params:
+            step = 'tracklist'
+        else:
+            step = 'editnote'
+        fields = FORM_RELEASE_STEPS[step] % {'numbers': NUMBERS}
+        self.send(200, FORM_RELEASE % {'action': self.path, 'fields': fields})
+
+    def merge(self, entity_type, add, params):
+        session = self.session()
+        with self.standin.lock:
+            queue = self.standin.merge_queues.setdefault(session, [])
+            if add:
+                queue.extend(v for (k, v) in params.items() if k == 'add-to-merge')
+            elif params.get('submit') == 'cancel':
+                del queue[:]
+        if add:
+            return self.send(200, '<html><body>You are about to merge</body></html>')
+        if params.get('submit') == 'cancel':
+            return self.redirect(self.base() + '/')
+        target = params.get('merge.target', '')
+        self.standin.add_edit('Merge', target)
+        with self.standin.lock:
+            self.standin.merge_queues.pop(session, None)
+        self.redirect('%s/%s/%s' % (self.base(), entity_type, target), 303)
+
+    def handle_ws(self, path, params, body):
+        if not self.headers.get('Authorization', '').startswith('Digest '):
+            return self.send(401, 'authentication required', headers=[
+                ('WWW-Authenticate', 'Digest realm="musicbrainz.org", nonce="%s", qop="auth"' % (uuid.uuid4().hex,))])
+        if body is None:
+            return self.send(405, 'POST only')
+        # the edit list shows the entities and the submitted values
+        details = ' '.join(a or b for (a, b) in re.findall(r'id="([^"]*)"|<barcode>([^<]*)</barcode>', body))
+        self.standin.add_edit('Add ISRCs' if '/recording/' in path else 'Edit barcodes', details)
+        self.send(200, '<?xml version="1.0" encoding="UTF-8"?><metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#">'
+                  '<message><text>OK</text></message></metadata>', 'application/xml; charset=utf-8')
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start(standin, port=0, host='127.0.0.1'):
+    """Start the server in a background thread, returns (server, base URL)."""
+    class handler(Handler):
+        pass
+    handler.standin = standin
+    server = Server((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://%s:%d' % (host, server.server_address[1])
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--port', type='int', default=8099)
+    parser.add_option('--fixtures', help='JSON file with Wikipedia pages, see make_fixtures.py')
+    parser.add_option('--mb-latency', type='float', default=0.0, help='seconds added to MusicBrainz responses')
+    parser.add_option('--wp-latency', type='float', default=0.0, help='seconds added to MediaWiki API responses')
+    parser.add_option('--solr-latency', type='float', default=0.0, help='seconds added to Solr responses')
+    parser.add_option('--page-size', type='int', default=20000, help='size of generated Wikipedia pages')
+    parser.add_option('--wp-lag', type='int', default=0, help='replication lag reported by the MediaWiki API')
+    options, args = parser.parse_args()
+    fixtures = json.load(open(options.fixtures)) if options.fixtures else None
+    standin = StandIn(fixtures, {'mb': options.mb_latency, 'wp': options.wp_latency, 'solr': options.solr_latency},
+                      options.page_size)
+    standin.lag = options.wp_lag
+    server, base = start(standin, options.port)
+    print 'MB_SITE = %r' % (base,)
+    print 'WP_API_URL = %r' % (base + '/%s/w/api.php',)
+    print 'SOLR_URL = %r' % (base + '/solr/wikipedia%s',)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import urllib
 import re
 from HTMLParser import HTMLParser
 
 from utils import extract_mbid
+from mbbot.utils import transport
 
 def discogs_links(entity):
     return wiki_get_rows('http://wiki.musicbrainz.org/Bots/Blacklist/Discogs_Links', entity)
@@ -49,7 +49,7 @@ def entity_name(gid, db, table, name_table):
     return db.execute(query, gid).fetchone()
 
 def wiki_get_rows(url, entity):
-    f = urllib.urlopen(url)
+    f = transport.urlopen(url)
     parser = LinkTableParser(entity)
     parser.feed(f.read())
     return parser.result()
@@ -1,30 +1,109 @@
 # -*- coding: utf-8 -*-
 import re
 import sys
+import codecs
 import locale
-from editing import MusicBrainzClient
+from collections import deque
+from optparse import OptionParser
+from editing import MusicBrainzClient, MusicBrainzClientPool
 from mbbot.utils.pidfile import PIDFile
+from mbbot.utils.errors import error_text
 from utils import out
 import config as cfg
 
-def main(args):
+def parse_edit(arg):
+    # Returns tuple (edit_nr, edit_note) or None if arg is not an edit number
+    if not isinstance(arg, unicode):
+        arg = unicode(arg, locale.getpreferredencoding())
+    m = re.match(ur'(?:[Ee]dit )?#?([0-9]+) ?(.*)$', arg)
+    if not m:
+        return None
+    return str(m.group(1)), m.group(2).lstrip()
+
+def read_progress(path):
+    # Edit numbers cancelled by previous runs, the progress log has one
+    # "<edit_nr>\t<status>" line per edit
+    cancelled = set()
+    try:
+        for line in codecs.open(path, 'r', 'utf-8'):
+            edit_nr, status = line.rstrip('\n').split('\t', 1)
+            if status == 'cancelled':
+                cancelled.add(edit_nr)
+    except IOError:
+        pass
+    return cancelled
+
+def bulk_cancel(lines, options):
+    seen = read_progress(options.progress)
+    if seen:
+        out('%d edits already cancelled according to %s' % (len(seen), options.progress))
+    progress = codecs.open(options.progress, 'a', 'utf-8')
+    pool = MusicBrainzClientPool(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE, size=options.sessions)
+    counts = {'cancelled': 0, 'failed': 0}
+
+    def finish(edit_nr, future):
+        e = future.exception()
+        if e is None and future.result():
+            status = 'cancelled'
+        else:
+            status = u'failed: %s' % (error_text(e) if e else u'not cancelled',)
+        counts[status.split(':')[0]] += 1
+        out(u'Cancel edit #%s: %s' % (edit_nr, status))
+        progress.write(u'%s\t%s\n' % (edit_nr, status.replace(u'\n', u' ')))
+        progress.flush()
+
+    # The worker queue is bounded, so edit numbers are only read as fast as
+    # they can be cancelled
+    pending = deque()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        edit = parse_edit(line)
+        if edit is None:
+            out('invalid edit number "%s", skipping' % line)
+            continue
+        edit_nr, edit_note = edit
+        if edit_nr in seen:
+            continue
+        seen.add(edit_nr)
+        pending.append((edit_nr, pool.submit('cancel_edit', edit_nr, edit_note or options.note)))
+        while pending and pending[0][1].done():
+            finish(*pending.popleft())
+    while pending:
+        finish(*pending.popleft())
+    pool.close()
+    progress.close()
+    out('cancelled %d edits, %d failed' % (counts['cancelled'], counts['failed']))
+
+def main():
+    parser = OptionParser(usage='%prog [options] <edit_number edit_note>...')
+    parser.add_option('--bulk', metavar='FILE', help='read edit numbers from FILE, one per line, or from stdin if FILE is -')
+    parser.add_option('--sessions', type='int', default=4, help='number of sessions used in bulk mode')
+    parser.add_option('--progress', default='cancel_edits.progress', help='log of cancelled edits, used to resume in bulk mode')
+    parser.add_option('--note', default=u'', help='edit note for edits without one in bulk mode')
+    options, args = parser.parse_args()
+    if options.note and not isinstance(options.note, unicode):
+        options.note = unicode(options.note, locale.getpreferredencoding())
+
+    if options.bulk:
+        bulk_cancel(sys.stdin if options.bulk == '-' else open(options.bulk), options)
+        return
+
     if not args:
         out('Usage:   cancel_edits.py <edit_number edit_note>...\n')
         out('Example: cancel_edits.py "Edit #123 my mistake"')
         out('         cancel_edits.py 123 124 125')
+        out('         cancel_edits.py --bulk edits.txt --note "my mistake"')
         return
 
     edits = []
     for arg in args:
-        if not isinstance(arg, unicode):
-            arg = unicode(arg, locale.getpreferredencoding())
-        m = re.match(ur'(?:[Ee]dit )?#?([0-9]+) ?(.*)$', arg)
-        if not m:
+        edit = parse_edit(arg)
+        if edit is None:
             out('invalid edit number "%s", aborting!' % arg)
             return
-        edit_nr = str(m.group(1))
-        edit_note = m.group(2).lstrip()
-        edits.append((edit_nr, edit_note))
+        edits.append(edit)
 
     mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
     for edit_nr, edit_note in edits:
@@ -33,4 +112,4 @@ def main(args):
 
 if __name__ == '__main__':
     with PIDFile('/tmp/mbbot_cancel_edits.pid'):
-        main(sys.argv[1:])
+        main()
@@ -6,7 +6,8 @@ from collections import defaultdict
 import itertools
 import sqlalchemy
 import discogs_client as discogs
-from editing import MusicBrainzClient
+from editqueue import EditQueue
+from mbbot.utils import trace
 import Levenshtein
 import config as cfg
 
@@ -14,7 +15,7 @@ engine = sqlalchemy.create_engine(cfg.MB_DB)
 db = engine.connect()
 db.execute('SET search_path TO musicbrainz')
 
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 discogs.user_agent = 'MusicBrainzDiscogsReleaseGroupsBot/0.1 +https://github.com/weisslj/musicbrainz-bot'
 
@@ -62,10 +63,15 @@ def discogs_get_master(release_urls):
         m = re.match(r'http://www.discogs.com/release/([0-9]+)', release_url)
         if m:
             release_id = int(m.group(1))
-            release = discogs.Release(release_id)
-            master = release.master
+            # discogs_client loads the data lazily with requests, which
+            # doesn't go through mbbot.utils.transport, so time it here
+            with trace.span('api.discogs.com/release/:id'):
+                release = discogs.Release(release_id)
+                master = release.master
             if master:
-                yield (master.title, master._id, discogs_artists_str(master.artists))
+                with trace.span('api.discogs.com/master/:id'):
+                    master_info = (master.title, master._id, discogs_artists_str(master.artists))
+                yield master_info
 
 def out(t):
     print t.encode(locale.getpreferredencoding())
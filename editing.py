@@ -1,10 +1,22 @@
 import mechanize
+import socket
+import httplib
 import urllib
+import urllib2
+import urlparse
 import time
 import re
+import os
+import threading
 from datetime import datetime
+from functools import wraps
+from xml.sax.saxutils import escape, quoteattr
 from utils import extract_mbid
 from mbbot.guesscase import guess_artist_sort_name
+from mbbot.utils.workers import WorkerPool
+from mbbot.utils.ratelimit import RateLimiter
+from mbbot.utils import transport
+import config as cfg
 
 try:
     from mechanize import ControlNotFoundError
@@ -47,18 +59,332 @@ def album_to_form(album):
     return form
 
 
+class SessionExpired(Exception):
+    pass
+
+
+class EditError(Exception):
+    # The server didn't accept an edit or its response can't be understood
+    pass
+
+
+class EditQuota(object):
+    # Number of edits made today and open edits, scraped from the website only
+    # every resync_interval seconds (and after midnight UTC) and counted
+    # locally for each edit submitted in between
+
+    def __init__(self, resync_interval=3600):
+        self.resync_interval = resync_interval
+        self.lock = threading.Lock()
+        self.sync_time = None
+        self.sync_day = None
+        self.edits_today = 0
+        self.open_edits = 0
+
+    def needs_sync(self):
+        if self.sync_time is None:
+            return True
+        if datetime.utcnow().date() != self.sync_day:
+            return True
+        return time.time() - self.sync_time > self.resync_interval
+
+    def sync(self, edits_today, open_edits):
+        with self.lock:
+            self.sync_time = time.time()
+            self.sync_day = datetime.utcnow().date()
+            self.edits_today = edits_today
+            self.open_edits = open_edits
+
+    def count_edit(self, auto=False):
+        with self.lock:
+            self.edits_today += 1
+            if not auto:
+                self.open_edits += 1
+
+    def left(self, max_open_edits, max_edits_per_day):
+        edits_left = max_edits_per_day - self.edits_today
+        if edits_left <= 0:
+            return 0, 0
+        normal_edits_left = min(edits_left, max_open_edits - self.open_edits)
+        return normal_edits_left, edits_left
+
+
+def with_session(func):
+    # Mark a request method of the client. The method name is used as the edit
+    # type for rate limiting. The client logs in on the first request the
+    # method makes (so not at all if the edit is skipped before that), and if
+    # the server says the session has expired, logs in again and repeats only
+    # that request, not the requests of the method that already went through.
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.edit_type is not None:
+            return func(self, *args, **kwargs)
+        self.edit_type = func.__name__
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self.edit_type = None
+            self.release_response()
+    return wrapper
+
+
+# LWPCookieJar.save() rewrites the whole file, so don't let two clients in
+# the same process do it at the same time
+_cookie_file_lock = threading.Lock()
+
+
+# Minimum number of seconds between requests and how many requests can be
+# made in a burst. '*' applies to all requests to the server, the other keys
+# to POST requests made by the MusicBrainzClient method of that name. The
+# budget is per server and shared by all bot processes of the user. Entries
+# of MB_RATE_LIMITS in config.py replace these.
+DEFAULT_RATE_LIMITS = {
+    '*': (1.0, 3),
+    'add_url': (60.0, 1),
+    'edit_artist': (10.0, 1),
+    'set_artist_type': (10.0, 1),
+    'set_release_medium_format': (5.0, 1),
+}
+
+
+# Vote sent with edit notes on the vote form, votes on one's own edits are
+# ignored but the form needs one for each edit
+VOTE_ABSTAIN = -1
+
+# Maximum number of entities in one web service submission
+WS_BATCH_SIZE = 100
+
+
+def _edit_succeeded(location, page):
+    # MusicBrainz redirects to the entity page after an edit was entered, the
+    # flash message is only checked if we ended up with a page
+    return location is not None or "Thank you, your edit has been" in page
+
+
+def _log_dropped(field, reason, sources):
+    # A field left out of an edit, with the edit note of the change that
+    # asked for it if known
+    message = u" * %s %s, not changing" % (field, reason)
+    source = (sources or {}).get(field)
+    if source:
+        message += u" (queued with: %s)" % (source.splitlines()[0],)
+    print message.encode('utf8')
+
+
+def _same_url(url1, url2):
+    # compare URLs ignoring the order of query parameters
+    parts1 = urlparse.urlparse(url1)
+    parts2 = urlparse.urlparse(url2)
+    return (parts1[:3] == parts2[:3] and
+            sorted(urlparse.parse_qsl(parts1.query)) == sorted(urlparse.parse_qsl(parts2.query)))
+
+
+class FormSchema(object):
+    # Field names, hidden field values and select options of an edit form, as
+    # seen when the form was last downloaded from form_url
+
+    def __init__(self, form, form_url):
+        self.form_url = form_url
+        self.posts_to_self = _same_url(form.action, form_url)
+        self.fields = set()
+        self.hidden = []
+        self.options = {}
+        for control in form.controls:
+            if control.name is None:
+                continue
+            self.fields.add(control.name)
+            if control.type == 'hidden':
+                self.hidden.append((control.name, control.value))
+            elif control.type in ('select', 'radio', 'checkbox'):
+                self.options[control.name] = set(item.name for item in control.items)
+        # hidden fields might carry per-entity or per-load values, so a
+        # schema with hidden fields is only trusted after it was seen twice
+        # with the same values at the same form URL, and only used for that
+        # URL
+        self.stable = not self.hidden
+
+    def can_post(self, values, form_url):
+        if not self.stable or not self.posts_to_self:
+            return False
+        if self.hidden and not _same_url(form_url, self.form_url):
+            return False
+        for name, value in values:
+            if name not in self.fields:
+                return False
+            if name in self.options:
+                if not set(value) <= self.options[name]:
+                    return False
+        return True
+
+    def encode(self, values):
+        params = list(self.hidden)
+        for name, value in values:
+            if isinstance(value, list):
+                params.extend((name, v) for v in value)
+            else:
+                params.append((name, value))
+        return urllib.urlencode(params)
+
+
+class FormSchemaCache(object):
+    # The last seen form schema of each endpoint, shared by all clients in the
+    # process
+
+    def __init__(self):
+        self.schemas = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.schemas.get(key)
+
+    def learn(self, key, form, form_url):
+        schema = FormSchema(form, form_url)
+        with self.lock:
+            old_schema = self.schemas.get(key)
+            if (old_schema is not None and old_schema.hidden == schema.hidden and
+                    _same_url(old_schema.form_url, form_url)):
+                schema.stable = True
+            self.schemas[key] = schema
+
+    def forget(self, key):
+        with self.lock:
+            self.schemas.pop(key, None)
+
+
+form_schemas = FormSchemaCache()
+
+
+def default_rate_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    limits.update(getattr(cfg, 'MB_RATE_LIMITS', None) or {})
+    return limits
+
+
+def default_rate_limit_file(server):
+    host = urlparse.urlparse(server).netloc.replace(':', '_')
+    return os.path.expanduser('~/.mbbot-ratelimit-%s.json' % (host,))
+
+
+def default_cookie_file(server, username):
+    host = urlparse.urlparse(server).netloc.replace(':', '_')
+    return os.path.expanduser('~/.mbbot-cookies-%s-%s' % (host, username))
+
+
+def parse_edit_list(page):
+    # Returns list of (edit_nr, details_html) of the edits on a page of an
+    # edit list. The page is cut into one chunk per edit at the edit headings,
+    # so each edit is only looked at once.
+    edits = []
+    chunks = page.split('<h2><a href="')
+    for chunk in chunks[1:]:
+        m = re.match(r'[^"]*/edit/([0-9]+)"', chunk)
+        if m is None:
+            continue
+        details = ''
+        start = chunk.find('<div class="edit-details">')
+        if start != -1:
+            start += len('<div class="edit-details">')
+            end = chunk.find('</div>', start)
+            details = chunk[start:end] if end != -1 else chunk[start:]
+        edits.append((m.group(1), details))
+    return edits
+
+
+class EditIndex(object):
+    # Details of the recent edits of an editor by edit number. The index
+    # covers the edit list from the newest edit down to the oldest indexed
+    # one, which is depth edits deep, so to find an edit only the pages with
+    # new edits and the pages after the indexed ones need to be loaded.
+
+    def __init__(self, size=1000, max_pages=5):
+        self.size = size
+        self.max_pages = max_pages
+        self.edits = {}
+        self.depth = 0
+        self.page_size = None
+
+    def _add(self, edits):
+        new = [(edit_nr, details) for (edit_nr, details) in edits if int(edit_nr) not in self.edits]
+        for edit_nr, details in new:
+            self.edits[int(edit_nr)] = details
+        self.depth += len(new)
+        if len(self.edits) > self.size:
+            for edit_id in sorted(self.edits)[:len(self.edits) - self.size]:
+                del self.edits[edit_id]
+        return new
+
+    def knows(self, edits):
+        return any(int(edit_nr) in self.edits for (edit_nr, details) in edits)
+
+    def add_new(self, pages):
+        # Add the first pages of the edit list. If they didn't reach the
+        # indexed edits, there might be a gap, so the old ones are dropped.
+        if pages[0]:
+            self.page_size = len(pages[0])
+        if not self.knows(pages[-1]):
+            self.edits = {}
+            self.depth = 0
+        for edits in pages:
+            self._add(edits)
+
+    def add_old(self, edits):
+        # Add a page after the indexed edits, returns the new edits
+        return self._add(edits)
+
+    def next_page(self):
+        return self.depth // self.page_size + 1
+
+    def find(self, identify):
+        for edit_id in sorted(self.edits, reverse=True):
+            if identify(str(edit_id), self.edits[edit_id]):
+                return edit_id
+        return None
+
+    def find_all(self, identify):
+        return [edit_id for edit_id in sorted(self.edits, reverse=True) if identify(str(edit_id), self.edits[edit_id])]
+
+
 class MusicBrainzClient(object):
 
-    def __init__(self, username, password, server="http://musicbrainz.org", editor_id=None):
+    def __init__(self, username, password, server="http://musicbrainz.org", editor_id=None, cookie_file=None, in_flight=None, rate_limits=None, rate_limit_file=None, quota=None, history_size=0, precheck=None):
         self.server = server
         self.username = username
+        self.password = password
         self.editor_id = editor_id
-        self.b = mechanize.Browser()
+        self.cookie_file = cookie_file or default_cookie_file(server, username)
+        # semaphore shared by all clients of a MusicBrainzClientPool
+        self.in_flight = in_flight or threading.BoundedSemaphore(1)
+        self.rate_limiter = RateLimiter(rate_limit_file or default_rate_limit_file(server),
+                                        default_rate_limits() if rate_limits is None else rate_limits)
+        self.edit_type = None
+        self.quota = quota or EditQuota()
+        self.form_schemas = form_schemas
+        # optional mbbot.precheck.EditPrecheck
+        self.precheck = precheck
+        self.ws_opener = None
+        self.edit_index = EditIndex()
+        # the merge queue is kept in the session on the server, it might
+        # still have entities from a merge that failed or a previous run
+        self.merge_queue_dirty = True
+        self.cj = mechanize.LWPCookieJar(self.cookie_file)
+        # history_size=None keeps mechanize's unbounded history, otherwise
+        # only that many pages are kept and the last response is released
+        # after each request method
+        self.history_size = history_size
+        if history_size is None:
+            self.b = mechanize.Browser()
+        else:
+            self.b = mechanize.Browser(history=BoundedHistory(history_size))
+        self.b.set_cookiejar(self.cj)
         self.b.set_handle_robots(False)
         self.b.set_debug_redirects(False)
         self.b.set_debug_http(False)
+        # requests go over the keep-alive connections shared with the other
+        # clients (see mbbot.utils.transport), instead of a new connection
+        # for each page
+        self.b.add_handler(transport.KeepAliveHandler())
         self.b.addheaders = [('User-agent', 'musicbrainz-bot/1.0 ( %s/user/%s )' % (server, username))]
-        self.login(username, password)
+        self.logged_in = self._load_cookies()
 
     def url(self, path, **kwargs):
         query = ''
@@ -66,21 +392,185 @@ class MusicBrainzClient(object):
             query = '?' + urllib.urlencode([(k, v.encode('utf8')) for (k, v) in kwargs.items()])
         return self.server + path + query
 
+    def _load_cookies(self):
+        # Reuse the session saved by a previous run, it will be verified on
+        # the first real request
+        if not os.path.exists(self.cookie_file):
+            return False
+        try:
+            self.cj.load(ignore_discard=True, ignore_expires=True)
+        except (IOError, mechanize.LoadError):
+            return False
+        host = urlparse.urlparse(self.server).hostname
+        return any(c.domain.lstrip('.') == host for c in self.cj)
+
+    def _save_cookies(self):
+        with _cookie_file_lock:
+            self.cj.save(ignore_discard=True, ignore_expires=True)
+            os.chmod(self.cookie_file, 0600)
+
+    def release_response(self):
+        # Drop the last page and the forms parsed from it
+        if self.history_size is not None:
+            self.b.set_response(None)
+
+    def ensure_session(self):
+        if not self.logged_in:
+            self.login(self.username, self.password)
+
     def login(self, username, password):
+        self.cj.clear()
+        self.rate_limiter.acquire('*')
         self.b.open(self.url("/login"))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/login" in f.action)
         self.b["username"] = username
         self.b["password"] = password
+        self.rate_limiter.acquire('*')
         self.b.submit()
         resp = self.b.response()
         if resp.geturl() != self.url("/user/" + username):
             raise Exception('unable to login')
+        self.logged_in = True
+        self._save_cookies()
+
+    def _session_expired(self, url, request, attempt):
+        # MusicBrainz redirects to the login page without processing the
+        # request when the session cookie is no longer valid. Returns whether
+        # the request should be sent again after logging in.
+        if urlparse.urlparse(url).path != '/login':
+            return False
+        self.logged_in = False
+        if attempt > 0:
+            raise SessionExpired()
+        print " * session expired, logging in again"
+        self.login(self.username, self.password)
+        # the request still has the cookie of the old session
+        request.headers.pop('Cookie', None)
+        request.unredirected_hdrs.pop('Cookie', None)
+        return True
+
+    def _throttle(self, post):
+        # Every request counts against the server budget, POSTs also against
+        # the budget of the edit type
+        if post:
+            self.rate_limiter.acquire('*', self.edit_type)
+        else:
+            self.rate_limiter.acquire('*')
+
+    def _send(self, request):
+        # Open a mechanize.Request, following redirects
+        for attempt in range(2):
+            self.ensure_session()
+            self._throttle(request.has_data())
+            with self.in_flight:
+                resp = self.b.open(request)
+            if not self._session_expired(self.b.geturl(), request, attempt):
+                return resp
+
+    def _open(self, url, data=None):
+        return self._send(mechanize.Request(url, data))
+
+    def _submit(self, *args, **kwargs):
+        # the request is made from the form first, the form is gone if the
+        # request has to be sent again after logging in
+        return self._send(self.b.click(*args, **kwargs))
+
+    def _request_edit(self, request):
+        # Make a POST request without following the redirect that MusicBrainz
+        # sends after a successful edit, there is no need to download the
+        # entity page just to find the "Thank you" message on it. Returns
+        # tuple (location, page), only one of which is set. The redirect is
+        # only followed if it leads back to the page that was posted to, as
+        # that's how errors are reported in a flash message.
+        for attempt in range(2):
+            self.ensure_session()
+            self._throttle(True)
+            self.b.set_handle_redirect(False)
+            try:
+                with self.in_flight:
+                    self.b.open(request)
+                return None, self.b.response().read()
+            except mechanize.HTTPError, e:
+                if e.code not in (301, 302, 303, 307):
+                    raise
+                posted_url = e.geturl()
+                location = urlparse.urljoin(posted_url, e.info()['Location'])
+            finally:
+                self.b.set_handle_redirect(True)
+            if not self._session_expired(location, request, attempt):
+                break
+        if _same_url(location, posted_url):
+            self._open(location)
+            return None, self.b.response().read()
+        return location, None
+
+    def _post_edit(self, url, data):
+        return self._request_edit(mechanize.Request(url, data))
+
+    def _submit_edit(self, *args, **kwargs):
+        return self._request_edit(self.b.click(*args, **kwargs))
+
+    def _post_form(self, key, form_url, predicate, values, optional=(), expect=(), exists=None):
+        # Submit values to the form at form_url. If the schema of the form is
+        # already known, the values are POSTed directly without downloading
+        # the form first. Optional controls are left out if the form doesn't
+        # have them. Returns tuple (location, page) like _request_edit.
+        #
+        # If a direct POST neither redirects nor returns a page with one of
+        # the expected markers, the edit might have been entered anyway, so
+        # it is only submitted again through the form if exists() says it
+        # wasn't. exists() returns the URL of the edit or None, without it
+        # the edit is never sent twice.
+        schema = self.form_schemas.get(key)
+        if schema is not None:
+            direct_values = [(n, v) for (n, v) in values if n not in optional or n in schema.fields]
+            if schema.can_post(direct_values, form_url):
+                location, page = self._post_edit(form_url, schema.encode(direct_values))
+                if location is not None or any(marker in page for marker in expect):
+                    return location, page
+                self.form_schemas.forget(key)
+                if exists is None:
+                    raise EditError('unexpected response to %s, not sending the edit again' % (form_url,))
+                location = exists()
+                if location is not None:
+                    return location, None
+        self._open(form_url)
+        self.b.select_form(predicate=predicate)
+        self.form_schemas.learn(key, self.b.form, form_url)
+        for name, value in values:
+            try:
+                self.b[name] = value
+            except ControlNotFoundError:
+                if name not in optional:
+                    raise
+        return self._submit_edit()
+
+    def _skip_edit(self, check, *args):
+        # Ask the database whether the edit can still succeed before going to
+        # the server for the edit form
+        if self.precheck is None:
+            return False
+        reason = getattr(self.precheck, check)(*args)
+        if reason is None:
+            return False
+        print " * %s, not changing" % (reason,)
+        return True
 
     # return tuple (normal_edits_left, edits_left)
     def edits_left(self, max_open_edits=2000, max_edits_per_day=1000):
         if self.editor_id is None:
             print 'error, pass editor_id to constructor for edits_left()'
             return 0, 0
+        if self.quota.needs_sync():
+            counts = self._fetch_edit_counts()
+            if counts is None:
+                return 0, 0
+            self.quota.sync(*counts)
+        return self.quota.left(max_open_edits, max_edits_per_day)
+
+    # return tuple (edits_today, open_edits) as shown on the website
+    @with_session
+    def _fetch_edit_counts(self):
         re_found_edits = re.compile(r'Found (?:at least )?([0-9]+(?:,[0-9]+)?) edits')
         today = datetime.utcnow().strftime('%Y-%m-%d')
         kwargs = {
@@ -97,126 +587,157 @@ class MusicBrainzClient(object):
                 'conditions.1.args.0': str(self.editor_id)
         }
         url = self.url("/search/edits", **kwargs)
-        self.b.open(url)
+        self._open(url)
         page = self.b.response().read()
         m = re_found_edits.search(page)
         if not m:
             print 'error, could not determine remaining daily edits'
-            return 0, 0
+            return None
         edits_today = int(re.sub(r'[^0-9]+', '', m.group(1)))
-        edits_left = max_edits_per_day - edits_today
-        if edits_left <= 0:
-            return 0, 0
         url = self.url("/user/%s/edits/open" % (self.username,), page='2000')
-        self.b.open(url)
+        self._open(url)
         page = self.b.response().read()
         m = re_found_edits.search(page)
         if not m:
             print 'error, could not determine open edits'
-            return 0, 0
+            return None
         open_edits = int(re.sub(r'[^0-9]+', '', m.group(1)))
-        normal_edits_left = min(edits_left, max_open_edits - open_edits)
-        return normal_edits_left, edits_left
+        return edits_today, open_edits
 
+    @with_session
     def add_release(self, album, edit_note, auto=False):
         form = album_to_form(album)
-        self.b.open(self.url("/release/add"), urllib.urlencode(form))
-        time.sleep(2.0)
+        self._open(self.url("/release/add"), urllib.urlencode(form))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/release" in f.action)
-        self.b.submit(name="step_editnote")
-        time.sleep(2.0)
+        self._submit(name="step_editnote")
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/release" in f.action)
         print self.b.response().read()
-        self.b.submit(name="save")
-        release_mbid = extract_mbid(self.b.geturl(), 'release')
+        location, page = self._submit_edit(name="save")
+        release_mbid = extract_mbid(location or self.b.geturl(), 'release')
         if not release_mbid:
-            raise Exception('unable to post edit')
+            raise EditError('unable to post edit')
+        self.quota.count_edit(auto)
         return release_mbid
 
+    @with_session
     def add_artist(self, artist, edit_note, auto=False):
-        self.b.open(self.url("/artist/create"))
+        self._open(self.url("/artist/create"))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/artist/create" in f.action)
         self.b["edit-artist.name"] = artist['name']
         self.b["edit-artist.sort_name"] = artist.get('sort_name', guess_artist_sort_name(artist['name']))
         self.b["edit-artist.edit_note"] = edit_note.encode('utf8')
-        self.b.submit()
-        mbid = extract_mbid(self.b.geturl(), 'artist')
+        location, page = self._submit_edit()
+        mbid = extract_mbid(location or self.b.geturl(), 'artist')
         if not mbid:
-            raise Exception('unable to post edit')
+            raise EditError('unable to post edit')
+        self.quota.count_edit()
         return mbid
 
+    @with_session
     def add_url(self, entity_type, entity_id, link_type_id, url, edit_note='', auto=False):
-        self.b.open(self.url("/edit/relationship/create_url", entity=entity_id, type=entity_type))
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "create_url" in f.action)
-        self.b["ar.link_type_id"] = [str(link_type_id)]
-        self.b["ar.url"] = str(url)
-        self.b["ar.edit_note"] = edit_note.encode('utf8')
-        try: self.b["ar.as_auto_editor"] = ["1"] if auto else []
-        except ControlNotFoundError: pass
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
+        if self._skip_edit('add_url', entity_type, entity_id, link_type_id, url):
+            return False
+        values = [
+            ("ar.link_type_id", [str(link_type_id)]),
+            ("ar.url", str(url)),
+            ("ar.edit_note", edit_note.encode('utf8')),
+            ("ar.as_auto_editor", ["1"] if auto else []),
+        ]
+        location, page = self._post_form("create_url:%s" % (entity_type,),
+            self.url("/edit/relationship/create_url", entity=entity_id, type=entity_type),
+            lambda f: f.method == "POST" and "create_url" in f.action,
+            values, optional=("ar.as_auto_editor",),
+            expect=("Thank you, your edit has been", "already exists"),
+            exists=lambda: self._find_edit_url(lambda edit_nr, details: entity_id in details and escape(url) in details))
+        if not _edit_succeeded(location, page):
             if "already exists" not in page:
-                raise Exception('unable to post edit')
+                raise EditError('unable to post edit')
             else:
                 return False
+        self.quota.count_edit(auto)
         return True
 
-    def edit_artist(self, artist, update, edit_note, auto=False):
-        self.b.open(self.url("/artist/%s/edit" % (artist['gid'],)))
+    def add_urls(self, entity_type, entity_id, urls, auto=False):
+        """Add several URL relationships to one entity. urls is a list of
+        (link_type_id, url, edit_note) tuples. Returns a list of (url, status)
+        tuples in the same order, status is one of 'added', 'exists',
+        'duplicate' or 'error: <message>'.
+
+        The form is loaded for the first URL, and if it has hidden fields
+        also for the second one (see FormSchema), the other URLs are POSTed
+        directly using the cached form schema. URLs that are already linked
+        are skipped without a request if the client has a precheck. Only
+        errors from the server or the connection end up in the status, other
+        exceptions are raised."""
+        results = []
+        seen = set()
+        for link_type_id, url, edit_note in urls:
+            if (link_type_id, url) in seen:
+                results.append((url, 'duplicate'))
+                continue
+            seen.add((link_type_id, url))
+            try:
+                if self.add_url(entity_type, entity_id, link_type_id, url, edit_note, auto):
+                    status = 'added'
+                else:
+                    status = 'exists'
+            except (EditError, SessionExpired, urllib2.URLError, httplib.HTTPException, socket.error), e:
+                status = 'error: %s' % (e,)
+            results.append((url, status))
+        return results
+
+    @with_session
+    def edit_artist(self, artist, update, edit_note, auto=False, sources=None):
+        """Set the fields of update on the artist, taking the values from the
+        artist dict (see artist_update_columns). Fields that are already set
+        are left out, the others are still changed. sources optionally maps
+        the fields to whoever asked for the change, for the log."""
+        if self._skip_edit('artist_edit', artist['gid'], update):
+            return
+        self._open(self.url("/artist/%s/edit" % (artist['gid'],)))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        if 'country' in update:
-            if self.b["edit-artist.country_id"] != ['']:
-                print " * country already set, not changing"
-                return
-            self.b["edit-artist.country_id"] = [str(artist['country'])]
-        if 'type' in update:
-            if self.b["edit-artist.type_id"] != ['']:
-                print " * type already set, not changing"
-                return
-            self.b["edit-artist.type_id"] = [str(artist['type'])]
-        if 'gender' in update:
-            if self.b["edit-artist.gender_id"] != ['']:
-                print " * gender already set, not changing"
-                return
-            self.b["edit-artist.gender_id"] = [str(artist['gender'])]
-        if 'begin_date' in update:
-            if self.b["edit-artist.begin_date.year"]:
-                print " * begin date year already set, not changing"
-                return
-            self.b["edit-artist.begin_date.year"] = str(artist['begin_date_year'])
-            if artist['begin_date_month']:
-                self.b["edit-artist.begin_date.month"] = str(artist['begin_date_month'])
-                if artist['begin_date_day']:
-                    self.b["edit-artist.begin_date.day"] = str(artist['begin_date_day'])
-        if 'end_date' in update:
-            if self.b["edit-artist.end_date.year"]:
-                print " * end date year already set, not changing"
-                return
-            self.b["edit-artist.end_date.year"] = str(artist['end_date_year'])
-            if artist['end_date_month']:
-                self.b["edit-artist.end_date.month"] = str(artist['end_date_month'])
-                if artist['end_date_day']:
-                    self.b["edit-artist.end_date.day"] = str(artist['end_date_day'])
-        if 'comment' in update:
-            if self.b["edit-artist.comment"] != '':
-                print " * comment already set, not changing"
-                return
-            self.b["edit-artist.comment"] = artist['comment'].encode('utf-8')
+        changed = False
+        for field in artist_update_fields:
+            if field not in update:
+                continue
+            control = "edit-artist.%s" % (field,)
+            if field in ('country', 'type', 'gender'):
+                control += "_id"
+            elif field in ('begin_date', 'end_date'):
+                control += ".year"
+            if self.b[control] not in ([''], ''):
+                _log_dropped(field, 'already set', sources)
+                continue
+            changed = True
+            if field in ('begin_date', 'end_date'):
+                self.b[control] = str(artist[field + '_year'])
+                if artist[field + '_month']:
+                    self.b["edit-artist.%s.month" % (field,)] = str(artist[field + '_month'])
+                    if artist[field + '_day']:
+                        self.b["edit-artist.%s.day" % (field,)] = str(artist[field + '_day'])
+            elif field == 'comment':
+                self.b[control] = artist['comment'].encode('utf-8')
+            else:
+                self.b[control] = [str(artist[field])]
+        if not changed:
+            return False
         self.b["edit-artist.edit_note"] = edit_note.encode('utf8')
         try: self.b["edit-artist.as_auto_editor"] = ["1"] if auto else []
         except ControlNotFoundError: pass
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
+        location, page = self._submit_edit()
+        if not _edit_succeeded(location, page):
             if 'any changes to the data already present' not in page:
-                raise Exception('unable to post edit')
+                raise EditError('unable to post edit')
             else:
                 return False
+        self.quota.count_edit(auto)
         return True
 
+    @with_session
     def set_artist_type(self, entity_id, type_id, edit_note, auto=False):
-        self.b.open(self.url("/artist/%s/edit" % (entity_id,)))
+        if self._skip_edit('artist_edit', entity_id, ['type']):
+            return
+        self._open(self.url("/artist/%s/edit" % (entity_id,)))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
         if self.b["edit-artist.type_id"] != ['']:
             print " * already set, not changing"
@@ -225,17 +746,20 @@ class MusicBrainzClient(object):
         self.b["edit-artist.edit_note"] = edit_note.encode('utf8')
         try: self.b["edit-artist.as_auto_editor"] = ["1"] if auto else []
         except ControlNotFoundError: pass
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
+        location, page = self._submit_edit()
+        if not _edit_succeeded(location, page):
             if 'any changes to the data already present' not in page:
-                raise Exception('unable to post edit')
+                raise EditError('unable to post edit')
             else:
                 return False
+        self.quota.count_edit(auto)
         return True
 
+    @with_session
     def edit_url(self, entity_id, old_url, new_url, edit_note, auto=False):
-        self.b.open(self.url("/url/%s/edit" % (entity_id,)))
+        if self._skip_edit('edit_url', entity_id, old_url, new_url):
+            return
+        self._open(self.url("/url/%s/edit" % (entity_id,)))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
         if self.b["edit-url.url"] != str(old_url):
             print " * value has changed, aborting"
@@ -247,17 +771,20 @@ class MusicBrainzClient(object):
         self.b["edit-url.edit_note"] = edit_note.encode('utf8')
         try: self.b["edit-url.as_auto_editor"] = ["1"] if auto else []
         except ControlNotFoundError: pass
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
+        location, page = self._submit_edit()
+        if not _edit_succeeded(location, page):
             if "any changes to the data already present" not in page:
-                raise Exception('unable to post edit')
+                raise EditError('unable to post edit')
             else:
                 return False
+        self.quota.count_edit(auto)
         return True
 
+    @with_session
     def edit_relationship(self, rel_id, entity0_type, entity1_type, old_link_type_id, new_link_type_id, attributes, begin_date, end_date, edit_note, auto=False):
-        self.b.open(self.url("/edit/relationship/edit", id=str(rel_id), type0=entity0_type, type1=entity1_type))
+        if self._skip_edit('edit_relationship', rel_id, entity0_type, entity1_type, old_link_type_id, new_link_type_id):
+            return
+        self._open(self.url("/edit/relationship/edit", id=str(rel_id), type0=entity0_type, type1=entity1_type))
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
         if self.b["ar.link_type_id"] == [str(new_link_type_id)] and new_link_type_id != old_link_type_id:
             print " * already set, not changing"
@@ -275,131 +802,526 @@ class MusicBrainzClient(object):
         self.b["ar.edit_note"] = edit_note.encode('utf8')
         try: self.b["ar.as_auto_editor"] = ["1"] if auto else []
         except ControlNotFoundError: pass
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
+        location, page = self._submit_edit()
+        if not _edit_succeeded(location, page):
             if "exists with these attributes" not in page:
-                raise Exception('unable to post edit')
+                raise EditError('unable to post edit')
             else:
                 return False
+        self.quota.count_edit(auto)
         return True
 
+    @with_session
     def remove_relationship(self, rel_id, entity0_type, entity1_type, edit_note):
-        self.b.open(self.url("/edit/relationship/delete", id=str(rel_id), type0=entity0_type, type1=entity1_type))
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        self.b["confirm.edit_note"] = edit_note.encode('utf8')
-        self.b.submit()
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
-            raise Exception('unable to post edit')
+        location, page = self._post_form("delete_relationship:%s-%s" % (entity0_type, entity1_type),
+            self.url("/edit/relationship/delete", id=str(rel_id), type0=entity0_type, type1=entity1_type),
+            lambda f: f.method == "POST" and "/edit" in f.action,
+            [("confirm.edit_note", edit_note.encode('utf8'))],
+            expect=("Thank you, your edit has been",))
+        if not _edit_succeeded(location, page):
+            raise EditError('unable to post edit')
+        self.quota.count_edit()
 
+    def _clear_merge_queue(self, entity_type):
+        self._open(self.url("/%s/merge" % entity_type), urllib.urlencode({'submit': 'cancel'}))
+        self.merge_queue_dirty = False
+
+    @with_session
     def merge(self, entity_type, entity_ids, target_id, edit_note):
+        if self.merge_queue_dirty:
+            self._clear_merge_queue(entity_type)
         params = [('add-to-merge', id) for id in entity_ids]
-        self.b.open(self.url("/%s/merge_queue" % entity_type), urllib.urlencode(params))
+        self.merge_queue_dirty = True
+        self._open(self.url("/%s/merge_queue" % entity_type), urllib.urlencode(params))
         page = self.b.response().read()
         if "You are about to merge" not in page:
-            raise Exception('unable to add items to merge queue')
+            raise EditError('unable to add items to merge queue')
 
         params = {'merge.target': target_id, 'submit': 'submit', 'merge.edit_note': edit_note}
         for idx, val in enumerate(entity_ids):
             params['merge.merging.%s' % idx] = val
-        self.b.open(self.url("/%s/merge" % entity_type), urllib.urlencode(params))
-        page = self.b.response().read()
-        if "Thank you, your edit has been" not in page:
-            raise Exception('unable to post edit')
+        location, page = self._post_edit(self.url("/%s/merge" % entity_type), urllib.urlencode(params))
+        if not _edit_succeeded(location, page):
+            raise EditError('unable to post edit')
+        self.merge_queue_dirty = False
+        self.quota.count_edit()
 
-    def _edit_release_information(self, entity_id, attributes, edit_note, auto=False):
-        self.b.open(self.url("/release/%s/edit" % (entity_id,)))
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
+    def _change_release_fields(self, attributes, make_writable=False, sources=None):
+        # Returns whether any field was changed, fields that don't have the
+        # expected old value are left alone
         changed = False
         for k, v in attributes.items():
-            self.b.form.find_control(k).readonly = False
+            if make_writable:
+                self.b.form.find_control(k).readonly = False
             if self.b[k] != v[0]:
-                print " * %s has changed, aborting" % k
-                return
+                _log_dropped(k, 'has changed', sources)
+                continue
             if self.b[k] != v[1]:
                 changed = True
                 self.b[k] = v[1]
+        return changed
+
+    @with_session
+    def edit_release(self, entity_id, information, tracklist, edit_note, auto=False, sources=None):
+        """Change fields on the information and tracklist steps of the release
+        editor in one edit. Both are dicts mapping the field name to a pair of
+        [old value] and [new value]. Fields whose old value doesn't match are
+        left out, see edit_artist for sources."""
+        self._open(self.url("/release/%s/edit" % (entity_id,)))
+        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
+        changed = self._change_release_fields(information, make_writable=True, sources=sources)
+        self.b["barcode_confirm"] = ["1"]
+        if tracklist:
+            self._submit(name="step_tracklist")
+            self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
+            changed = self._change_release_fields(tracklist, sources=sources) or changed
         if not changed:
             print " * already set, not changing"
-            return
-        self.b["barcode_confirm"] = ["1"]
-        self.b.submit(name="step_editnote")
-        page = self.b.response().read()
+            return False
+        self._submit(name="step_editnote")
         self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
         try:
             self.b["edit_note"] = edit_note.encode('utf8')
         except ControlNotFoundError:
-            raise Exception('unable to post edit')
-        try: self.b["as_auto_editor"] = ["1"] if auto else []
-        except ControlNotFoundError: pass
-        self.b.submit(name="save")
-        page = self.b.response().read()
-        if "Release information" not in page:
-            raise Exception('unable to post edit')
+            raise EditError('unable to post edit')
+        # the auto-edit checkbox doesn't work after the tracklist step
+        if tracklist:
+            auto = False
+        else:
+            try: self.b["as_auto_editor"] = ["1"] if auto else []
+            except ControlNotFoundError: pass
+        location, page = self._submit_edit(name="save")
+        if not extract_mbid(location or "", "release") and "Release information" not in (page or ""):
+            raise EditError('unable to post edit')
+        self.quota.count_edit(auto)
+        return True
 
+    @with_session
     def set_release_script(self, entity_id, old_script_id, new_script_id, edit_note, auto=False):
-        self._edit_release_information(entity_id, {"script_id": [[str(old_script_id)],[str(new_script_id)]]}, edit_note, auto)
+        return self.edit_release(entity_id, {"script_id": [[str(old_script_id)],[str(new_script_id)]]}, {}, edit_note, auto)
 
+    @with_session
     def set_release_language(self, entity_id, old_language_id, new_language_id, edit_note, auto=False):
-        self._edit_release_information(entity_id, {"language_id": [[str(old_language_id)],[str(new_language_id)]]}, edit_note, auto)
+        return self.edit_release(entity_id, {"language_id": [[str(old_language_id)],[str(new_language_id)]]}, {}, edit_note, auto)
 
+    @with_session
     def set_release_medium_format(self, entity_id, old_format_id, new_format_id, edit_note, auto=False):
-        self.b.open(self.url("/release/%s/edit" % (entity_id,)))
+        return self.edit_release(entity_id, {}, {"mediums.0.format_id": [[str(old_format_id)], [str(new_format_id)]]}, edit_note, auto)
 
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        self.b["barcode_confirm"] = ["1"]
-        self.b.submit(name="step_tracklist")
+    def _ws_post(self, resource, elements):
+        # POST a list of XML elements to the web service, which doesn't use
+        # the session cookie but HTTP digest authentication
+        if self.ws_opener is None:
+            passwords = urllib2.HTTPPasswordMgrWithDefaultRealm()
+            passwords.add_password(None, self.server, self.username, self.password)
+            self.ws_opener = transport.build_opener(urllib2.HTTPDigestAuthHandler(passwords))
+            self.ws_opener.addheaders = list(self.b.addheaders)
+        body = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#"><%s-list>%s</%s-list></metadata>'
+                % (resource, ''.join(elements), resource))
+        request = urllib2.Request(self.url("/ws/2/%s/" % (resource,), client='musicbrainz-bot-1.0'),
+                                  body.encode('utf8'), {'Content-Type': 'application/xml; charset=utf-8'})
+        self.rate_limiter.acquire('*')
+        with self.in_flight:
+            try:
+                resp = self.ws_opener.open(request)
+            except urllib2.HTTPError, e:
+                raise EditError('web service error %d: %s' % (e.code, e.read()))
+            try:
+                page = resp.read()
+            finally:
+                resp.close()
+        if '<text>OK</text>' not in page:
+            raise EditError('web service error: %s' % (page,))
 
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        attributes = {"mediums.0.format_id": [[str(old_format_id)], [str(new_format_id)]]}
-        changed = False
-        for k, v in attributes.items():
-            if self.b[k] != v[0]:
-                print " * %s has changed, aborting" % k
-                return
-            if self.b[k] != v[1]:
-                changed = True
-                self.b[k] = v[1]
-        if not changed:
-            print " * already set, not changing"
-            return
-        self.b.submit(name="step_editnote")
-        page = self.b.response().read()
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        try:
-            self.b["edit_note"] = edit_note.encode('utf8')
-        except ControlNotFoundError:
-            raise Exception('unable to post edit')
-        #try: self.b["as_auto_editor"] = ["1"] if auto else []
-        #except ControlNotFoundError: pass
-        self.b.submit(name="save")
-        page = self.b.response().read()
-        if "Release information" not in page:
-            raise Exception('unable to post edit')
+    def _submit_ws(self, resource, items, edit_note):
+        # items is a list of (element, values) tuples, values being the MBID
+        # and submitted values that the edit list shows for the element. The
+        # web service only answers OK, so the edit a submission created is
+        # found among the recent edits by all of its values. If that doesn't
+        # find exactly one edit, no note is added rather than adding it to
+        # the wrong edit.
+        edit_ids = []
+        for i in xrange(0, len(items), WS_BATCH_SIZE):
+            batch = items[i:i + WS_BATCH_SIZE]
+            self._ws_post(resource, [element for (element, values) in batch])
+            self.quota.count_edit()
+            if edit_note:
+                values = [value for (element, values) in batch for value in values]
+                edit_id = self._find_submitted_edit(values)
+                if edit_id is not None:
+                    edit_ids.append(edit_id)
+        if edit_ids:
+            self.add_edit_notes(dict((edit_id, edit_note) for edit_id in edit_ids))
+        return edit_ids
+
+    def _find_submitted_edit(self, values):
+        patterns = [re.compile(r'\b%s\b' % (re.escape(escape(value)),)) for value in values]
+        identify = lambda edit_nr, details: all(pattern.search(details) for pattern in patterns)
+        edit_ids = self.find_edits(identify)
+        if len(edit_ids) != 1:
+            print " * %d recent edits match the submission, not adding the edit note" % (len(edit_ids),)
+            return None
+        return edit_ids[0]
+
+    def submit_isrcs(self, isrcs, edit_note=None):
+        '''Adds ISRCs to recordings through the web service, 100 recordings
+        per request. isrcs is a list of (recording_mbid, isrc) tuples. The
+        edit note is added to each of the resulting edits, whose IDs are
+        returned.'''
+        recordings = []
+        by_recording = {}
+        for mbid, isrc in isrcs:
+            if mbid not in by_recording:
+                recordings.append(mbid)
+                by_recording[mbid] = []
+            by_recording[mbid].append(isrc)
+        items = []
+        for mbid in recordings:
+            items.append(('<recording id=%s><isrc-list count="%d">%s</isrc-list></recording>' % (
+                quoteattr(mbid), len(by_recording[mbid]),
+                ''.join('<isrc id=%s/>' % (quoteattr(isrc),) for isrc in by_recording[mbid])),
+                [mbid] + by_recording[mbid]))
+        return self._submit_ws('recording', items, edit_note)
+
+    def submit_barcodes(self, barcodes, edit_note=None):
+        '''Sets release barcodes through the web service, 100 releases per
+        request. barcodes is a list of (release_mbid, barcode) tuples, see
+        submit_isrcs for the edit note.'''
+        items = [('<release id=%s><barcode>%s</barcode></release>' % (quoteattr(mbid), escape(barcode)), [mbid, barcode])
+                 for (mbid, barcode) in barcodes]
+        return self._submit_ws('release', items, edit_note)
+
+    @with_session
+    def add_edit_notes(self, notes):
+        '''Adds edit notes to several edits with one submission of the vote
+        form. notes is a dict mapping edit IDs to the note for that edit.'''
+        values = [('url', self.url("/user/%s/edits" % (self.username,)))]
+        for i, (edit_id, edit_note) in enumerate(sorted(notes.items())):
+            values.append(('enter-vote.vote.%d.edit_id' % i, str(edit_id)))
+            values.append(('enter-vote.vote.%d.vote' % i, str(VOTE_ABSTAIN)))
+            values.append(('enter-vote.vote.%d.edit_note' % i, edit_note.encode('utf8')))
+        location, page = self._post_edit(self.url("/edit/enter_votes"), urllib.urlencode(values))
+        if location is None:
+            raise EditError('unable to add edit notes')
+
+    def _edit_list_page(self, page_no):
+        self._open(self.url("/user/%s/edits" % (self.username,), page=str(page_no)))
+        return parse_edit_list(self.b.response().read())
+
+    @with_session
+    def _update_edit_index(self, identify):
+        # Load the new edits from the start of the edit list, and if none of
+        # the indexed edits match, continue after the oldest indexed edit
+        index = self.edit_index
+        pages = []
+        while len(pages) < index.max_pages:
+            edits = self._edit_list_page(len(pages) + 1)
+            pages.append(edits)
+            if not edits or not index.edits or index.knows(edits):
+                break
+        index.add_new(pages)
+        loaded = len(pages)
+        while loaded < index.max_pages and index.page_size and index.find(identify) is None:
+            loaded += 1
+            if not index.add_old(self._edit_list_page(index.next_page())):
+                break
+
+    def find_edit(self, identify):
+        '''Returns the number of the newest recent edit for which
+        identify(edit_nr, details_html) is true, or None.'''
+        self._update_edit_index(identify)
+        return self.edit_index.find(identify)
+
+    def find_edits(self, identify):
+        '''Same as find_edit, but returns the numbers of all the matching
+        recent edits, newest first.'''
+        self._update_edit_index(identify)
+        return self.edit_index.find_all(identify)
+
+    def _find_edit_url(self, identify):
+        edit_id = self.find_edit(identify)
+        if edit_id is None:
+            return None
+        return self.url("/edit/%d" % (edit_id,))
 
     def add_edit_note(self, identify, edit_note):
-        '''Adds an edit note to the last (or very recently) made edit. This
-        is necessary e.g. for ISRC submission via web service, as it has no
-        support for edit notes. The "identify" argument is a function
+        '''Adds an edit note to the last (or very recently) made edit. The
+        "identify" argument is a function
             function(str, str) -> bool
         which receives the edit number as first, the raw html body of the edit
         as second argument, and determines if the note should be added to this
-        edit.'''
-        self.b.open(self.url("/user/%s/edits" % (self.username,)))
-        page = self.b.response().read()
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/edit" in f.action)
-        edits = re.findall(r'<h2><a href="'+self.server+r'/edit/([0-9]+).*?<div class="edit-details">(.*?)</div>', page, re.S)
-        for i, (edit_nr, text) in enumerate(edits):
-            if identify(edit_nr, text):
-                self.b['enter-vote.vote.%d.edit_note' % i] = edit_note.encode('utf8')
-                break
-        self.b.submit()
+        edit. Returns False if no such edit was found. To add notes to several
+        edits, use find_edit and add_edit_notes.'''
+        edit_id = self.find_edit(identify)
+        if edit_id is None:
+            return False
+        self.add_edit_notes({edit_id: edit_note})
+        return True
 
+    @with_session
     def cancel_edit(self, edit_nr, edit_note=u''):
-        self.b.open(self.url("/edit/%s/cancel" % (edit_nr,)))
-        page = self.b.response().read()
-        self.b.select_form(predicate=lambda f: f.method == "POST" and "/cancel" in f.action)
+        values = []
         if edit_note:
-            self.b['confirm.edit_note'] = edit_note.encode('utf8')
-        self.b.submit()
+            values.append(('confirm.edit_note', edit_note.encode('utf8')))
+        # MusicBrainz redirects to the edit page once the edit is cancelled
+        location, page = self._post_form("cancel_edit", self.url("/edit/%s/cancel" % (edit_nr,)),
+            lambda f: f.method == "POST" and "/cancel" in f.action, values,
+            exists=lambda: self._cancelled_edit_url(edit_nr))
+        return location is not None
+
+    def _cancelled_edit_url(self, edit_nr):
+        url = self.url("/edit/%s" % (edit_nr,))
+        self._open(url)
+        if 'Cancelled' in self.b.response().read():
+            return url
+        return None
+
+
+class BoundedHistory(mechanize.History):
+    # Browser history that only keeps the last maxlen pages and closes the
+    # responses of the older ones, so a long running client doesn't keep every
+    # page it has ever seen in memory
+
+    def __init__(self, maxlen=0):
+        mechanize.History.__init__(self)
+        self.maxlen = maxlen
+
+    def add(self, request, response):
+        mechanize.History.add(self, request, response)
+        while len(self._history) > self.maxlen:
+            old_request, old_response = self._history.pop(0)
+            if old_response is not None:
+                old_response.close()
+
+    def __copy__(self):
+        ans = self.__class__(self.maxlen)
+        ans._history = self._history[:]
+        return ans
+
+
+def _call_client_method(client, method, *args, **kwargs):
+    return getattr(client, method)(*args, **kwargs)
+
+
+class MusicBrainzClientPool(object):
+    """Several MusicBrainzClient sessions used from worker threads, so that
+    edits can be submitted without waiting for the previous one to finish.
+
+    >>> pool = MusicBrainzClientPool(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+    >>> result = pool.submit('add_url', 'artist', gid, 179, url, edit_note)
+    >>> result.result()
+    True
+
+    max_in_flight limits the number of HTTP requests running at the same
+    time across all clients of the pool, it defaults to the pool size.
+
+    By default all clients share one login session. With
+    separate_sessions=True each client logs in on its own and keeps its
+    session in its own cookie file, which is needed for anything that keeps
+    state in the session, like the merge queue.
+    """
+
+    def __init__(self, username, password, server="http://musicbrainz.org", editor_id=None, size=4, max_in_flight=None, cookie_file=None, separate_sessions=False):
+        self.in_flight = threading.BoundedSemaphore(max_in_flight or size)
+        self.quota = EditQuota()
+        self.separate_sessions = separate_sessions
+        self.clients = []
+        for i in range(size):
+            client_cookie_file = cookie_file
+            if separate_sessions:
+                client_cookie_file = '%s.%d' % (cookie_file or default_cookie_file(server, username), i)
+            client = MusicBrainzClient(username, password, server, editor_id, cookie_file=client_cookie_file,
+                                       in_flight=self.in_flight, quota=self.quota)
+            if i == 0 or separate_sessions:
+                # with a shared session, log in only once, the other clients
+                # pick up the session from the cookie file
+                client.ensure_session()
+            self.clients.append(client)
+        self.workers = WorkerPool(self.clients)
+
+    def submit(self, method, *args, **kwargs):
+        """Call MusicBrainzClient.<method>(*args, **kwargs) on the first free
+        session and return a Future for the result."""
+        return self.workers.submit(_call_client_method, method, *args, **kwargs)
+
+    def merge_groups(self, entity_type, groups, edit_note):
+        """Merge many groups of duplicates, each group is a tuple
+        (target_id, source_ids). Every session works on its own group, so
+        the merge queue and merge requests of different groups overlap.
+        Returns a list of (target_id, source_ids, result) tuples in the same
+        order, where result is an exception if the merge failed."""
+        if len(self.clients) > 1 and not self.separate_sessions:
+            raise Exception('merging with several sessions needs separate_sessions=True')
+        start = time.time()
+        futures = []
+        for target_id, source_ids in groups:
+            entity_ids = [target_id] + [id for id in source_ids if id != target_id]
+            futures.append((target_id, source_ids, self.submit('merge', entity_type, entity_ids, target_id, edit_note)))
+        results = []
+        failed = 0
+        for target_id, source_ids, future in futures:
+            result = future.exception()
+            if result is not None:
+                print " * unable to merge %s into %s: %s" % (', '.join(source_ids), target_id, result)
+                failed += 1
+            results.append((target_id, source_ids, result))
+        elapsed = time.time() - start
+        print "merged %d groups, %d failed, %.1f groups per minute" % (
+            len(results) - failed, failed, len(results) * 60.0 / elapsed if elapsed else 0.0)
+        return results
+
+    def edits_left(self, max_open_edits=2000, max_edits_per_day=1000):
+        # shares the quota with all the sessions
+        return self.clients[0].edits_left(max_open_edits, max_edits_per_day)
+
+    def join(self):
+        self.workers.join()
+
+    def close(self):
+        self.workers.close()
+
+
+# fields that MusicBrainzClient.edit_artist can update, in form order
+artist_update_fields = ['country', 'type', 'gender', 'begin_date', 'end_date', 'comment']
+
+# columns of the artist dict used by MusicBrainzClient.edit_artist for each
+# of the fields that can be updated
+artist_update_columns = {
+    'country': ('country',),
+    'type': ('type',),
+    'gender': ('gender',),
+    'begin_date': ('begin_date_year', 'begin_date_month', 'begin_date_day'),
+    'end_date': ('end_date_year', 'end_date_month', 'end_date_day'),
+    'comment': ('comment',),
+}
+
+
+class PendingEntityEdit(object):
+
+    def __init__(self, kind, mbid):
+        self.kind = kind
+        self.mbid = mbid
+        self.created = time.time()
+        self.notes = []
+        # edit note of the change that queued each field
+        self.sources = {}
+        self.auto = True
+        # artist edits
+        self.artist = {'gid': mbid}
+        self.update = set()
+        # release edits
+        self.information = {}
+        self.tracklist = {}
+
+    def add_note(self, edit_note, auto):
+        if edit_note and edit_note not in self.notes:
+            self.notes.append(edit_note)
+        self.auto = self.auto and auto
+
+    def edit_note(self):
+        return u'\n\n'.join(self.notes)
+
+
+class EditBuffer(object):
+    """Collects changes for the same entity that arrive within window seconds
+    of each other and submits them through the client as a single edit, which
+    saves form loads, release editor steps and edits from the daily quota.
+
+    >>> buf = EditBuffer(mb)
+    >>> buf.set_release_script(gid, 28, 29, 'from source A')
+    >>> buf.set_release_language(gid, 120, 198, 'from source B')
+    >>> buf.flush(force=True)
+
+    Conflicting changes to the same field are dropped. Fields that are
+    already set on the server are left out of the edit, the other changes to
+    the entity are still submitted. The combined edit is only an auto-edit
+    if all of the changes were.
+    """
+
+    def __init__(self, client, window=300):
+        self.client = client
+        self.window = window
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _entry(self, kind, mbid):
+        key = (kind, mbid)
+        if key not in self.pending:
+            self.pending[key] = PendingEntityEdit(kind, mbid)
+        return self.pending[key]
+
+    def edit_artist(self, artist, update, edit_note, auto=False):
+        with self.lock:
+            entry = self._entry('artist', artist['gid'])
+            accepted = False
+            for field in update:
+                values = dict((c, artist.get(c)) for c in artist_update_columns[field])
+                if field in entry.update:
+                    if any(entry.artist[c] != v for (c, v) in values.items()):
+                        print " * conflicting %s for artist %s, ignoring" % (field, artist['gid'])
+                        continue
+                else:
+                    entry.update.add(field)
+                    entry.artist.update(values)
+                    entry.sources[field] = edit_note
+                accepted = True
+            if accepted:
+                entry.add_note(edit_note, auto)
+        return self.flush()
+
+    def _release_change(self, step, mbid, field, old_value, new_value, edit_note, auto):
+        change = [[str(old_value)], [str(new_value)]]
+        with self.lock:
+            entry = self._entry('release', mbid)
+            fields = getattr(entry, step)
+            if field in fields and fields[field] != change:
+                print " * conflicting %s for release %s, ignoring" % (field, mbid)
+            else:
+                fields[field] = change
+                entry.sources[field] = edit_note
+                entry.add_note(edit_note, auto)
+        return self.flush()
+
+    def set_release_script(self, entity_id, old_script_id, new_script_id, edit_note, auto=False):
+        return self._release_change('information', entity_id, 'script_id', old_script_id, new_script_id, edit_note, auto)
+
+    def set_release_language(self, entity_id, old_language_id, new_language_id, edit_note, auto=False):
+        return self._release_change('information', entity_id, 'language_id', old_language_id, new_language_id, edit_note, auto)
+
+    def set_release_medium_format(self, entity_id, old_format_id, new_format_id, edit_note, auto=False):
+        return self._release_change('tracklist', entity_id, 'mediums.0.format_id', old_format_id, new_format_id, edit_note, auto)
+
+    def _submit(self, entry):
+        if entry.kind == 'artist':
+            return self.client.edit_artist(entry.artist, entry.update, entry.edit_note(), entry.auto, entry.sources)
+        else:
+            return self.client.edit_release(entry.mbid, entry.information, entry.tracklist, entry.edit_note(), entry.auto, entry.sources)
+
+    def flush(self, force=False):
+        """Submit the entities whose window has passed (or all of them, with
+        force=True). Returns a list of (kind, mbid, result) tuples, where
+        result is an exception if the edit failed."""
+        now = time.time()
+        with self.lock:
+            ready = [e for e in self.pending.values() if force or now - e.created >= self.window]
+            for entry in ready:
+                del self.pending[(entry.kind, entry.mbid)]
+        results = []
+        for entry in sorted(ready, key=lambda e: e.created):
+            try:
+                result = self._submit(entry)
+            except Exception, e:
+                print " * unable to edit %s %s: %s" % (entry.kind, entry.mbid, e)
+                result = e
+            results.append((entry.kind, entry.mbid, result))
+        return results
+
+    def close(self):
+        return self.flush(force=True)
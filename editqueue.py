@@ -0,0 +1,162 @@
+import os
+import re
+import sys
+import time
+import json
+import sqlite3
+from mbbot.utils.errors import error_text
+
+
+def insert_processed(db, table, values):
+    # Inserts the row (dict of values) into the bot's table in the
+    # MusicBrainz database db, unless it is there already
+    if not re.match(r'^bot_[a-z_]+$', table):
+        raise ValueError('invalid bot table %r' % (table,))
+    columns = sorted(values)
+    db.execute("INSERT INTO %s (%s) SELECT %s WHERE NOT EXISTS (SELECT 1 FROM %s WHERE %s)" % (
+        table, ', '.join(columns), ', '.join(['%s'] * len(columns)),
+        table, ' AND '.join('%s = %%s' % (column,) for column in columns)),
+        [values[column] for column in columns] * 2)
+
+
+class EditQueue(object):
+    """Edits proposed by the bots, kept in a SQLite database until
+    submit_edits.py submits them at the rate the server allows.
+
+    It has the same edit methods as MusicBrainzClient, so a bot can use it in
+    place of the client:
+
+    >>> mb = EditQueue()
+    >>> mb.add_url("artist", gid, 179, url, text)
+
+    A bot that keeps the entities it has looked at in a bot_* table marks
+    them with mark_processed() instead of inserting the row itself, so that
+    entities whose edit fails or is skipped are looked at again, and leaves
+    out the entities whose edit is still queued with skip_pending():
+
+    >>> for artist in mb.skip_pending(artists, 'bot_wp_artist_link', row):
+    ...     queued = mb.add_url("artist", artist['gid'], 179, url, text)
+    ...     mb.mark_processed(db, queued, 'bot_wp_artist_link', row(artist))
+    """
+
+    queued_methods = set([
+        'add_url',
+        'edit_artist',
+        'set_artist_type',
+        'edit_url',
+        'edit_relationship',
+        'remove_relationship',
+        'merge',
+        'set_release_script',
+        'set_release_language',
+        'set_release_medium_format',
+    ])
+
+    def __init__(self, path='edit_queue.db'):
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS edit_queue (
+                id INTEGER PRIMARY KEY,
+                method TEXT NOT NULL,
+                args TEXT NOT NULL,
+                kwargs TEXT NOT NULL,
+                source TEXT,
+                created REAL NOT NULL,
+                status TEXT NOT NULL DEFAULT 'new',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                processed TEXT
+            );
+            CREATE INDEX IF NOT EXISTS edit_queue_status_idx ON edit_queue (status, id);
+        """)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(edit_queue)")]
+        if 'processed' not in columns:
+            self.db.execute("ALTER TABLE edit_queue ADD COLUMN processed TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS edit_queue_processed_idx ON edit_queue (processed)")
+        self.db.commit()
+        self.source = os.path.basename(sys.argv[0])
+
+    def __getattr__(self, name):
+        if name not in self.queued_methods:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.put(name, *args, **kwargs)
+
+    def put(self, method, *args, **kwargs):
+        if method not in self.queued_methods:
+            raise ValueError('%s edits can not be queued' % (method,))
+        # sets (e.g. the fields to update in edit_artist) are stored as lists
+        cursor = self.db.execute(
+            "INSERT INTO edit_queue (method, args, kwargs, source, created) VALUES (?, ?, ?, ?, ?)",
+            (method, json.dumps(args, default=list), json.dumps(kwargs, default=list), self.source, time.time()))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def _processed_key(self, table, values):
+        if not re.match(r'^bot_[a-z_]+$', table):
+            raise ValueError('invalid bot table %r' % (table,))
+        return json.dumps([table, values], sort_keys=True)
+
+    def set_processed(self, id, table, values):
+        # The row (dict of values) to insert into the bot's table once the
+        # edit has been submitted, see submit_edits.py
+        self.db.execute("UPDATE edit_queue SET processed = ? WHERE id = ?", (self._processed_key(table, values), id))
+        self.db.commit()
+
+    def processed(self, id):
+        # Returns (table, values) given to set_processed for the edit, or None
+        row = self.db.execute("SELECT processed FROM edit_queue WHERE id = ?", (id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        table, values = json.loads(row[0])
+        return table, values
+
+    def is_pending(self, table, values):
+        # Whether an edit that will mark the entity as processed is still
+        # waiting to be submitted, so the bot doesn't queue it again
+        row = self.db.execute(
+            "SELECT 1 FROM edit_queue WHERE processed = ? AND status IN ('new', 'submitting') LIMIT 1",
+            (self._processed_key(table, values),)).fetchone()
+        return row is not None
+
+    def skip_pending(self, entities, table, row):
+        # The entities without a queued edit that will mark them as
+        # processed; row(entity) is the entity's row in the bot's table
+        return (entity for entity in entities if not self.is_pending(table, row(entity)))
+
+    def mark_processed(self, db, id, table, values):
+        # Marks the entity as processed in the bot's table in the
+        # MusicBrainz database db: right away if no edit was queued for it
+        # (id is None), otherwise once edit id has been submitted
+        if id is None:
+            insert_processed(db, table, values)
+        else:
+            self.set_processed(id, table, values)
+
+    def take(self, limit=10):
+        # Returns a list of (id, method, args, kwargs) of the oldest new edits
+        # and marks them as being submitted
+        rows = self.db.execute(
+            "SELECT id, method, args, kwargs FROM edit_queue WHERE status = 'new' ORDER BY id LIMIT ?",
+            (limit,)).fetchall()
+        self.db.executemany(
+            "UPDATE edit_queue SET status = 'submitting', attempts = attempts + 1 WHERE id = ?",
+            [(row[0],) for row in rows])
+        self.db.commit()
+        return [(id, method, json.loads(args), json.loads(kwargs)) for (id, method, args, kwargs) in rows]
+
+    def finish(self, id, error=None):
+        if error is None:
+            self.db.execute("UPDATE edit_queue SET status = 'done', error = NULL WHERE id = ?", (id,))
+        else:
+            self.db.execute("UPDATE edit_queue SET status = 'failed', error = ? WHERE id = ?", (error_text(error), id))
+        self.db.commit()
+
+    def reset(self, failed=False):
+        # Edits left in 'submitting' by a submitter that died are tried again,
+        # optionally also the ones that failed
+        statuses = ('submitting', 'failed') if failed else ('submitting',)
+        self.db.execute("UPDATE edit_queue SET status = 'new' WHERE status IN (%s)" % (', '.join('?' * len(statuses)),), statuses)
+        self.db.commit()
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, count(*) FROM edit_queue GROUP BY status").fetchall())
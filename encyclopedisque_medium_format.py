@@ -3,10 +3,9 @@
 import re
 import sqlalchemy
 import solr
-from editing import MusicBrainzClient
+from editqueue import EditQueue
 import pprint
 import urllib
-import time
 from utils import mangle_name, join_names, out, colored_out, bcolors
 import config as cfg
 
@@ -14,7 +13,7 @@ engine = sqlalchemy.create_engine(cfg.MB_DB)
 db = engine.connect()
 db.execute("SET search_path TO musicbrainz")
 
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 """
 CREATE TABLE bot_encyclopedisque_medium_format (
@@ -49,13 +48,13 @@ ORDER BY r.artist_credit, r.id
 LIMIT 100
 """
 
-for id, gid, name, url, format, ac_name in db.execute(query):
+def processed_row(release):
+    return {'gid': release['gid']}
+
+for id, gid, name, url, format, ac_name in mb.skip_pending(db.execute(query), 'bot_encyclopedisque_medium_format', processed_row):
     colored_out(bcolors.OKBLUE, 'Looking up release "%s" by "%s" http://musicbrainz.org/release/%s' % (name, ac_name, gid))
 
     edit_note = 'Setting format to 7" based on attached link to Encyclopedisque (%s)' % url
     out(' * edit note: %s' % (edit_note,))
-    mb.set_release_medium_format(gid, format, 29, edit_note)
-
-    time.sleep(5)
-
-    db.execute("INSERT INTO bot_encyclopedisque_medium_format (gid) VALUES (%s)", (gid,))
+    queued = mb.set_release_medium_format(gid, format, 29, edit_note)
+    mb.mark_processed(db, queued, 'bot_encyclopedisque_medium_format', {'gid': gid})
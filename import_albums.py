@@ -1,20 +1,17 @@
 import re
 import sys
 import urllib
-import urllib2
-import config
 import pymongo
 import pprint
 from editing import MusicBrainzClient
+from mbbot.utils import transport
 import cgi
 
 
 mb = MusicBrainzClient('lukz_bot', 'mb', 'http://mb.muziq.eu')
 
 
-opener = urllib2.build_opener()
-if config.WWW_USER_AGENT:
-    opener.addheaders = [('User-Agent', config.WWW_USER_AGENT)]
+opener = transport.build_opener()
 
 
 mongo = pymongo.Connection()
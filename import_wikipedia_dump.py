@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""Load the current text of all articles (namespace 0) of a Wikipedia dump
+into the page store, so that the bots only need the API for pages that
+changed since the dump.
+
+    import_wikipedia_dump.py enwiki-20130102-pages-articles.xml.bz2
+
+The dump is decompressed by lbzip2 or pbzip2 on all cores if one of them is
+installed (bzip2 or the bz2 module otherwise) and parsed as a stream, so the
+memory used doesn't depend on its size. The pages are compressed by a pool
+of worker processes and written in batches. Pages that are already stored at
+the same or a later revision are kept.
+"""
+
+import os
+import re
+import bz2
+import time
+import calendar
+import subprocess
+import multiprocessing
+from collections import deque
+from distutils.spawn import find_executable
+from optparse import OptionParser
+from xml.etree import cElementTree
+from mbbot.wp.pagestore import DEFAULT_CACHE_DIR, PageStore, compress_page
+from utils import out
+
+
+class BZ2Reader(object):
+    # File object for .bz2 files made of several streams, which bz2.BZ2File
+    # of Python 2 stops reading after the first one
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.decompressor = bz2.BZ2Decompressor()
+
+    def read(self, size=65536):
+        while True:
+            data = self.file.read(size)
+            if not data:
+                return ''
+            result = []
+            while data:
+                try:
+                    result.append(self.decompressor.decompress(data))
+                except EOFError:
+                    self.decompressor = bz2.BZ2Decompressor()
+                    continue
+                data = self.decompressor.unused_data
+                if data:
+                    self.decompressor = bz2.BZ2Decompressor()
+            result = ''.join(result)
+            if result:
+                return result
+
+
+def open_dump(path):
+    # Returns a file object with the decompressed dump
+    if not path.endswith('.bz2'):
+        return open(path, 'rb')
+    for command in ('lbzip2', 'pbzip2', 'bzip2'):
+        if find_executable(command):
+            process = subprocess.Popen([command, '-dc', path], stdout=subprocess.PIPE, bufsize=1 << 20)
+            return process.stdout
+    return BZ2Reader(path)
+
+
+def parse_timestamp(timestamp):
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
+
+
+def iter_pages(f):
+    # Yields (title, text, revid, timestamp) for the articles of the dump
+    context = iter(cElementTree.iterparse(f, events=('start', 'end')))
+    event, root = next(context)
+    namespace = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+    page_tag = namespace + 'page'
+    for event, elem in context:
+        if event != 'end' or elem.tag != page_tag:
+            continue
+        if elem.findtext(namespace + 'ns') == '0':
+            revision = elem.find(namespace + 'revision')
+            text = revision.find(namespace + 'text')
+            # the text of suppressed revisions isn't in the dump
+            if text is not None and text.get('deleted') is None:
+                yield (elem.findtext(namespace + 'title'), text.text or u'',
+                       int(revision.findtext(namespace + 'id')),
+                       parse_timestamp(revision.findtext(namespace + 'timestamp')))
+        # only keep the current page in memory
+        root.clear()
+
+
+def compress_batch(pages):
+    return [compress_page(page) for page in pages]
+
+
+def batches(pages, size, fetched):
+    batch = []
+    for title, text, revid, timestamp in pages:
+        # a page is known to be current as of the dump
+        batch.append((title, text, revid, max(timestamp, fetched)))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] <dump.xml.bz2>')
+    parser.add_option('--lang', help='language of the dump, by default from the file name (e.g. enwiki-20130102-...)')
+    parser.add_option('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_option('--processes', type='int', default=multiprocessing.cpu_count(), help='processes compressing pages')
+    parser.add_option('--batch-size', type='int', default=500)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('expected one dump file')
+    path = args[0]
+    lang = options.lang
+    m = re.match(r'([a-z_]+)wiki-(\d{8})-', os.path.basename(path))
+    if lang is None:
+        if m is None:
+            parser.error('unable to tell the language from the file name, use --lang')
+        lang = m.group(1)
+
+    store = PageStore(os.path.join(options.cache_dir, '%s.db' % (lang,)))
+    # the pages are current as of the date in the file name, or else as of
+    # the file at most
+    if m is not None:
+        fetched = calendar.timegm(time.strptime(m.group(2), '%Y%m%d'))
+    else:
+        fetched = os.path.getmtime(path)
+    pool = multiprocessing.Pool(options.processes)
+    pending = deque()
+    imported = 0
+    start = time.time()
+
+    def write(result):
+        pages = result.get()
+        store.put_compressed_many(pages, only_newer=True)
+        return len(pages)
+
+    try:
+        for batch in batches(iter_pages(open_dump(path)), options.batch_size, fetched):
+            pending.append(pool.apply_async(compress_batch, (batch,)))
+            # don't let the parser run too far ahead of the writes
+            if len(pending) > options.processes * 2:
+                imported += write(pending.popleft())
+                if imported % (options.batch_size * 100) == 0:
+                    out('%d pages, %.0f pages/s' % (imported, imported / (time.time() - start)))
+        while pending:
+            imported += write(pending.popleft())
+    finally:
+        pool.terminate()
+    out('%s: imported %d pages in %.0f s, %d in the page store' % (lang, imported, time.time() - start, len(store)))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,11 +2,11 @@
 
 import sys
 import solr
+from mbbot.wp.api import solr_url
 
 for file in sys.argv[1:]:
     lang = file[:2]
-    suffix = '_' + lang if lang != 'en' else ''
-    s = solr.SolrConnection('http://localhost:8983/solr/wikipedia' + suffix)
+    s = solr.SolrConnection(solr_url(lang))
     s.delete_query('*:*')
     for line in open(sys.argv[1]):
         id = line.rstrip('\r\n').decode('utf8')
@@ -0,0 +1,121 @@
+import re
+import time
+
+
+artist_fields = {
+    'country': 'country',
+    'type': 'type',
+    'gender': 'gender',
+    'begin_date': 'begin_date_year',
+    'end_date': 'end_date_year',
+    'comment': 'comment',
+}
+
+
+def link_table(entity0_type, entity1_type):
+    for entity_type in (entity0_type, entity1_type):
+        if not re.match(r'^[a-z_]+$', entity_type):
+            raise ValueError('invalid entity type %r' % (entity_type,))
+    return 'l_%s_%s' % (entity0_type, entity1_type)
+
+
+class EditPrecheck(object):
+    """Looks up the current state of an entity in the MusicBrainz database,
+    so that MusicBrainzClient can skip edits that can't succeed without
+    loading the edit form first.
+
+    Each check returns a reason for skipping the edit, or None if the edit
+    should be attempted. Answers are only trusted while the replicated
+    database is at most max_lag seconds behind the server. A database that
+    has never been replicated is never trusted, unless max_lag is None.
+    """
+
+    def __init__(self, db, max_lag=3600, lag_check_interval=60):
+        self.db = db
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.lag_checked = None
+        self.lag_ok = False
+
+    def usable(self):
+        if self.max_lag is None:
+            return True
+        now = time.time()
+        if self.lag_checked is None or now - self.lag_checked > self.lag_check_interval:
+            lag = self.db.execute("SELECT extract(epoch FROM now() - last_replication_date) FROM replication_control").scalar()
+            self.lag_ok = lag is not None and lag <= self.max_lag
+            if not self.lag_ok:
+                print " * replication lag is %s seconds, not checking edits against the database" % (lag,)
+            self.lag_checked = now
+        return self.lag_ok
+
+    def artist_edit(self, gid, update):
+        if not self.usable():
+            return None
+        columns = [artist_fields[field] for field in sorted(update)]
+        query = "SELECT edits_pending, %s FROM artist WHERE gid = %%s" % (', '.join(columns),)
+        row = self.db.execute(query, (gid,)).fetchone()
+        if row is None:
+            return 'artist does not exist'
+        if row[0]:
+            return 'artist has pending edits'
+        # the edit form leaves out the fields that are set, so the edit is
+        # only skipped if none is left
+        already_set = [field for (field, value) in zip(sorted(update), row[1:]) if value is not None and value != '']
+        if len(already_set) == len(update):
+            return '%s already set' % (', '.join(field.replace('_', ' ') for field in already_set),)
+        return None
+
+    def add_url(self, entity_type, entity_id, link_type_id, url):
+        if not self.usable():
+            return None
+        if entity_type < 'url':
+            table = link_table(entity_type, 'url')
+            entity_column, url_column = 'entity0', 'entity1'
+        else:
+            table = link_table('url', entity_type)
+            entity_column, url_column = 'entity1', 'entity0'
+        query = """
+            SELECT 1 FROM """ + table + """ l
+            JOIN link ON l.link = link.id
+            JOIN url u ON l.""" + url_column + """ = u.id
+            JOIN """ + entity_type + """ e ON l.""" + entity_column + """ = e.id
+            WHERE e.gid = %s AND link.link_type = %s AND u.url = %s
+        """
+        if self.db.execute(query, (entity_id, link_type_id, url)).fetchone() is not None:
+            return 'relationship already exists'
+        return None
+
+    def edit_url(self, entity_id, old_url, new_url):
+        if not self.usable():
+            return None
+        row = self.db.execute("SELECT url, edits_pending FROM url WHERE gid = %s", (entity_id,)).fetchone()
+        if row is None:
+            return 'URL does not exist'
+        if row[0] == new_url:
+            return 'already set'
+        if row[0] != old_url:
+            return 'value has changed'
+        if row[1]:
+            return 'URL has pending edits'
+        return None
+
+    def edit_relationship(self, rel_id, entity0_type, entity1_type, old_link_type_id, new_link_type_id):
+        if not self.usable():
+            return None
+        query = """
+            SELECT link.link_type, l.edits_pending FROM """ + link_table(entity0_type, entity1_type) + """ l
+            JOIN link ON l.link = link.id
+            WHERE l.id = %s
+        """
+        row = self.db.execute(query, (rel_id,)).fetchone()
+        if row is None:
+            return 'relationship does not exist'
+        old_link_type_id, new_link_type_id = int(old_link_type_id), int(new_link_type_id)
+        if row[0] == new_link_type_id and new_link_type_id != old_link_type_id:
+            return 'already set'
+        if row[0] != old_link_type_id:
+            return 'value has changed'
+        if row[1]:
+            return 'relationship has pending edits'
+        return None
@@ -1,7 +1,5 @@
 import re
 import sys
-import urllib2
-import config
 import pymongo
 import pprint
 import time
@@ -9,11 +7,10 @@ import random
 import datetime
 from BeautifulSoup import BeautifulSoup
 from mbbot.guesscase import guess_case, guess_case_title
+from mbbot.utils import transport
 
 
-opener = urllib2.build_opener()
-if config.WWW_USER_AGENT:
-    opener.addheaders = [('User-Agent', config.WWW_USER_AGENT)]
+opener = transport.build_opener()
 
 
 def get_db():
@@ -0,0 +1,7 @@
+def error_text(e):
+    # The message of an exception as unicode. Messages may be byte strings
+    # with UTF-8 from the server, e.g. the body of an error response.
+    try:
+        return unicode(e)
+    except UnicodeDecodeError:
+        return str(e).decode('utf-8', 'replace')
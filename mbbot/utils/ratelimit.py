@@ -0,0 +1,61 @@
+import os
+import time
+import fcntl
+import json
+
+
+class RateLimiter(object):
+    """Token buckets stored in a small JSON file, so that all processes using
+    the same file share one budget.
+
+    limits maps a bucket name to (interval, burst) -- one token is added to the
+    bucket every interval seconds and at most burst tokens can be saved up.
+    """
+
+    def __init__(self, path, limits):
+        self.path = path
+        self.limits = limits
+
+    def _reserve(self, names):
+        # Take one token from each of the buckets, or if any of them is empty,
+        # don't take anything and return how long to wait for it to refill
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = os.read(fd, 65536)
+            try:
+                state = json.loads(data) if data else {}
+            except ValueError:
+                state = {}
+            now = time.time()
+            wait = 0.0
+            for name in names:
+                interval, burst = self.limits[name]
+                tokens, last = state.get(name, (burst, now))
+                tokens = min(burst, tokens + max(0.0, now - last) / interval)
+                state[name] = [tokens, now]
+                if tokens < 1.0:
+                    wait = max(wait, (1.0 - tokens) * interval)
+            if not wait:
+                for name in names:
+                    state[name][0] -= 1.0
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, json.dumps(state))
+            return wait
+        finally:
+            os.close(fd)
+
+    def acquire(self, *names):
+        # Block until a token is available in all the given buckets, names
+        # without a configured limit are ignored; returns the time slept
+        names = [name for name in names if name in self.limits]
+        if not names:
+            return 0.0
+        slept = 0.0
+        while True:
+            wait = self._reserve(names)
+            if not wait:
+                return slept
+            time.sleep(wait)
+            slept += wait
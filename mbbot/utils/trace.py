@@ -0,0 +1,113 @@
+import re
+import sys
+import json
+import time
+import atexit
+import threading
+import urlparse
+from contextlib import contextmanager
+import config
+
+
+def endpoint(url):
+    # Roughly the endpoint a URL is for: host and path, with the path
+    # segments that look like IDs or names replaced by :id
+    parts = urlparse.urlsplit(url)
+    segments = []
+    for segment in parts.path.split('/')[1:4]:
+        if segment and not re.match(r'^[a-z_-]+(\.php)?$', segment):
+            segment = ':id'
+        segments.append(segment)
+    return parts.netloc + '/' + '/'.join(segments)
+
+
+def percentile(values, p):
+    # values must be sorted
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+class Tracer(object):
+    """Appends one JSON line per outbound request (or cache lookup) to a
+    trace file and prints a summary per endpoint when the process exits.
+    Entries without a latency (e.g. cache misses, whose time is in the
+    request that fetched the page) only count towards count and hits.
+
+    Does nothing unless a path is given, see TRACE_FILE in config.py.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, latency, status=None, bytes=None, cache=None):
+        if self.path is None:
+            return
+        entry = {'time': round(time.time(), 3), 'endpoint': endpoint}
+        if latency is not None:
+            entry['latency'] = round(latency, 4)
+        if status is not None:
+            entry['status'] = status
+        if bytes is not None:
+            entry['bytes'] = bytes
+        if cache is not None:
+            entry['cache'] = cache
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a')
+                atexit.register(self.close)
+            self.file.write(line)
+            stats = self.endpoints.setdefault(endpoint, {'count': 0, 'latency': [], 'bytes': 0, 'errors': 0, 'hits': 0})
+            stats['count'] += 1
+            if latency is not None:
+                stats['latency'].append(latency)
+            stats['bytes'] += bytes or 0
+            if status is not None and not (isinstance(status, int) and status < 400):
+                stats['errors'] += 1
+            if cache == 'hit':
+                stats['hits'] += 1
+
+    @contextmanager
+    def span(self, endpoint, cache=None):
+        """Record the time spent in the with block. The block can fill in
+        'status' and 'bytes' of the yielded dict, an exception is recorded
+        as status 'error'."""
+        fields = {'cache': cache}
+        start = time.time()
+        try:
+            yield fields
+        except Exception:
+            fields['status'] = 'error'
+            raise
+        finally:
+            self.record(endpoint, time.time() - start, **fields)
+
+    def summary(self):
+        lines = ['%-50s %6s %6s %5s %8s %8s %8s %10s' % (
+            'endpoint', 'count', 'errors', 'hits', 'p50', 'p90', 'p99', 'KB')]
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda e: -sum(e[1]['latency']))
+            for name, stats in endpoints:
+                latency = sorted(stats['latency'])
+                if latency:
+                    percentiles = '%8.3f %8.3f %8.3f' % (percentile(latency, 50), percentile(latency, 90), percentile(latency, 99))
+                else:
+                    percentiles = '%8s %8s %8s' % ('-', '-', '-')
+                lines.append('%-50s %6d %6d %5d %s %10.1f' % (
+                    name[:50], stats['count'], stats['errors'], stats['hits'], percentiles, stats['bytes'] / 1024.0))
+        return '\n'.join(lines)
+
+    def close(self):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.close()
+            self.file = None
+        print >>sys.stderr, self.summary()
+
+
+tracer = Tracer(getattr(config, 'TRACE_FILE', None))
+record = tracer.record
+span = tracer.span
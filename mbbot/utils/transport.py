@@ -0,0 +1,159 @@
+import time
+import gzip
+import errno
+import socket
+import httplib
+import urllib
+import urllib2
+import threading
+from StringIO import StringIO
+import config
+from mbbot.utils import trace
+
+# User-Agent sent by all HTTP clients of the bot, clients that identify the
+# bot account (MusicBrainzClient) append their contact details to it
+USER_AGENT = getattr(config, 'WWW_USER_AGENT', None) or 'musicbrainz-bot/1.0'
+
+
+class ConnectionPool(object):
+    # Idle keep-alive connections by scheme and host, shared by all openers
+    # in the process
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, scheme, host, timeout):
+        # Returns tuple (connection, reused)
+        with self.lock:
+            idle = self.idle.get((scheme, host))
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            # the connection might have been used with another timeout
+            if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                timeout = socket.getdefaulttimeout()
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, timeout=timeout), False
+        return httplib.HTTPConnection(host, timeout=timeout), False
+
+    def put(self, scheme, host, conn):
+        with self.lock:
+            idle = self.idle.setdefault((scheme, host), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def clear(self, scheme, host):
+        with self.lock:
+            idle = self.idle.pop((scheme, host), [])
+        for conn in idle:
+            conn.close()
+
+
+pool = ConnectionPool()
+
+
+def _unsent(e, sent):
+    # Whether the request failed on a connection the server had already
+    # closed, before the server could have processed any of it: the server
+    # reset the connection while it was sent, or closed it without a
+    # response (which it doesn't do to a request it has read)
+    if isinstance(e, httplib.BadStatusLine):
+        return e.line in ('', "''") or e.line.startswith('No status line')
+    if isinstance(e, socket.timeout):
+        return False
+    return not sent and isinstance(e, socket.error) and e.errno in (errno.ECONNRESET, errno.EPIPE)
+
+
+class KeepAliveHandler(urllib2.BaseHandler):
+    """Opens HTTP(S) requests on persistent connections from the shared pool
+    and asks for gzip compressed responses, which are decompressed before
+    they are returned. Works with urllib2 and mechanize openers, it runs
+    before their own HTTP handlers.
+
+    The whole response is read before it is returned, so that the connection
+    can go back to the pool right away. A request that fails on a reused
+    connection is sent again on a new one if it is a GET or HEAD, other
+    requests only if the server can't have seen them."""
+
+    handler_order = 400
+
+    def __init__(self, pool=pool):
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open('http', req)
+
+    def https_open(self, req):
+        return self._open('https', req)
+
+    def _open(self, scheme, req):
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for (k, v) in req.headers.items() if k not in headers)
+        headers = dict((k.title(), v) for (k, v) in headers.items())
+        headers['Connection'] = 'keep-alive'
+        headers['Accept-Encoding'] = 'gzip'
+        data = req.get_data() if req.has_data() else None
+        timeout = getattr(req, 'timeout', None)
+        if not isinstance(timeout, (int, float)):
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        method = req.get_method()
+        start = time.time()
+        while True:
+            conn, reused = self.pool.get(scheme, host, timeout)
+            sent = False
+            try:
+                conn.request(method, req.get_selector(), data, headers)
+                sent = True
+                resp = conn.getresponse()
+                body = resp.read()
+                break
+            except (httplib.HTTPException, socket.error), e:
+                conn.close()
+                if not reused or not (method in ('GET', 'HEAD') or _unsent(e, sent)):
+                    trace.record(trace.endpoint(req.get_full_url()), time.time() - start, 'error')
+                    raise urllib2.URLError(e)
+                # the server closed the idle connection, so will it have
+                # closed the others
+                self.pool.clear(scheme, host)
+        trace.record(trace.endpoint(req.get_full_url()), time.time() - start, resp.status, len(body))
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.put(scheme, host, conn)
+        if resp.getheader('content-encoding', '').lower() == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+            del resp.msg['content-encoding']
+            del resp.msg['content-length']
+            resp.msg['Content-Length'] = str(len(body))
+        result = urllib.addinfourl(StringIO(body), resp.msg, req.get_full_url())
+        result.code = resp.status
+        result.msg = resp.reason
+        return result
+
+
+def build_opener(*handlers):
+    """urllib2.build_opener() with the shared keep-alive connections and
+    User-Agent."""
+    opener = urllib2.build_opener(KeepAliveHandler(), *handlers)
+    opener.addheaders = [('User-Agent', USER_AGENT)]
+    return opener
+
+
+_opener = None
+
+
+def urlopen(url, data=None):
+    global _opener
+    if _opener is None:
+        _opener = build_opener()
+    return _opener.open(url, data)
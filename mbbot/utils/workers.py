@@ -0,0 +1,82 @@
+import sys
+import threading
+import Queue
+
+
+class Future(object):
+    # Result of a task submitted to a WorkerPool, result() blocks until the
+    # task has finished and re-raises its exception if it failed
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exc_info(self, exc_info):
+        self._exc_info = exc_info
+        self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def exception(self, timeout=None):
+        self.wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise Exception('timed out waiting for the result')
+
+    def result(self, timeout=None):
+        self.wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class WorkerPool(object):
+    # Fixed number of worker threads, each with its own state object (e.g. a
+    # HTTP session) that is passed as the first argument to every task it runs
+
+    def __init__(self, states, queue_size=None):
+        self.tasks = Queue.Queue(queue_size or len(states) * 2)
+        self.threads = []
+        for state in states:
+            thread = threading.Thread(target=self._run, args=(state,))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self, state):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                future, func, args, kwargs = task
+                try:
+                    future.set_result(func(state, *args, **kwargs))
+                except Exception:
+                    future.set_exc_info(sys.exc_info())
+            finally:
+                self.tasks.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        # Blocks if the queue is full, so producers can't run too far ahead
+        future = Future()
+        self.tasks.put((future, func, args, kwargs))
+        return future
+
+    def join(self):
+        self.tasks.join()
+
+    def close(self):
+        for thread in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,140 @@
+import time
+import json
+import urllib
+import urllib2
+import threading
+from simplemediawiki import MediaWiki
+import config as cfg
+from mbbot.utils import transport
+
+# Defaults for WP_API_URL and SOLR_URL in config.py, which can point the bots
+# to other servers, e.g. the stand-ins from bench/
+DEFAULT_WP_API_URL = 'http://%s.wikipedia.org/w/api.php'
+DEFAULT_SOLR_URL = 'http://localhost:8983/solr/wikipedia%s'
+
+# Requests wait while the replication lag of the wiki's databases is over
+# this many seconds, as the API etiquette asks of bots
+DEFAULT_MAXLAG = 5
+DEFAULT_MIN_INTERVAL = 0.2
+
+
+def api_url(lang):
+    return getattr(cfg, 'WP_API_URL', DEFAULT_WP_API_URL) % (lang,)
+
+
+def solr_url(lang):
+    suffix = '_' + lang if lang != 'en' else ''
+    return getattr(cfg, 'SOLR_URL', DEFAULT_SOLR_URL) % (suffix,)
+
+
+class Throttle(object):
+    """Spacing between the requests to one wiki, adjusted to how the wiki
+    is doing.
+
+    Every fast response takes `step` off the interval, down to
+    min_interval. A response is fast if it took less than `fast` seconds
+    plus the time to transfer it at `rate` bytes per second, so that big
+    batches of pages don't count as slow; slower responses leave the
+    interval as it is. Only lag errors and 429/503 responses make it longer:
+    they double it and hold all requests back until the time given by
+    Retry-After has passed.
+    """
+
+    def __init__(self, interval=1.0, min_interval=DEFAULT_MIN_INTERVAL, max_interval=60.0, fast=0.5, rate=200000, step=0.1):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fast = fast
+        self.rate = rate
+        self.step = step
+        self.next_request = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_request)
+            self.next_request = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def success(self, latency, size=0):
+        with self.lock:
+            if latency < self.fast + float(size) / self.rate:
+                self.interval = max(self.min_interval, self.interval - self.step)
+
+    def back_off(self, retry_after=None):
+        with self.lock:
+            self.interval = min(self.max_interval, self.interval * 2)
+            delay = max(retry_after or 0, self.interval)
+            self.next_request = max(self.next_request, time.time() + delay)
+
+
+def retry_after(headers):
+    try:
+        return int(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class WikiAPI(MediaWiki):
+    # MediaWiki client that sends its requests over the shared keep-alive
+    # connections (see mbbot.utils.transport) and spaces them with a
+    # Throttle; requests are retried while the wiki is lagged or busy. The
+    # client can be shared by threads, but only makes one request at a time.
+
+    max_attempts = 10
+
+    def __init__(self, api_url):
+        MediaWiki.__init__(self, api_url, user_agent=transport.USER_AGENT)
+        self._opener = transport.build_opener(urllib2.HTTPCookieProcessor(self._cj))
+        self.maxlag = getattr(cfg, 'WP_MAXLAG', DEFAULT_MAXLAG)
+        self.throttle = Throttle(min_interval=getattr(cfg, 'WP_MIN_INTERVAL', DEFAULT_MIN_INTERVAL))
+        self.request_lock = threading.Lock()
+
+    def _post(self, params):
+        # Returns tuple (headers, body), the body is already decompressed
+        # by the transport
+        data = urllib.urlencode([(k, v.encode('utf8') if isinstance(v, unicode) else v) for (k, v) in params.items()])
+        response = self._opener.open(urllib2.Request(self._api_url, data))
+        try:
+            return response.info(), response.read()
+        finally:
+            response.close()
+
+    def call(self, params):
+        params = dict(params, format='json')
+        if self.maxlag is not None:
+            params.setdefault('maxlag', self.maxlag)
+        for attempt in range(self.max_attempts):
+            self.throttle.wait()
+            try:
+                with self.request_lock:
+                    start = time.time()
+                    headers, data = self._post(params)
+                    latency = time.time() - start
+            except urllib2.HTTPError, e:
+                if e.code not in (429, 503):
+                    raise
+                self.throttle.back_off(retry_after(e.info()))
+                continue
+            result = json.loads(data)
+            if isinstance(result, dict) and result.get('error', {}).get('code') == 'maxlag':
+                self.throttle.back_off(retry_after(headers))
+                continue
+            self.throttle.success(latency, len(data))
+            return result
+        raise Exception('%s is lagged or busy, gave up after %d attempts' % (self._api_url, self.max_attempts))
+
+
+_apis = {}
+_apis_lock = threading.Lock()
+
+
+def get_api(lang):
+    # The client for the Wikipedia of the given language, shared by all
+    # users in the process
+    with _apis_lock:
+        if lang not in _apis:
+            _apis[lang] = WikiAPI(api_url(lang))
+        return _apis[lang]
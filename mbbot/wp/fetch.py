@@ -0,0 +1,84 @@
+import threading
+from utils import get_page_content, get_page_contents, get_page_content_from_cache
+from mbbot.utils.workers import WorkerPool
+from mbbot.wp.api import get_api
+from mbbot.wp.wikipage import WikiPage
+
+
+class PageFetchPool(object):
+    """Fetches Wikipedia pages from worker threads, so that a bot can keep
+    several fetches going while it works on the pages it already has.
+
+    >>> pool = PageFetchPool()
+    >>> future = pool.fetch('http://en.wikipedia.org/wiki/Bj%C3%B6rk')
+    >>> future.result().title
+    u'Bj\\xf6rk'
+
+    The results are the same as those of WikiPage.fetch,
+    utils.get_page_content and utils.get_page_contents, and they use the
+    same cache. Pages found in the cache don't wait for a free connection,
+    at most max_in_flight fetches run at the same time for each Wikipedia
+    (the WikiAPI client still sends their requests one at a time).
+    Concurrent requests for the same pages share one fetch.
+    """
+
+    def __init__(self, size=8, max_in_flight=2):
+        self.max_in_flight = max_in_flight
+        self.in_flight = {}
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.workers = WorkerPool([None] * size)
+
+    def _host_slot(self, lang):
+        with self.lock:
+            if lang not in self.in_flight:
+                self.in_flight[lang] = threading.BoundedSemaphore(self.max_in_flight)
+            return self.in_flight[lang]
+
+    def _get_page_content(self, state, title, lang, use_cache):
+        if use_cache:
+            content = get_page_content_from_cache(title, lang, fresh=True)
+            if content:
+                return content
+        # stale pages are revalidated by get_page_content
+        with self._host_slot(lang):
+            return get_page_content(get_api(lang), title, lang, use_cache)
+
+    def _get_page_contents(self, state, titles, lang, use_cache):
+        with self._host_slot(lang):
+            return get_page_contents(get_api(lang), titles, lang, use_cache)
+
+    def _fetch(self, state, url, use_cache):
+        lang, title = WikiPage.split_url(url)
+        return WikiPage(title, self._get_page_content(state, title, lang, use_cache) or '', lang)
+
+    def _submit(self, key, func, *args):
+        # the workers never take pending_lock, so it can be held while
+        # submit() waits for room in the queue
+        with self.pending_lock:
+            future = self.pending.get(key)
+            if future is None or future.done():
+                for done in [k for (k, f) in self.pending.items() if f.done()]:
+                    del self.pending[done]
+                future = self.pending[key] = self.workers.submit(func, *args)
+            return future
+
+    def get_page_content(self, title, lang, use_cache=True):
+        """Return a Future for utils.get_page_content(wp, title, lang)."""
+        return self._submit(('content', lang, title, use_cache), self._get_page_content, title, lang, use_cache)
+
+    def get_page_contents(self, titles, lang, use_cache=True):
+        """Return a Future for utils.get_page_contents(wp, titles, lang)."""
+        titles = tuple(titles)
+        return self._submit(('contents', lang, titles, use_cache), self._get_page_contents, titles, lang, use_cache)
+
+    def fetch(self, url, use_cache=True):
+        """Return a Future for WikiPage.fetch(url)."""
+        return self._submit(('page', url, use_cache), self._fetch, url, use_cache)
+
+    def join(self):
+        self.workers.join()
+
+    def close(self):
+        self.workers.close()
@@ -0,0 +1,197 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+import config as cfg
+
+# One SQLite file per language in this directory, instead of a file per page
+DEFAULT_CACHE_DIR = 'wiki-cache'
+
+# Cached pages are checked for newer revisions after this many days
+DEFAULT_MAX_AGE = 7
+
+# The last access of a page is only written again after this many seconds,
+# so that reading a page doesn't mean writing to the database every time
+ACCESS_RESOLUTION = 3600
+
+
+def page_key(title):
+    # Same key as the files of the old wiki-cache tree, so pages migrated
+    # from it are found under the same titles
+    return title.encode('utf-8', 'xmlcharrefreplace').replace('/', '_').decode('utf-8')
+
+
+def compress_page(page):
+    # (title, content, revid, fetched) to the (key, data, revid, fetched)
+    # stored by PageStore, done apart so that it can run in other processes
+    title, content, revid, fetched = page
+    return page_key(title), zlib.compress(content.encode('utf8'), 6), revid, fetched
+
+
+class PageStore(object):
+    """zlib compressed page texts of one Wikipedia, in a single SQLite file.
+
+    Every page is stored with the revision it was fetched at and when it was
+    last fetched or found to be unchanged; after max_age seconds it is
+    stale, see utils.revalidate_cached_pages. With max_size (in bytes of
+    compressed text), the least recently used pages are evicted when the
+    store grows over it.
+
+    Every thread gets its own connection, the database is in WAL mode so
+    readers don't wait for a writer in another thread or process.
+    """
+
+    def __init__(self, path, max_size=None, max_age=DEFAULT_MAX_AGE * 86400):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.local = threading.local()
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            dir = os.path.dirname(self.path)
+            if dir and not os.path.isdir(dir):
+                try:
+                    os.makedirs(dir)
+                except OSError:
+                    if not os.path.isdir(dir):
+                        raise
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('CREATE TABLE IF NOT EXISTS page (key TEXT PRIMARY KEY, content BLOB NOT NULL)')
+            columns = set(row[1] for row in db.execute('PRAGMA table_info(page)'))
+            if 'revid' not in columns:
+                # store from before revisions were kept, its pages are all
+                # stale and count as used now
+                db.execute('ALTER TABLE page ADD COLUMN revid INTEGER')
+                db.execute('ALTER TABLE page ADD COLUMN fetched REAL NOT NULL DEFAULT 0')
+                db.execute('ALTER TABLE page ADD COLUMN accessed REAL NOT NULL DEFAULT 0')
+                db.execute('ALTER TABLE page ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+                db.execute('UPDATE page SET accessed = ?, size = length(content)', (time.time(),))
+            db.execute('CREATE INDEX IF NOT EXISTS page_accessed ON page (accessed)')
+            self.local.db = db
+        return db
+
+    def get(self, title, fresh=False):
+        # Returns the content, or None if the page isn't in the store (or
+        # is stale and fresh is true)
+        db = self._db()
+        key = page_key(title)
+        row = db.execute('SELECT content, fetched, accessed FROM page WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        content, fetched, accessed = row
+        now = time.time()
+        if fresh and fetched < now - self.max_age:
+            return None
+        if accessed < now - ACCESS_RESOLUTION:
+            db.execute('UPDATE page SET accessed = ? WHERE key = ?', (now, key))
+        return zlib.decompress(content).decode('utf8')
+
+    def put(self, title, content, revid=None, fetched=None):
+        self.put_many([(title, content, revid, fetched)])
+
+    def put_many(self, pages):
+        # Stores (title, content, revid, fetched) tuples in one transaction,
+        # revid can be None if it isn't known and fetched None for now
+        self.put_compressed_many([compress_page(page) for page in pages])
+
+    def put_compressed_many(self, pages, only_newer=False):
+        # Same as put_many() for pages from compress_page(); with
+        # only_newer, pages already stored at the same or a later revision
+        # are left alone
+        now = time.time()
+        rows = [(key, buffer(data), revid, fetched or now, now, len(data)) for (key, data, revid, fetched) in pages]
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if only_newer:
+                db.executemany('INSERT OR IGNORE INTO page (key, content, revid, fetched, accessed, size) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', rows)
+                db.executemany('UPDATE page SET content = ?, revid = ?, fetched = ?, size = ? '
+                               'WHERE key = ? AND (revid IS NULL OR revid < ?)',
+                               [(data, revid, fetched, size, key, revid) for (key, data, revid, fetched, accessed, size) in rows])
+            else:
+                db.executemany('INSERT OR REPLACE INTO page (key, content, revid, fetched, accessed, size) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        except:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        if self.max_size is not None:
+            with self.lock:
+                self.written += sum(row[5] for row in rows)
+                # check the size after every 1% of it written
+                evict = self.written > self.max_size / 100
+                if evict:
+                    self.written = 0
+            if evict:
+                self.evict()
+
+    def stale(self, titles):
+        # Returns {title: (revid, fetched)} of the given titles that are in
+        # the store but haven't been checked for max_age seconds
+        db = self._db()
+        result = {}
+        limit = time.time() - self.max_age
+        for title in titles:
+            row = db.execute('SELECT revid, fetched FROM page WHERE key = ?', (page_key(title),)).fetchone()
+            if row is not None and row[1] < limit:
+                result[title] = row
+        return result
+
+    def mark_fresh(self, revids):
+        # The pages of {title: revid} are unchanged on the wiki
+        now = time.time()
+        self._db().executemany('UPDATE page SET fetched = ?, revid = ? WHERE key = ?',
+                               [(now, revid, page_key(title)) for (title, revid) in revids.items()])
+
+    def delete(self, titles):
+        self._db().executemany('DELETE FROM page WHERE key = ?', [(page_key(t),) for t in titles])
+
+    def size(self):
+        return self._db().execute('SELECT coalesce(sum(size), 0) FROM page').fetchone()[0]
+
+    def evict(self):
+        # Remove the least recently used pages until the store is 10% under
+        # max_size
+        db = self._db()
+        size = self.size()
+        if size <= self.max_size:
+            return
+        excess = size - self.max_size * 0.9
+        keys = []
+        cursor = db.execute('SELECT key, size FROM page ORDER BY accessed')
+        for key, page_size in cursor:
+            keys.append((key,))
+            excess -= page_size
+            if excess <= 0:
+                break
+        cursor.close()
+        db.executemany('DELETE FROM page WHERE key = ?', keys)
+
+    def __contains__(self, title):
+        return self._db().execute('SELECT 1 FROM page WHERE key = ?', (page_key(title),)).fetchone() is not None
+
+    def __len__(self):
+        return self._db().execute('SELECT count(*) FROM page').fetchone()[0]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(wp_lang, cache_dir=DEFAULT_CACHE_DIR):
+    # The store for the given language, shared by all users in the process
+    path = os.path.join(cache_dir, '%s.db' % (wp_lang,))
+    with _stores_lock:
+        if path not in _stores:
+            max_size = getattr(cfg, 'WIKI_CACHE_MAX_SIZE', None)
+            max_age = getattr(cfg, 'WIKI_CACHE_MAX_AGE', DEFAULT_MAX_AGE)
+            _stores[path] = PageStore(path, max_size * 1024 * 1024 if max_size else None, max_age * 86400)
+        return _stores[path]
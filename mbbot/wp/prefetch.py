@@ -0,0 +1,27 @@
+from collections import deque
+
+
+def prefetch(pool, wp_lang, entities, candidates, lookahead=10):
+    """Yields (entity, titles, contents) for each of the entities, where
+    titles is what candidates(entity) returns, e.g. the Wikipedia pages found
+    in Solr, and contents is {title: content} of those pages as returned by
+    utils.get_page_contents.
+
+    The pages of the next `lookahead` entities are fetched in the background
+    by the mbbot.wp.fetch.PageFetchPool, while the caller works on the
+    current one. candidates() runs in the calling thread, so it can use the
+    same connections as the caller.
+    """
+    pending = deque()
+    entities = iter(entities)
+    while True:
+        while len(pending) <= lookahead:
+            entity = next(entities, None)
+            if entity is None:
+                break
+            titles = candidates(entity)
+            pending.append((entity, titles, pool.get_page_contents(titles, wp_lang)))
+        if not pending:
+            break
+        entity, titles, future = pending.popleft()
+        yield entity, titles, future.result()
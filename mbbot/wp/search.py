@@ -0,0 +1,21 @@
+from StringIO import StringIO
+import solr
+from mbbot.utils import trace
+from mbbot.wp.api import solr_url
+
+
+class TracedSolrConnection(solr.SolrConnection):
+    # Records the Solr requests with mbbot.utils.trace
+
+    def _post(self, url, body, headers):
+        with trace.span(trace.endpoint('%s://%s%s' % (self.scheme, self.host, url))) as span:
+            response = solr.SolrConnection._post(self, url, body, headers)
+            data = response.read()
+            span['status'] = response.status
+            span['bytes'] = len(data)
+        return StringIO(data)
+
+
+def solr_connection(lang):
+    # Connection to the Solr index of Wikipedia titles in the given language
+    return TracedSolrConnection(solr_url(lang))
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import re
-from simplemediawiki import MediaWiki
 from utils import mw_remove_markup, get_page_content, extract_page_title
+from mbbot.wp.api import get_api
 
 category_re = {}
 category_re['en'] = re.compile(r'\[\[Category:(.+?)(?:\|.*?)?\]\]')
@@ -76,10 +76,15 @@ class WikiPage(object):
         page = mw_remove_markup(page)
         return page.strip().split('\n\n')[0]
 
-    @classmethod
-    def fetch(cls, url, use_cache=True):
+    @staticmethod
+    def split_url(url):
+        # Returns tuple (lang, title) of a Wikipedia page URL
         m = re.match(r'^http://([a-z]{2})\.wikipedia\.org', url)
         page_lang = m.group(1).encode('utf8')
-        page_title = extract_page_title(url, page_lang)
-        wp = MediaWiki('http://%s.wikipedia.org/w/api.php' % page_lang)
+        return page_lang, extract_page_title(url, page_lang)
+
+    @classmethod
+    def fetch(cls, url, use_cache=True):
+        page_lang, page_title = cls.split_url(url)
+        wp = get_api(page_lang)
         return cls(page_title, get_page_content(wp, page_title, page_lang, use_cache) or '', page_lang)
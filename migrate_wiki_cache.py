@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""Move the pages of the old wiki-cache tree (one file per page in
+wiki-cache/<lang>/<first byte>/<key>) into the page store of each language,
+wiki-cache/<lang>.db.
+
+    migrate_wiki_cache.py [--delete] [lang...]
+
+The files are only deleted with --delete, after their batch is stored, so
+an interrupted migration can simply be started again.
+"""
+
+import os
+from optparse import OptionParser
+from mbbot.wp.pagestore import DEFAULT_CACHE_DIR, PageStore
+from utils import out
+
+
+def migrate(lang_dir, store, batch_size, delete):
+    migrated = 0
+    for bucket in sorted(os.listdir(lang_dir)):
+        bucket_dir = os.path.join(lang_dir, bucket)
+        if not os.path.isdir(bucket_dir):
+            continue
+        names = sorted(os.listdir(bucket_dir))
+        for i in range(0, len(names), batch_size):
+            batch = names[i:i + batch_size]
+            pages = []
+            for name in batch:
+                # the file name is the page key, which page_key() returns
+                # unchanged for the title it was made from; the revision
+                # isn't known, the page is checked against the time it
+                # was written
+                path = os.path.join(bucket_dir, name)
+                pages.append((name.decode('utf8'), open(path).read().decode('utf8'), None, os.path.getmtime(path)))
+            store.put_many(pages)
+            if delete:
+                for name in batch:
+                    os.unlink(os.path.join(bucket_dir, name))
+            migrated += len(batch)
+        if delete:
+            os.rmdir(bucket_dir)
+    if delete:
+        os.rmdir(lang_dir)
+    return migrated
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [lang...]')
+    parser.add_option('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_option('--batch-size', type='int', default=1000)
+    parser.add_option('--delete', action='store_true', help='delete the files once they are in the page store')
+    options, langs = parser.parse_args()
+    if not langs:
+        langs = sorted(name for name in os.listdir(options.cache_dir)
+                       if os.path.isdir(os.path.join(options.cache_dir, name)))
+    for lang in langs:
+        store = PageStore(os.path.join(options.cache_dir, '%s.db' % (lang,)))
+        migrated = migrate(os.path.join(options.cache_dir, lang), store, options.batch_size, options.delete)
+        out('%s: migrated %d pages, %d in the page store' % (lang, migrated, len(store)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import time
+from optparse import OptionParser
+import sqlalchemy
+from editing import MusicBrainzClient, EditBuffer
+from editqueue import EditQueue, insert_processed
+from mbbot.precheck import EditPrecheck
+from mbbot.utils.pidfile import PIDFile
+from mbbot.utils.errors import error_text
+from utils import out, colored_out, bcolors
+import config as cfg
+
+# Edits that EditBuffer can combine with other changes to the same entity
+buffered_methods = set(['edit_artist', 'set_release_script', 'set_release_language', 'set_release_medium_format'])
+
+
+def buffer_key(method, args):
+    if method == 'edit_artist':
+        return ('artist', args[0]['gid'])
+    return ('release', args[0])
+
+
+def finish(queue, db, id, result):
+    # Marks the entity of a submitted edit as processed in the bot's table.
+    # Edits that failed, or were skipped (None), e.g. because the entity has
+    # pending edits, leave it unmarked, so the bot looks at it again.
+    if isinstance(result, Exception):
+        queue.finish(id, result)
+        return
+    queue.finish(id)
+    processed = queue.processed(id)
+    if processed is None or result is None:
+        return
+    insert_processed(db, *processed)
+
+
+def finish_buffered(queue, db, pending, results):
+    for kind, mbid, result in results:
+        for id in pending.pop((kind, mbid), []):
+            finish(queue, db, id, result)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--once', action='store_true', help='exit when the queue is empty')
+    parser.add_option('--retry-failed', action='store_true', help='try the edits that failed before again')
+    parser.add_option('--window', type='int', default=300, help='seconds to wait for more changes to the same entity')
+    parser.add_option('--poll', type='int', default=60, help='seconds to wait for new edits when the queue is empty')
+    options, args = parser.parse_args()
+
+    engine = sqlalchemy.create_engine(cfg.MB_DB)
+    db = engine.connect()
+    db.execute("SET search_path TO musicbrainz")
+
+    editor_id = getattr(cfg, 'MB_EDITOR_ID', None)
+    mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE, editor_id=editor_id, precheck=EditPrecheck(db))
+    queue = EditQueue()
+    queue.reset(failed=options.retry_failed)
+    buffer = EditBuffer(mb, window=options.window)
+    pending = {}
+
+    out('queued edits: %s' % (', '.join('%s %d' % item for item in sorted(queue.counts().items())) or 'none',))
+    while True:
+        if editor_id is not None:
+            normal_edits_left, edits_left = mb.edits_left()
+            if normal_edits_left <= 0:
+                out('no edits left for today, waiting')
+                time.sleep(options.poll * 10)
+                continue
+        edits = queue.take()
+        for id, method, args, kwargs in edits:
+            out('submitting #%d %s' % (id, method))
+            if method in buffered_methods:
+                key = buffer_key(method, args)
+                pending.setdefault(key, []).append(id)
+                finish_buffered(queue, db, pending, getattr(buffer, method)(*args, **kwargs))
+                continue
+            try:
+                result = getattr(mb, method)(*args, **kwargs)
+            except Exception, e:
+                colored_out(bcolors.FAIL, u' * edit failed: %s' % (error_text(e),))
+                result = e
+            finish(queue, db, id, result)
+        finish_buffered(queue, db, pending, buffer.flush(force=not edits and options.once))
+        if not edits:
+            if options.once and not pending:
+                break
+            time.sleep(options.poll)
+
+    out('queued edits: %s' % (', '.join('%s %d' % item for item in sorted(queue.counts().items())),))
+
+if __name__ == '__main__':
+    with PIDFile('/tmp/mbbot_submit_edits.pid'):
+        main()
@@ -0,0 +1,12 @@
+import os
+import sys
+import imp
+
+# The tests run from the directory with Scripts.txt (see README.md); without
+# a config.py, the defaults from config.py.dist are used
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+try:
+    imp.find_module('config')
+except ImportError:
+    sys.modules['config'] = imp.load_source('config', os.path.join(root, 'config.py.dist'))
+
@@ -0,0 +1,60 @@
+import urlparse
+import threading
+import BaseHTTPServer
+
+
+class FakeClock(object):
+    # Stands in for the time module, sleeping just moves the clock forward
+
+    def __init__(self, now=1000000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeServer(object):
+    # HTTP server on a local port for the tests of the clients. Every
+    # request is answered by handle(method, path, params, headers), which
+    # returns tuple (code, headers, body)
+
+    def __init__(self, handle):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self.answer(None)
+
+            def do_POST(self):
+                self.answer(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+            def answer(self, body):
+                url = urlparse.urlparse(self.path)
+                params = urlparse.parse_qsl(url.query, keep_blank_values=True)
+                if body is not None:
+                    params += urlparse.parse_qsl(body, keep_blank_values=True)
+                code, headers, body = handle(self.command, url.path, params, self.headers)
+                self.send_response(code)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % (self.server.server_address[1],)
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,107 @@
+import json
+import urllib2
+import unittest
+from StringIO import StringIO
+from mimetools import Message
+from tests.support import FakeClock
+from mbbot.wp import api
+from mbbot.wp.api import Throttle, WikiAPI, retry_after
+
+
+class ThrottleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time, api.time = api.time, self.clock
+
+    def tearDown(self):
+        api.time = self.time
+
+    def test_wait(self):
+        throttle = Throttle(interval=2.0)
+        throttle.wait()
+        throttle.wait()
+        self.clock.now += 0.5
+        throttle.wait()
+        self.assertEqual(self.clock.slept, [2.0, 1.5])
+
+    def test_success(self):
+        throttle = Throttle(interval=1.0, min_interval=0.75, fast=0.5, rate=1000, step=0.1)
+        throttle.success(0.2)
+        self.assertAlmostEqual(throttle.interval, 0.9)
+        # slow responses leave the interval as it is
+        throttle.success(0.6)
+        self.assertAlmostEqual(throttle.interval, 0.9)
+        # unless they were slow because they were big
+        throttle.success(0.6, size=1000)
+        self.assertAlmostEqual(throttle.interval, 0.8)
+        throttle.success(0.1)
+        self.assertEqual(throttle.interval, 0.75)
+
+    def test_back_off(self):
+        throttle = Throttle(interval=1.0, max_interval=3.0)
+        throttle.back_off()
+        self.assertEqual(throttle.interval, 2.0)
+        self.assertEqual(throttle.next_request, self.clock.now + 2.0)
+        throttle.back_off(retry_after=10)
+        self.assertEqual(throttle.interval, 3.0)
+        throttle.wait()
+        self.assertEqual(self.clock.slept, [10])
+
+    def test_retry_after(self):
+        self.assertEqual(retry_after({'Retry-After': '5'}), 5)
+        self.assertEqual(retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}), None)
+        self.assertEqual(retry_after({}), None)
+
+
+class FakeWikiAPI(WikiAPI):
+    # Answers with the given responses: an HTTP status code or a result
+
+    def __init__(self, responses):
+        WikiAPI.__init__(self, 'http://en.wikipedia.org/w/api.php')
+        self.responses = list(responses)
+        self.requests = []
+
+    def _post(self, params):
+        self.requests.append(params)
+        response = self.responses.pop(0)
+        if isinstance(response, int):
+            headers = Message(StringIO('Retry-After: 5\r\n\r\n'))
+            raise urllib2.HTTPError(self._api_url, response, 'Busy', headers, StringIO(''))
+        return {}, json.dumps(response)
+
+
+class WikiAPICallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time, api.time = api.time, self.clock
+
+    def tearDown(self):
+        api.time = self.time
+
+    def test_call(self):
+        wp = FakeWikiAPI([{'query': {}}])
+        self.assertEqual(wp.call({'action': 'query'}), {'query': {}})
+        self.assertEqual(wp.requests, [{'action': 'query', 'format': 'json', 'maxlag': wp.maxlag}])
+
+    def test_busy(self):
+        lagged = {'error': {'code': 'maxlag', 'info': 'Waiting for a database server'}}
+        wp = FakeWikiAPI([503, lagged, {'query': {}}])
+        self.assertEqual(wp.call({'action': 'query'}), {'query': {}})
+        self.assertEqual(len(wp.requests), 3)
+        # the wiki asked to wait 5 seconds after the 503
+        self.assertEqual(self.clock.slept[0], 5)
+
+    def test_give_up(self):
+        wp = FakeWikiAPI([429] * WikiAPI.max_attempts)
+        self.assertRaises(Exception, wp.call, {'action': 'query'})
+        self.assertEqual(len(wp.requests), WikiAPI.max_attempts)
+
+    def test_error(self):
+        wp = FakeWikiAPI([404])
+        self.assertRaises(urllib2.HTTPError, wp.call, {'action': 'query'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+import os
+import shutil
+import tempfile
+import unittest
+import mechanize
+from tests.support import FakeServer
+from editing import MusicBrainzClient, SessionExpired, EditError, FormSchema, FormSchemaCache
+
+LOGIN_FORM = ('<html><body><form method="POST" action="/login">'
+              '<input name="username" /><input type="password" name="password" /></form></body></html>')
+
+
+class FakeMusicBrainz(object):
+    # Logs users in and answers the pages in routes, a function of (method,
+    # params) for each path, when the request has a valid session cookie.
+    # With expire set, no session is valid.
+
+    def __init__(self):
+        self.server = FakeServer(self.handle)
+        self.url = self.server.url
+        self.routes = {}
+        self.sessions = set()
+        self.expire = False
+        self.logins = 0
+        # (method, path, params, session) of each request
+        self.requests = []
+
+    def close(self):
+        self.server.close()
+
+    def session(self, headers):
+        for part in headers.get('Cookie', '').split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == 'session' and value in self.sessions and not self.expire:
+                return value
+        return None
+
+    def handle(self, method, path, params, headers):
+        session = self.session(headers)
+        self.requests.append((method, path, params, session))
+        if path == '/login':
+            if method == 'GET':
+                return 200, [], LOGIN_FORM
+            self.logins += 1
+            session = str(self.logins)
+            self.sessions.add(session)
+            return 302, [('Location', self.url + '/user/' + dict(params)['username']),
+                         ('Set-Cookie', 'session=%s; Path=/' % (session,))], ''
+        if path.startswith('/user/'):
+            return 200, [], '<html><body>user</body></html>'
+        if session is None:
+            return 302, [('Location', self.url + '/login?uri=' + path)], ''
+        return self.routes[path](method, params)
+
+    def posts(self, path):
+        # (params, session) of the POST requests to path
+        return [(params, session) for (method, p, params, session) in self.requests if method == 'POST' and p == path]
+
+
+def page(text):
+    return lambda method, params: (200, [], '<html><body>%s</body></html>' % (text,))
+
+
+class ClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.mb = FakeMusicBrainz()
+
+    def tearDown(self):
+        self.mb.close()
+        shutil.rmtree(self.dir)
+
+    def client(self):
+        return MusicBrainzClient('bot', 'secret', self.mb.url, cookie_file=os.path.join(self.dir, 'cookies'),
+                                 rate_limits={}, rate_limit_file=os.path.join(self.dir, 'ratelimit.json'))
+
+
+class SessionTest(ClientTestCase):
+
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.mb.routes['/page'] = page('page')
+        self.mb.routes['/edit'] = lambda method, params: (303, [('Location', self.mb.url + '/artist')], '')
+
+    def test_login_once(self):
+        client = self.client()
+        self.assertFalse(client.logged_in)
+        client._open(self.mb.url + '/page')
+        client._open(self.mb.url + '/page')
+        self.assertEqual(self.mb.logins, 1)
+        # the next run reuses the saved session
+        client = self.client()
+        self.assertTrue(client.logged_in)
+        self.assertTrue('page' in client._open(self.mb.url + '/page').read())
+        self.assertEqual(self.mb.logins, 1)
+
+    def test_expired(self):
+        client = self.client()
+        client._open(self.mb.url + '/page')
+        self.mb.sessions.clear()
+        self.assertTrue('page' in client._open(self.mb.url + '/page').read())
+        self.assertEqual(self.mb.logins, 2)
+        self.assertEqual(client._post_edit(self.mb.url + '/edit', 'a=1'), (self.mb.url + '/artist', None))
+        self.assertEqual(self.mb.logins, 2)
+
+    def test_expired_edit(self):
+        client = self.client()
+        client._open(self.mb.url + '/page')
+        self.mb.sessions.clear()
+        self.assertEqual(client._post_edit(self.mb.url + '/edit', 'a=1'), (self.mb.url + '/artist', None))
+        # only the edit is sent again, with the new session
+        self.assertEqual(self.mb.posts('/edit'), [([('a', '1')], None), ([('a', '1')], '2')])
+
+    def test_expired_again(self):
+        client = self.client()
+        self.mb.expire = True
+        self.assertRaises(SessionExpired, client._post_edit, self.mb.url + '/edit', 'a=1')
+        self.assertRaises(SessionExpired, client._open, self.mb.url + '/page')
+        self.assertEqual(self.mb.posts('/edit'), [([('a', '1')], None), ([('a', '1')], None)])
+
+
+class RequestEditTest(ClientTestCase):
+
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.editor = self.client()
+        self.mb.routes['/artist'] = page('Thank you')
+
+    def route(self, path, post):
+        # path answers POSTs with post, other requests with a page
+        def answer(method, params):
+            if method == 'POST':
+                return post
+            return 200, [], '<html><body>form, %s</body></html>' % (self.mb.url + path,)
+        self.mb.routes[path] = answer
+
+    def requested(self, path):
+        return [method for (method, p, params, session) in self.mb.requests if p == path]
+
+    def test_redirect(self):
+        self.route('/edit', (303, [('Location', '/artist')], ''))
+        self.assertEqual(self.editor._post_edit(self.mb.url + '/edit', 'a=1'), (self.mb.url + '/artist', None))
+        # the entity page isn't downloaded
+        self.assertEqual(self.requested('/artist'), [])
+
+    def test_redirect_back(self):
+        # errors are shown on the page that was posted to
+        self.route('/edit', (302, [('Location', self.mb.url + '/edit')], ''))
+        location, page = self.editor._post_edit(self.mb.url + '/edit', 'a=1')
+        self.assertEqual(location, None)
+        self.assertTrue('form, %s/edit' % (self.mb.url,) in page)
+        self.assertEqual(self.requested('/edit'), ['POST', 'GET'])
+
+    def test_page(self):
+        self.route('/edit', (200, [], '<html><body>error</body></html>'))
+        self.assertEqual(self.editor._post_edit(self.mb.url + '/edit', 'a=1'), (None, '<html><body>error</body></html>'))
+
+    def test_error(self):
+        self.route('/edit', (500, [], 'server error'))
+        self.assertRaises(mechanize.HTTPError, self.editor._post_edit, self.mb.url + '/edit', 'a=1')
+        # redirects are followed again after a failed edit
+        self.mb.routes['/moved'] = lambda method, params: (302, [('Location', self.mb.url + '/artist')], '')
+        self.assertTrue('Thank you' in self.editor._open(self.mb.url + '/moved').read())
+
+
+FORM = '''<html><body><form method="POST" action="%(action)s">%(hidden)s
+<select name="link_type"><option value="1">1</option><option value="2">2</option></select>
+<input name="url" value="" /><textarea name="edit_note"></textarea>
+</form></body></html>'''
+
+
+def form(url, hidden='', action=None):
+    html = FORM % {'action': action or url, 'hidden': hidden}
+    browser = mechanize.Browser()
+    browser.set_response(mechanize.make_response(html, [('Content-Type', 'text/html')], url, 200, 'OK'))
+    return list(browser.forms())[0]
+
+
+class FormSchemaTest(unittest.TestCase):
+
+    def test_can_post(self):
+        schema = FormSchema(form('http://mb/create'), 'http://mb/create')
+        self.assertTrue(schema.can_post([('link_type', ['1']), ('url', 'x')], 'http://mb/create'))
+        self.assertFalse(schema.can_post([('link_type', ['3'])], 'http://mb/create'))
+        self.assertFalse(schema.can_post([('other', 'x')], 'http://mb/create'))
+        # without hidden fields, the form is the same at every URL
+        self.assertTrue(schema.can_post([('url', 'x')], 'http://mb/create?entity=b'))
+        self.assertEqual(schema.encode([('link_type', ['1', '2']), ('url', 'x')]), 'link_type=1&link_type=2&url=x')
+
+    def test_elsewhere(self):
+        schema = FormSchema(form('http://mb/create', action='http://mb/post'), 'http://mb/create')
+        self.assertFalse(schema.can_post([('url', 'x')], 'http://mb/create'))
+
+    def test_hidden(self):
+        cache = FormSchemaCache()
+        hidden = '<input type="hidden" name="entity" value="a" />'
+        cache.learn('create', form('http://mb/create?entity=a', hidden), 'http://mb/create?entity=a')
+        self.assertFalse(cache.get('create').can_post([('url', 'x')], 'http://mb/create?entity=a'))
+        # stable once it was seen twice with the same values
+        cache.learn('create', form('http://mb/create?entity=a', hidden), 'http://mb/create?entity=a')
+        schema = cache.get('create')
+        self.assertTrue(schema.can_post([('url', 'x')], 'http://mb/create?entity=a'))
+        self.assertFalse(schema.can_post([('url', 'x')], 'http://mb/create?entity=b'))
+        self.assertEqual(schema.encode([('url', 'x')]), 'entity=a&url=x')
+        cache.learn('create', form('http://mb/create?entity=b', hidden.replace('"a"', '"b"')), 'http://mb/create?entity=b')
+        self.assertFalse(cache.get('create').stable)
+        cache.forget('create')
+        self.assertEqual(cache.get('create'), None)
+
+
+class PostFormTest(ClientTestCase):
+
+    def setUp(self):
+        ClientTestCase.setUp(self)
+        self.editor = self.client()
+        self.editor.form_schemas = FormSchemaCache()
+        self.hidden = False
+        # answers to the next POSTs, then the edits are entered
+        self.responses = []
+        self.posted = []
+        self.mb.routes['/create'] = self.create
+
+    def create(self, method, params):
+        entity = dict(params).get('entity', '')
+        if method == 'POST':
+            self.posted.append(sorted(params))
+            if self.responses:
+                return self.responses.pop(0)
+            return 303, [('Location', self.mb.url + '/url/' + entity)], ''
+        hidden = '<input type="hidden" name="entity" value="%s" />' % (entity,) if self.hidden else ''
+        return 200, [], FORM % {'action': '/create?entity=' + entity, 'hidden': hidden}
+
+    def post(self, entity, values=(('link_type', ['1']), ('url', 'http://example.com/')), **kwargs):
+        return self.editor._post_form('create', self.mb.url + '/create?entity=' + entity,
+                                      lambda f: f.method == 'POST', list(values), **kwargs)
+
+    def requested(self):
+        # methods of the requests to the form since the last call
+        methods = [method for (method, path, params, session) in self.mb.requests if path == '/create']
+        del self.mb.requests[:]
+        return methods
+
+    def test_direct(self):
+        self.assertEqual(self.post('a'), (self.mb.url + '/url/a', None))
+        self.assertEqual(self.requested(), ['GET', 'POST'])
+        self.assertEqual(self.post('b'), (self.mb.url + '/url/b', None))
+        self.assertEqual(self.requested(), ['POST'])
+        self.assertEqual(self.posted[-1], [('entity', 'b'), ('link_type', '1'), ('url', 'http://example.com/')])
+
+    def test_optional(self):
+        self.post('a')
+        self.post('b', values=[('url', 'x'), ('as_auto_editor', '1')], optional=['as_auto_editor'])
+        self.assertEqual(self.requested(), ['GET', 'POST', 'POST'])
+        # values the form doesn't have are tried on the form
+        self.assertRaises(mechanize.ItemNotFoundError, self.post, 'c', values=[('link_type', ['3'])])
+        self.assertEqual(self.requested(), ['GET'])
+
+    def test_hidden(self):
+        self.hidden = True
+        self.post('a')
+        self.post('a')
+        self.assertEqual(self.requested(), ['GET', 'POST', 'GET', 'POST'])
+        self.post('a')
+        self.assertEqual(self.requested(), ['POST'])
+        # the hidden values of one entity aren't sent for another
+        self.post('b')
+        self.assertEqual(self.requested(), ['GET', 'POST'])
+        self.assertTrue(('entity', 'b') in self.posted[-1])
+
+    def test_unexpected(self):
+        self.post('a')
+        self.requested()
+        self.responses = [(200, [], '<html><body>something else</body></html>')]
+        # without exists(), the edit is never sent twice
+        self.assertRaises(EditError, self.post, 'b')
+        self.assertEqual(self.requested(), ['POST'])
+        self.assertEqual(self.editor.form_schemas.get('create'), None)
+
+    def test_unexpected_exists(self):
+        self.post('a')
+        self.requested()
+        self.responses = [(200, [], '<html><body>something else</body></html>')]
+        self.assertEqual(self.post('b', exists=lambda: self.mb.url + '/url/b'), (self.mb.url + '/url/b', None))
+        self.assertEqual(self.requested(), ['POST'])
+
+    def test_expected_page(self):
+        self.post('a')
+        self.requested()
+        self.responses = [(200, [], '<html><body>added</body></html>')]
+        self.assertEqual(self.post('b', expect=['added']), (None, '<html><body>added</body></html>'))
+        self.assertEqual(self.requested(), ['POST'])
+        self.assertNotEqual(self.editor.form_schemas.get('create'), None)
+
+    def test_unexpected_missing(self):
+        self.post('a')
+        self.requested()
+        self.responses = [(200, [], '<html><body>something else</body></html>')]
+        # the edit wasn't entered, so it is sent again through the form
+        self.assertEqual(self.post('b', exists=lambda: None), (self.mb.url + '/url/b', None))
+        self.assertEqual(self.requested(), ['POST', 'GET', 'POST'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import unittest
+from datetime import timedelta
+from tests.support import FakeClock
+import editing
+from editing import parse_edit_list, EditIndex, EditQuota, EditBuffer
+
+
+def edit_list_page(edits):
+    # Edit list as rendered by the website, newest edit first
+    html = ['<html><body><div class="edit-header">Edits</div>']
+    for edit_nr, details in edits:
+        html.append('<div class="edit-list"><h2><a href="http://musicbrainz.org/edit/%s">Add relationship</a></h2>'
+                    '<div class="edit-details">%s</div><div class="edit-notes"></div></div>' % (edit_nr, details))
+    html.append('</body></html>')
+    return ''.join(html)
+
+
+class ParseEditListTest(unittest.TestCase):
+
+    def test_edits(self):
+        page = edit_list_page([('12', 'artist <a href="/artist/a">A</a>'), ('11', 'url http://example.com/')])
+        self.assertEqual(parse_edit_list(page), [
+            ('12', 'artist <a href="/artist/a">A</a>'),
+            ('11', 'url http://example.com/'),
+        ])
+
+    def test_empty(self):
+        self.assertEqual(parse_edit_list(edit_list_page([])), [])
+        self.assertEqual(parse_edit_list(''), [])
+
+    def test_details_stay_with_their_edit(self):
+        # an edit without details doesn't get those of the next one
+        page = ('<h2><a href="/edit/3">Edit</a></h2>'
+                '<h2><a href="/edit/2">Edit</a></h2><div class="edit-details">two</div>')
+        self.assertEqual(parse_edit_list(page), [('3', ''), ('2', 'two')])
+
+    def test_other_headings(self):
+        page = '<h2><a href="/artist/x">Not an edit</a></h2>' + edit_list_page([('5', 'five')])
+        self.assertEqual(parse_edit_list(page), [('5', 'five')])
+
+    def test_unterminated_details(self):
+        self.assertEqual(parse_edit_list('<h2><a href="/edit/7">Edit</a></h2><div class="edit-details">cut off'),
+                         [('7', 'cut off')])
+
+
+class EditIndexTest(unittest.TestCase):
+
+    def pages(self, first, count, page_size=3):
+        # Edit list pages from edit number first down to first - count + 1
+        edits = [(str(nr), 'edit %d' % (nr,)) for nr in range(first, first - count, -1)]
+        return [edits[i:i + page_size] for i in range(0, len(edits), page_size)]
+
+    def test_find(self):
+        index = EditIndex()
+        index.add_new(self.pages(10, 6))
+        self.assertEqual(index.find(lambda nr, details: details == 'edit 7'), 7)
+        self.assertEqual(index.find(lambda nr, details: details == 'edit 1'), None)
+        self.assertEqual(index.find_all(lambda nr, details: int(nr) % 2 == 0), [10, 8, 6])
+
+    def test_next_page(self):
+        index = EditIndex()
+        index.add_new(self.pages(10, 6))
+        self.assertEqual(index.next_page(), 3)
+        new = index.add_old(self.pages(4, 3)[0])
+        self.assertEqual(len(new), 3)
+        self.assertEqual(index.next_page(), 4)
+
+    def test_new_edits(self):
+        index = EditIndex()
+        index.add_new(self.pages(10, 6))
+        # two new edits shift the old ones down the list
+        index.add_new(self.pages(12, 3))
+        self.assertEqual(sorted(index.edits), [5, 6, 7, 8, 9, 10, 11, 12])
+        self.assertEqual(index.depth, 8)
+
+    def test_gap(self):
+        # new pages that don't reach the indexed edits replace them
+        index = EditIndex()
+        index.add_new(self.pages(10, 3))
+        index.add_new(self.pages(30, 3))
+        self.assertEqual(sorted(index.edits), [28, 29, 30])
+        self.assertEqual(index.depth, 3)
+
+    def test_size(self):
+        index = EditIndex(size=4)
+        index.add_new(self.pages(10, 6))
+        self.assertEqual(sorted(index.edits), [7, 8, 9, 10])
+
+
+class EditQuotaTest(unittest.TestCase):
+
+    def test_needs_sync(self):
+        quota = EditQuota(resync_interval=3600)
+        self.assertTrue(quota.needs_sync())
+        quota.sync(10, 20)
+        self.assertFalse(quota.needs_sync())
+        quota.sync_time -= 3601
+        self.assertTrue(quota.needs_sync())
+
+    def test_rollover(self):
+        # the count of today's edits starts over after midnight UTC, so the
+        # quota is scraped again even within the resync interval
+        quota = EditQuota(resync_interval=3600)
+        quota.sync(1000, 20)
+        self.assertEqual(quota.left(2000, 1000), (0, 0))
+        quota.sync_day -= timedelta(days=1)
+        self.assertTrue(quota.needs_sync())
+        quota.sync(0, 20)
+        self.assertEqual(quota.left(2000, 1000), (1000, 1000))
+
+    def test_count_edit(self):
+        quota = EditQuota()
+        quota.sync(10, 1995)
+        quota.count_edit()
+        quota.count_edit(auto=True)
+        self.assertEqual((quota.edits_today, quota.open_edits), (12, 1996))
+        self.assertEqual(quota.left(2000, 1000), (4, 988))
+
+    def test_left(self):
+        quota = EditQuota()
+        quota.sync(999, 0)
+        self.assertEqual(quota.left(2000, 1000), (1, 1))
+        quota.count_edit()
+        self.assertEqual(quota.left(2000, 1000), (0, 0))
+
+
+class FakeClient(object):
+    # Records the edits the buffer submits
+
+    def __init__(self, result=True):
+        self.result = result
+        self.edits = []
+
+    def edit_artist(self, artist, update, edit_note, auto, sources):
+        self.edits.append(('artist', artist, update, edit_note, auto, sources))
+        return self.result
+
+    def edit_release(self, mbid, information, tracklist, edit_note, auto, sources):
+        if isinstance(self.result, Exception):
+            raise self.result
+        self.edits.append(('release', mbid, information, tracklist, edit_note, auto, sources))
+        return self.result
+
+
+class EditBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time, editing.time = editing.time, self.clock
+        self.client = FakeClient()
+        self.buffer = EditBuffer(self.client, window=300)
+
+    def tearDown(self):
+        editing.time = self.time
+
+    def test_release(self):
+        self.assertEqual(self.buffer.set_release_script('r', 28, 29, 'A', auto=True), [])
+        self.clock.now += 100
+        self.assertEqual(self.buffer.set_release_language('r', 120, 198, 'B', auto=True), [])
+        self.assertEqual(self.buffer.set_release_medium_format('r', None, 29, 'C', auto=True), [])
+        self.clock.now += 200
+        self.assertEqual(self.buffer.flush(), [('release', 'r', True)])
+        self.assertEqual(self.client.edits, [('release', 'r',
+            {'script_id': [['28'], ['29']], 'language_id': [['120'], ['198']]},
+            {'mediums.0.format_id': [['None'], ['29']]},
+            u'A\n\nB\n\nC', True,
+            {'script_id': 'A', 'language_id': 'B', 'mediums.0.format_id': 'C'})])
+        self.assertEqual(self.buffer.pending, {})
+
+    def test_window(self):
+        self.buffer.set_release_script('r', 28, 29, 'A')
+        self.clock.now += 299
+        self.assertEqual(self.buffer.flush(), [])
+        self.assertEqual(self.buffer.close(), [('release', 'r', True)])
+
+    def test_artist(self):
+        self.buffer.edit_artist({'gid': 'a', 'country': 81}, set(['country']), 'A', auto=True)
+        self.buffer.edit_artist({'gid': 'a', 'type': 1, 'country': 81}, set(['type', 'country']), 'B')
+        self.buffer.close()
+        kind, artist, update, edit_note, auto, sources = self.client.edits[0]
+        self.assertEqual(artist, {'gid': 'a', 'country': 81, 'type': 1})
+        self.assertEqual(update, set(['country', 'type']))
+        # only an auto-edit if all of the changes were
+        self.assertEqual((edit_note, auto), (u'A\n\nB', False))
+        self.assertEqual(sources, {'country': 'A', 'type': 'B'})
+
+    def test_conflicts(self):
+        self.buffer.edit_artist({'gid': 'a', 'country': 81}, set(['country']), 'A', auto=True)
+        # every field of this change conflicts, so its note isn't added
+        self.buffer.edit_artist({'gid': 'a', 'country': 222}, set(['country']), 'B')
+        self.clock.now += 1
+        self.buffer.set_release_script('r', 28, 29, 'C', auto=True)
+        self.buffer.set_release_script('r', 28, 30, 'D')
+        self.buffer.close()
+        self.assertEqual([(edit[0], edit[-3], edit[-2]) for edit in self.client.edits],
+                         [('artist', u'A', True), ('release', u'C', True)])
+        self.assertEqual(self.client.edits[0][1], {'gid': 'a', 'country': 81})
+        self.assertEqual(self.client.edits[1][2], {'script_id': [['28'], ['29']]})
+
+    def test_error(self):
+        error = editing.EditError('unable to post edit')
+        self.client.result = error
+        self.buffer.set_release_script('r', 28, 29, 'A')
+        self.clock.now += 1
+        self.buffer.set_release_script('s', 28, 29, 'A')
+        # the other entities are still submitted
+        self.assertEqual(self.buffer.close(), [('release', 'r', error), ('release', 's', error)])
+
+
+if __name__ == '__main__':
+    unittest.main()
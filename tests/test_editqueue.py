@@ -0,0 +1,158 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from editing import EditError
+from editqueue import EditQueue
+import submit_edits
+
+
+class FakeMBDB(object):
+    # Bot tables in SQLite, with the %s parameters of the MusicBrainz
+    # database
+
+    def __init__(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute("CREATE TABLE bot_wp_artist_link (gid TEXT, lang TEXT)")
+
+    def execute(self, query, params=()):
+        return self.db.execute(query.replace('%s', '?'), params)
+
+    def rows(self):
+        return self.execute("SELECT gid, lang FROM bot_wp_artist_link ORDER BY gid").fetchall()
+
+
+def row(gid):
+    return {'gid': gid, 'lang': 'en'}
+
+
+class EditQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = EditQueue(os.path.join(self.dir, 'edit_queue.db'))
+        self.db = FakeMBDB()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_put_take(self):
+        self.queue.add_url('artist', 'a', 179, 'http://en.wikipedia.org/wiki/A', 'note', auto=True)
+        self.queue.edit_artist({'gid': 'b'}, set(['country']), 'note')
+        edits = self.queue.take(limit=1)
+        self.assertEqual([edit[1:] for edit in edits],
+                         [('add_url', ['artist', 'a', 179, 'http://en.wikipedia.org/wiki/A', 'note'], {'auto': True})])
+        # sets are stored as lists
+        self.assertEqual(self.queue.take()[0][2], [{'gid': 'b'}, ['country'], 'note'])
+        self.assertEqual(self.queue.take(), [])
+        self.assertEqual(self.queue.counts(), {'submitting': 2})
+
+    def test_unknown_method(self):
+        self.assertRaises(AttributeError, getattr, self.queue, 'add_release')
+        self.assertRaises(ValueError, self.queue.put, 'add_release', {})
+
+    def test_finish_and_reset(self):
+        first = self.queue.add_url('artist', 'a', 179, 'url', 'note')
+        second = self.queue.add_url('artist', 'b', 179, 'url', 'note')
+        third = self.queue.add_url('artist', 'c', 179, 'url', 'note')
+        self.queue.take()
+        self.queue.finish(first)
+        self.queue.finish(second, EditError('unable to post edit'))
+        self.assertEqual(self.queue.counts(), {'done': 1, 'failed': 1, 'submitting': 1})
+        self.queue.reset()
+        self.assertEqual([edit[0] for edit in self.queue.take()], [third])
+        self.queue.reset(failed=True)
+        self.assertEqual(sorted(edit[0] for edit in self.queue.take()), [second, third])
+
+    def test_error_bytes(self):
+        # the body of an error response from the server
+        id = self.queue.add_url('artist', 'a', 179, 'url', 'note')
+        self.queue.take()
+        self.queue.finish(id, EditError('web service error 400: caf\xc3\xa9 \xff'))
+        error = self.queue.db.execute("SELECT error FROM edit_queue WHERE id = ?", (id,)).fetchone()[0]
+        self.assertEqual(error, u'web service error 400: caf\xe9 \ufffd')
+
+    def test_old_queue(self):
+        path = os.path.join(self.dir, 'old.db')
+        db = sqlite3.connect(path)
+        db.execute("""CREATE TABLE edit_queue (id INTEGER PRIMARY KEY, method TEXT NOT NULL, args TEXT NOT NULL,
+                      kwargs TEXT NOT NULL, source TEXT, created REAL NOT NULL, status TEXT NOT NULL DEFAULT 'new',
+                      attempts INTEGER NOT NULL DEFAULT 0, error TEXT)""")
+        db.commit()
+        db.close()
+        queue = EditQueue(path)
+        id = queue.add_url('artist', 'a', 179, 'url', 'note')
+        queue.set_processed(id, 'bot_wp_artist_link', row('a'))
+        self.assertEqual(queue.processed(id), ('bot_wp_artist_link', row('a')))
+
+    def test_mark_processed(self):
+        # without a queued edit, the entity is marked right away
+        self.queue.mark_processed(self.db, None, 'bot_wp_artist_link', row('a'))
+        id = self.queue.add_url('artist', 'b', 179, 'url', 'note')
+        self.queue.mark_processed(self.db, id, 'bot_wp_artist_link', row('b'))
+        self.assertEqual(self.db.rows(), [('a', 'en')])
+        self.assertEqual(self.queue.processed(id), ('bot_wp_artist_link', row('b')))
+        self.assertRaises(ValueError, self.queue.mark_processed, self.db, id, 'artist; --', row('b'))
+
+    def test_skip_pending(self):
+        queued = self.queue.add_url('artist', 'a', 179, 'url', 'note')
+        self.queue.mark_processed(self.db, queued, 'bot_wp_artist_link', row('a'))
+        failed = self.queue.add_url('artist', 'b', 179, 'url', 'note')
+        self.queue.mark_processed(self.db, failed, 'bot_wp_artist_link', row('b'))
+        self.queue.db.execute("UPDATE edit_queue SET status = 'failed' WHERE id = ?", (failed,))
+        artists = [{'gid': gid} for gid in ('a', 'b', 'c')]
+        # edits that failed don't hold the entity back
+        self.assertEqual(list(self.queue.skip_pending(artists, 'bot_wp_artist_link', lambda a: row(a['gid']))),
+                         [{'gid': 'b'}, {'gid': 'c'}])
+
+
+class FinishTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.queue = EditQueue(os.path.join(self.dir, 'edit_queue.db'))
+        self.db = FakeMBDB()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def queue_edit(self, gid):
+        id = self.queue.add_url('artist', gid, 179, 'url', 'note')
+        self.queue.mark_processed(self.db, id, 'bot_wp_artist_link', row(gid))
+        return id
+
+    def test_results(self):
+        added, exists, skipped, failed = [self.queue_edit(gid) for gid in ('a', 'b', 'c', 'd')]
+        self.queue.take()
+        submit_edits.finish(self.queue, self.db, added, True)
+        submit_edits.finish(self.queue, self.db, exists, False)
+        submit_edits.finish(self.queue, self.db, skipped, None)
+        submit_edits.finish(self.queue, self.db, failed, EditError('caf\xc3\xa9'))
+        # only edits that went through (or weren't needed) mark the entity
+        self.assertEqual(self.db.rows(), [('a', 'en'), ('b', 'en')])
+        self.assertEqual(self.queue.counts(), {'done': 3, 'failed': 1})
+
+    def test_marked_once(self):
+        first, second = self.queue_edit('a'), self.queue_edit('a')
+        self.queue.take()
+        submit_edits.finish(self.queue, self.db, first, True)
+        submit_edits.finish(self.queue, self.db, second, False)
+        self.assertEqual(self.db.rows(), [('a', 'en')])
+
+    def test_without_processed(self):
+        id = self.queue.add_url('artist', 'a', 179, 'url', 'note')
+        self.queue.take()
+        submit_edits.finish(self.queue, self.db, id, True)
+        self.assertEqual(self.db.rows(), [])
+
+    def test_buffered(self):
+        first, second = self.queue_edit('a'), self.queue_edit('b')
+        pending = {('artist', 'a'): [first], ('artist', 'b'): [second]}
+        submit_edits.finish_buffered(self.queue, self.db, pending, [('artist', 'a', True), ('artist', 'b', None)])
+        self.assertEqual(pending, {})
+        self.assertEqual(self.db.rows(), [('a', 'en')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import imp
+import shutil
+import tempfile
+import unittest
+from tests.support import FakeClock
+from mbbot.wp import pagestore
+from mbbot.wp.pagestore import PageStore
+
+DAY = 86400
+
+SCRIPTS = """# Scripts-6.2.0.txt
+0041..005A    ; Latin # L&  [26] LATIN CAPITAL LETTER A..LATIN CAPITAL LETTER Z
+00AA          ; Latin # Lo       FEMININE ORDINAL INDICATOR
+3041..3096    ; Hiragana # Lo  [86] HIRAGANA LETTER SMALL A..HIRAGANA LETTER SMALL KE
+"""
+
+
+def load_utils(scripts):
+    # A copy of utils imported in a directory with the given Scripts.txt,
+    # which it reads when it is imported
+    dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        open(os.path.join(dir, 'Scripts.txt'), 'w').write(scripts)
+        os.chdir(dir)
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils.py')
+        return imp.load_source('utils_with_scripts', path)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(dir)
+
+
+class FakeWikiInfo(object):
+    # Answers prop=info queries with {title: (lastrevid, touched)}
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def call(self, params):
+        titles = params['titles'].decode('utf8').split('|')
+        self.requests.append(titles)
+        pages = {}
+        for i, title in enumerate(titles):
+            if title in self.pages:
+                revid, touched = self.pages[title]
+                pages[str(i + 1)] = {'pageid': i + 1, 'title': title, 'lastrevid': revid, 'touched': touched}
+            else:
+                pages[str(-1 - i)] = {'title': title, 'missing': ''}
+        return {'query': {'pages': pages}}
+
+
+class PageStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.time, pagestore.time = pagestore.time, self.clock
+
+    def tearDown(self):
+        pagestore.time = self.time
+        shutil.rmtree(self.dir)
+
+    def store(self, **kwargs):
+        return PageStore(os.path.join(self.dir, 'en.db'), **kwargs)
+
+    def test_put_get(self):
+        store = self.store()
+        store.put(u'Caf\xe9', u'text \u3042', 10)
+        self.assertEqual(store.get(u'Caf\xe9'), u'text \u3042')
+        self.assertEqual(store.get(u'Other'), None)
+        self.assertTrue(u'Caf\xe9' in store)
+
+    def test_stale(self):
+        store = self.store(max_age=7 * DAY)
+        store.put(u'Old', u'old', 1, fetched=self.clock.now - 8 * DAY)
+        store.put(u'New', u'new', 2)
+        self.assertEqual(store.stale([u'Old', u'New', u'Missing']), {u'Old': (1, self.clock.now - 8 * DAY)})
+        # stale pages are only returned when freshness doesn't matter
+        self.assertEqual(store.get(u'Old'), u'old')
+        self.assertEqual(store.get(u'Old', fresh=True), None)
+        self.assertEqual(store.get(u'New', fresh=True), u'new')
+
+    def test_mark_fresh(self):
+        store = self.store(max_age=7 * DAY)
+        store.put(u'Old', u'old', None, fetched=self.clock.now - 8 * DAY)
+        store.mark_fresh({u'Old': 5})
+        self.assertEqual(store.stale([u'Old']), {})
+        self.clock.now += 8 * DAY
+        self.assertEqual(store.stale([u'Old']), {u'Old': (5, self.clock.now - 8 * DAY)})
+
+    def test_evict_least_recently_used(self):
+        store = self.store()
+        for i in range(10):
+            store.put(u'Page %d' % i, os.urandom(1000).encode('hex').decode('ascii'))
+            self.clock.now += 2 * pagestore.ACCESS_RESOLUTION
+        # reading the first page makes it the most recently used one
+        store.get(u'Page 0')
+        store.max_size = store.size() * 0.8
+        store.evict()
+        self.assertTrue(store.size() <= store.max_size * 0.9)
+        self.assertTrue(u'Page 0' in store)
+        self.assertFalse(u'Page 1' in store)
+        self.assertTrue(u'Page 9' in store)
+
+    def test_evict_when_written(self):
+        # eviction runs by itself once enough has been written
+        store = self.store(max_size=5000)
+        for i in range(20):
+            store.put(u'Page %d' % i, os.urandom(1000).encode('hex').decode('ascii'))
+            self.clock.now += 1
+        self.assertTrue(store.size() <= 5000 + 2000)
+        self.assertTrue(u'Page 19' in store)
+        self.assertFalse(u'Page 0' in store)
+
+    def test_no_limit(self):
+        store = self.store()
+        for i in range(100):
+            store.put(u'Page %d' % i, os.urandom(1000).encode('hex').decode('ascii'))
+        self.assertEqual(len(store), 100)
+
+
+class RevalidateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.utils = load_utils(SCRIPTS)
+        self.dir = tempfile.mkdtemp()
+        self.store = PageStore(os.path.join(self.dir, 'en.db'), max_age=7 * DAY)
+        self.utils.get_store = lambda wp_lang: self.store
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_scripts(self):
+        # the ranges of the scripts are read from Scripts.txt
+        self.assertEqual(self.utils.script_ranges['Hiragana'], [(0x3041, 0x3096)])
+        self.assertEqual(self.utils.script_ranges['Latin'], [(0x41, 0x5a), (0xaa, 0xaa)])
+
+    def test_nothing_stale(self):
+        self.store.put(u'Abba', u'abba', 10)
+        wp = FakeWikiInfo({})
+        self.utils.revalidate_cached_pages(wp, [u'Abba', u'Queen'], 'en')
+        self.assertEqual(wp.requests, [])
+
+    def test_revalidate(self):
+        old = self.utils.time.time() - 8 * DAY
+        self.store.put(u'Same', u'same', 10, fetched=old)
+        self.store.put(u'Changed', u'changed', 10, fetched=old)
+        self.store.put(u'Deleted', u'deleted', 10, fetched=old)
+        self.store.put(u'Untouched', u'untouched', None, fetched=old)
+        self.store.put(u'Touched', u'touched', None, fetched=old)
+        wp = FakeWikiInfo({
+            u'Same': (10, '2012-01-01T00:00:00Z'),
+            u'Changed': (11, '2012-01-01T00:00:00Z'),
+            u'Untouched': (20, '2001-01-01T00:00:00Z'),
+            u'Touched': (30, '2099-01-01T00:00:00Z'),
+        })
+        self.utils.revalidate_cached_pages(wp, [u'Same', u'Changed', u'Deleted', u'Untouched', u'Touched'], 'en')
+        self.assertEqual(self.store.get(u'Same', fresh=True), u'same')
+        self.assertEqual(self.store.get(u'Untouched', fresh=True), u'untouched')
+        self.assertEqual(self.store.stale([u'Untouched']), {})
+        for title in (u'Changed', u'Deleted', u'Touched'):
+            self.assertFalse(title in self.store)
+
+    def test_batches(self):
+        old = self.utils.time.time() - 8 * DAY
+        titles = [u'Page %d' % i for i in range(60)]
+        self.store.put_many([(title, u'text', 1, old) for title in titles])
+        wp = FakeWikiInfo(dict((title, (1, '2012-01-01T00:00:00Z')) for title in titles))
+        self.utils.revalidate_cached_pages(wp, titles, 'en')
+        self.assertEqual(sorted(len(batch) for batch in wp.requests), [10, 50])
+        self.assertEqual(self.store.stale(titles), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
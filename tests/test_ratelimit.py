@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from tests.support import FakeClock
+from mbbot.utils import ratelimit
+from mbbot.utils.ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'ratelimit.json')
+        self.clock = FakeClock()
+        self.time, ratelimit.time = ratelimit.time, self.clock
+
+    def tearDown(self):
+        ratelimit.time = self.time
+        shutil.rmtree(self.dir)
+
+    def test_burst(self):
+        limiter = RateLimiter(self.path, {'edit': (10.0, 3)})
+        for i in range(3):
+            self.assertEqual(limiter.acquire('edit'), 0.0)
+        self.assertEqual(limiter.acquire('edit'), 10.0)
+        self.assertEqual(self.clock.slept, [10.0])
+
+    def test_refill(self):
+        limiter = RateLimiter(self.path, {'edit': (10.0, 2)})
+        limiter.acquire('edit')
+        limiter.acquire('edit')
+        self.clock.now += 15.0
+        self.assertEqual(limiter.acquire('edit'), 0.0)
+        # half a token is left over
+        self.assertEqual(limiter.acquire('edit'), 5.0)
+
+    def test_refill_is_capped_at_burst(self):
+        limiter = RateLimiter(self.path, {'edit': (1.0, 2)})
+        limiter.acquire('edit')
+        self.clock.now += 3600.0
+        self.assertEqual(limiter.acquire('edit'), 0.0)
+        self.assertEqual(limiter.acquire('edit'), 0.0)
+        self.assertEqual(limiter.acquire('edit'), 1.0)
+
+    def test_shared_file(self):
+        limits = {'edit': (10.0, 1)}
+        RateLimiter(self.path, limits).acquire('edit')
+        self.assertEqual(RateLimiter(self.path, limits).acquire('edit'), 10.0)
+
+    def test_all_buckets(self):
+        # a token is only taken when all the buckets have one
+        limiter = RateLimiter(self.path, {'all': (1.0, 5), 'add_url': (60.0, 1)})
+        limiter.acquire('all', 'add_url')
+        self.assertEqual(limiter._reserve(['all', 'add_url']), 60.0)
+        self.assertEqual(limiter._reserve(['all']), 0.0)
+        self.assertEqual(limiter._reserve(['all']), 0.0)
+        self.assertEqual(limiter._reserve(['all']), 0.0)
+        self.assertEqual(limiter._reserve(['all']), 0.0)
+        self.assertEqual(limiter._reserve(['all']), 1.0)
+
+    def test_unknown_names(self):
+        limiter = RateLimiter(self.path, {'edit': (10.0, 1)})
+        self.assertEqual(limiter.acquire('login'), 0.0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_corrupt_file(self):
+        open(self.path, 'w').write('{not json')
+        limiter = RateLimiter(self.path, {'edit': (10.0, 1)})
+        self.assertEqual(limiter.acquire('edit'), 0.0)
+        self.assertEqual(limiter.acquire('edit'), 10.0)
+
+    def test_file_mode(self):
+        RateLimiter(self.path, {'edit': (10.0, 1)}).acquire('edit')
+        self.assertEqual(os.stat(self.path).st_mode & 0777, 0600)
+
+
+if __name__ == '__main__':
+    unittest.main()
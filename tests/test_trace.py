@@ -0,0 +1,93 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import utils
+from mbbot.utils import trace
+from mbbot.utils.trace import Tracer, endpoint
+from mbbot.wp.pagestore import PageStore
+from tests.test_utils import FakeWiki
+
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'trace.jsonl')
+        self.tracers = []
+
+    def tearDown(self):
+        # without the file, the tracers don't print a summary at exit
+        for tracer in self.tracers:
+            if tracer.file is not None:
+                tracer.file.close()
+                tracer.file = None
+        shutil.rmtree(self.dir)
+
+    def tracer(self):
+        tracer = Tracer(self.path)
+        self.tracers.append(tracer)
+        return tracer
+
+    def entries(self):
+        return [json.loads(line) for line in open(self.path)]
+
+    def test_endpoint(self):
+        self.assertEqual(endpoint('http://musicbrainz.org/edit/relationship/create_url?entity=x'),
+                         'musicbrainz.org/edit/relationship/create_url')
+        self.assertEqual(endpoint('http://musicbrainz.org/artist/89ad4ac3-39f7-470e-963a-56509c546377/edit'),
+                         'musicbrainz.org/artist/:id/edit')
+
+    def test_record(self):
+        tracer = self.tracer()
+        tracer.record('en.wikipedia.org/w/api.php', 0.25, status=200, bytes=2048)
+        tracer.record('en.wikipedia.org/w/api.php', 0.5, status=503)
+        tracer.file.flush()
+        entries = self.entries()
+        self.assertEqual([(e['latency'], e['status']) for e in entries], [(0.25, 200), (0.5, 503)])
+        stats = tracer.endpoints['en.wikipedia.org/w/api.php']
+        self.assertEqual((stats['count'], stats['errors'], stats['bytes']), (2, 1, 2048))
+
+    def test_without_latency(self):
+        # cache misses are counted, but don't add to the percentiles
+        tracer = self.tracer()
+        tracer.record('wiki-cache/en', 0.001, cache='hit')
+        tracer.record('wiki-cache/en', None, cache='miss')
+        tracer.record('wiki-cache/en', None, cache='miss')
+        tracer.file.flush()
+        self.assertEqual([e.get('latency') for e in self.entries()], [0.001, None, None])
+        stats = tracer.endpoints['wiki-cache/en']
+        self.assertEqual((stats['count'], stats['hits'], stats['latency']), (3, 1, [0.001]))
+        tracer.record('wiki-cache/fr', None, cache='miss')
+        summary = tracer.summary().splitlines()
+        self.assertEqual(summary[2].split(), ['wiki-cache/fr', '1', '0', '0', '-', '-', '-', '0.0'])
+
+    def test_disabled(self):
+        tracer = Tracer()
+        tracer.record('wiki-cache/en', 0.1)
+        self.assertEqual(tracer.endpoints, {})
+
+
+class PageFetchTraceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        store = PageStore(os.path.join(self.dir, 'en.db'))
+        self.get_store, utils.get_store = utils.get_store, lambda wp_lang: store
+        self.records = []
+        self.record, trace.record = trace.record, lambda *args, **kwargs: self.records.append((args, kwargs))
+
+    def tearDown(self):
+        trace.record = self.record
+        utils.get_store = self.get_store
+        shutil.rmtree(self.dir)
+
+    def test_one_miss_per_title(self):
+        pages = dict((u'Page %d' % i, u'text %d' % i) for i in range(5))
+        utils.get_page_contents(FakeWiki(pages), sorted(pages), 'en', use_cache=False)
+        self.assertEqual(self.records, [(('wiki-cache/en', None), {'cache': 'miss'})] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import gzip
+import errno
+import socket
+import httplib
+import urllib2
+import unittest
+from StringIO import StringIO
+from mimetools import Message
+from mbbot.utils.transport import KeepAliveHandler, _unsent
+
+
+class FakeResponse(object):
+
+    def __init__(self, body, headers=''):
+        self.body = body
+        self.msg = Message(StringIO(headers + '\r\n'))
+        self.status = 200
+        self.reason = 'OK'
+        self.will_close = False
+
+    def read(self):
+        return self.body
+
+    def getheader(self, name, default=None):
+        return self.msg.getheader(name, default)
+
+
+class FakeConnection(object):
+    # Fails with request_error while the request is sent or with
+    # response_error while the response is read
+
+    def __init__(self, request_error=None, response_error=None, response=None):
+        self.request_error = request_error
+        self.response_error = response_error
+        self.response = response or FakeResponse('body')
+        self.requests = []
+        self.closed = False
+
+    def request(self, method, selector, data, headers):
+        self.requests.append((method, selector, data, headers))
+        if self.request_error is not None:
+            raise self.request_error
+
+    def getresponse(self):
+        if self.response_error is not None:
+            raise self.response_error
+        return self.response
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool(object):
+    # Hands out the idle connections first, then new ones
+
+    def __init__(self, idle=(), new=()):
+        self.idle = list(idle)
+        self.new = list(new)
+        self.returned = []
+        self.cleared = 0
+
+    def get(self, scheme, host, timeout):
+        if self.idle:
+            return self.idle.pop(0), True
+        return self.new.pop(0), False
+
+    def put(self, scheme, host, conn):
+        self.returned.append(conn)
+
+    def clear(self, scheme, host):
+        self.cleared += 1
+        self.idle = []
+
+
+def reset():
+    return socket.error(errno.ECONNRESET, 'Connection reset by peer')
+
+
+class UnsentTest(unittest.TestCase):
+
+    def test_closed_without_response(self):
+        self.assertTrue(_unsent(httplib.BadStatusLine("''"), True))
+        self.assertTrue(_unsent(httplib.BadStatusLine(''), True))
+        self.assertFalse(_unsent(httplib.BadStatusLine('HTTP/1.1 2OO OK'), True))
+
+    def test_reset(self):
+        self.assertTrue(_unsent(reset(), False))
+        self.assertTrue(_unsent(socket.error(errno.EPIPE, 'Broken pipe'), False))
+        # the server might have read the request before it reset
+        self.assertFalse(_unsent(reset(), True))
+        self.assertFalse(_unsent(socket.error(errno.ECONNREFUSED, 'Connection refused'), False))
+
+    def test_timeout(self):
+        self.assertFalse(_unsent(socket.timeout('timed out'), False))
+
+
+class KeepAliveHandlerTest(unittest.TestCase):
+
+    def open(self, pool, url='http://musicbrainz.org/ws/2/artist', data=None):
+        return KeepAliveHandler(pool).http_open(urllib2.Request(url, data))
+
+    def test_reuse(self):
+        conn = FakeConnection()
+        pool = FakePool(new=[conn])
+        response = self.open(pool)
+        self.assertEqual(response.read(), 'body')
+        self.assertEqual(pool.returned, [conn])
+        method, selector, data, headers = conn.requests[0]
+        self.assertEqual((method, selector), ('GET', '/ws/2/artist'))
+        self.assertEqual((headers['Connection'], headers['Accept-Encoding']), ('keep-alive', 'gzip'))
+
+    def test_gzip(self):
+        compressed = StringIO()
+        f = gzip.GzipFile(fileobj=compressed, mode='w')
+        f.write('body')
+        f.close()
+        response = FakeResponse(compressed.getvalue(), 'Content-Encoding: gzip\r\nContent-Length: 24\r\n')
+        result = self.open(FakePool(new=[FakeConnection(response=response)]))
+        self.assertEqual(result.read(), 'body')
+        self.assertEqual(result.info().getheader('Content-Length'), '4')
+        self.assertEqual(result.info().getheader('Content-Encoding'), None)
+
+    def test_get_resent(self):
+        stale = FakeConnection(response_error=socket.timeout('timed out'))
+        new = FakeConnection()
+        pool = FakePool(idle=[stale, FakeConnection()], new=[new])
+        self.assertEqual(self.open(pool).read(), 'body')
+        self.assertTrue(stale.closed)
+        # the other idle connections are dropped as well
+        self.assertEqual(pool.cleared, 1)
+        self.assertEqual(len(new.requests), 1)
+
+    def test_post_unsent(self):
+        stale = FakeConnection(response_error=httplib.BadStatusLine("''"))
+        new = FakeConnection()
+        self.assertEqual(self.open(FakePool(idle=[stale], new=[new]), data='a=1').read(), 'body')
+        self.assertEqual(new.requests[0][:3], ('POST', '/ws/2/artist', 'a=1'))
+
+    def test_post_not_resent(self):
+        # the server may have processed the request before the timeout
+        stale = FakeConnection(response_error=socket.timeout('timed out'))
+        new = FakeConnection()
+        self.assertRaises(urllib2.URLError, self.open, FakePool(idle=[stale], new=[new]), data='a=1')
+        self.assertEqual(new.requests, [])
+
+    def test_post_reset_while_reading(self):
+        stale = FakeConnection(response_error=reset())
+        self.assertRaises(urllib2.URLError, self.open, FakePool(idle=[stale], new=[FakeConnection()]), data='a=1')
+        stale = FakeConnection(request_error=reset())
+        new = FakeConnection()
+        self.assertEqual(self.open(FakePool(idle=[stale], new=[new]), data='a=1').read(), 'body')
+
+    def test_new_connection_not_resent(self):
+        new = FakeConnection(request_error=reset())
+        self.assertRaises(urllib2.URLError, self.open, FakePool(new=[new, FakeConnection()]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+import utils
+from mbbot.wp.pagestore import PageStore
+
+
+class FakeWiki(object):
+    # Answers prop=revisions queries like the MediaWiki API: titles are
+    # normalized, redirects are followed with the redirects parameter and
+    # only max_revisions pages per response get their content, the others
+    # are listed without it, as when the response gets too big
+
+    def __init__(self, pages, max_revisions=None):
+        self.pages = pages
+        self.max_revisions = max_revisions
+        self.requests = []
+
+    def call(self, params):
+        titles = params['titles'].decode('utf8').split('|')
+        self.requests.append(titles)
+        query = {'pages': {}}
+        revisions = 0
+        for i, title in enumerate(titles):
+            name = title[:1].upper() + title[1:].replace('_', ' ')
+            if name != title:
+                query.setdefault('normalized', []).append({'from': title, 'to': name})
+            text = self.pages.get(name)
+            if text is not None and 'redirects' in params and text.startswith('#REDIRECT [['):
+                target = text[len('#REDIRECT [['):text.index(']]')]
+                query.setdefault('redirects', []).append({'from': name, 'to': target})
+                name, text = target, self.pages.get(target)
+            if text is None:
+                query['pages'][str(-1 - i)] = {'ns': 0, 'title': name, 'missing': ''}
+                continue
+            pageid = sorted(self.pages).index(name) + 1
+            page = {'pageid': pageid, 'ns': 0, 'title': name}
+            if self.max_revisions is None or revisions < self.max_revisions:
+                page['revisions'] = [{'revid': pageid * 10, '*': text}]
+                revisions += 1
+            query['pages'][str(pageid)] = page
+        return {'query': query}
+
+
+class GetPageContentsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = PageStore(os.path.join(self.dir, 'en.db'))
+        self.get_store, utils.get_store = utils.get_store, lambda wp_lang: self.store
+
+    def tearDown(self):
+        utils.get_store = self.get_store
+        shutil.rmtree(self.dir)
+
+    def test_normalized(self):
+        wp = FakeWiki({u'Abba': u'abba', u'The Beatles': u'beatles'})
+        result = utils.get_page_contents(wp, [u'abba', u'The_Beatles'], 'en')
+        self.assertEqual(result, {u'abba': u'abba', u'The_Beatles': u'beatles'})
+        # cached under the title they were asked for
+        self.assertEqual(self.store.get(u'abba'), u'abba')
+
+    def test_missing(self):
+        wp = FakeWiki({u'Abba': u'abba'})
+        result = utils.get_page_contents(wp, [u'Abba', u'Nothing'], 'en')
+        self.assertEqual(result, {u'Abba': u'abba', u'Nothing': None})
+        self.assertEqual(self.store.get(u'Nothing'), None)
+
+    def test_redirects(self):
+        pages = {u'ABBA (band)': u'#REDIRECT [[ABBA]]', u'ABBA': u'abba', u'Gone': u'#REDIRECT [[Deleted]]'}
+        result = utils.get_page_contents(FakeWiki(pages), [u'ABBA (band)', u'Gone'], 'en')
+        self.assertEqual(result, {u'ABBA (band)': u'#REDIRECT [[ABBA]]', u'Gone': u'#REDIRECT [[Deleted]]'})
+        self.store = PageStore(os.path.join(self.dir, 'en2.db'))
+        result = utils.get_page_contents(FakeWiki(pages), [u'ABBA (band)', u'Gone'], 'en', follow_redirects=True)
+        self.assertEqual(result, {u'ABBA (band)': u'abba', u'Gone': None})
+        # the target is cached under its own title
+        self.assertEqual(self.store.get(u'ABBA'), u'abba')
+        self.assertEqual(self.store.get(u'ABBA (band)'), None)
+
+    def test_batches(self):
+        pages = dict((u'Page %d' % i, u'text %d' % i) for i in range(120))
+        wp = FakeWiki(pages)
+        result = utils.get_page_contents(wp, sorted(pages), 'en')
+        self.assertEqual(result, pages)
+        self.assertEqual([len(titles) for titles in wp.requests], [50, 50, 20])
+
+    def test_truncated(self):
+        # pages left out of a response are asked for again
+        pages = dict((u'Page %d' % i, u'text %d' % i) for i in range(10))
+        wp = FakeWiki(pages, max_revisions=4)
+        result = utils.get_page_contents(wp, sorted(pages), 'en')
+        self.assertEqual(result, pages)
+        self.assertEqual([len(titles) for titles in wp.requests], [10, 6, 2])
+
+    def test_nothing_fits(self):
+        # the batches get smaller until a single page doesn't fit, which is
+        # then given up on
+        wp = FakeWiki({u'Huge': u'text', u'Small': u'text'}, max_revisions=0)
+        result = utils.get_page_contents(wp, [u'Huge', u'Small'], 'en')
+        self.assertEqual(result, {u'Huge': None, u'Small': None})
+        self.assertEqual(wp.requests[-2:], [[u'Huge'], [u'Small']])
+        self.assertEqual(len(wp.requests), 7)
+
+    def test_cached(self):
+        self.store.put(u'Abba', u'cached', 10)
+        wp = FakeWiki({u'Abba': u'abba', u'Queen': u'queen'})
+        result = utils.get_page_contents(wp, [u'Abba', u'Queen', u'Abba'], 'en')
+        self.assertEqual(result, {u'Abba': u'cached', u'Queen': u'queen'})
+        self.assertEqual(wp.requests, [[u'Queen']])
+
+
+if __name__ == '__main__':
+    unittest.main()
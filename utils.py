@@ -6,7 +6,12 @@ import locale
 import sys
 import os
 import unicodedata
+import resource
+import time
+import calendar
 from subprocess import Popen, PIPE
+from mbbot.utils import trace
+from mbbot.wp.pagestore import get_store
 
 def mangle_name(s):
     s = unaccent(s.lower())
@@ -50,10 +55,10 @@ for line in open('Scripts.txt'):
     range_str = parts[0].strip()
     script = parts[1].split()[0]
     if '..' in range_str:
-        range = tuple(int(a, 16) for a in range_str.split('..'))
+        script_range = tuple(int(a, 16) for a in range_str.split('..'))
     else:
-        range = (int(range_str, 16), int(range_str, 16))
-    script_ranges.setdefault(script, []).append(range)
+        script_range = (int(range_str, 16), int(range_str, 16))
+    script_ranges.setdefault(script, []).append(script_range)
 
 
 def is_in_script(text, scripts):
@@ -122,36 +127,110 @@ def colored_out(color, *args):
     sys.stdout.write(color + ' '.join(args) + bcolors.ENDC + '\n')
     sys.stdout.flush()
 
-def get_page_content_from_cache(title, wp_lang):
-    key = title.encode('utf-8', 'xmlcharrefreplace').replace('/', '_')
-    file = os.path.join('wiki-cache', wp_lang, key[0], key)
-    if os.path.exists(file):
-        return open(file).read().decode('utf8')
+# The page cache is one SQLite file per language, wiki-cache/<lang>.db, see
+# mbbot.wp.pagestore; migrate_wiki_cache.py converts the old tree of files
 
+def get_page_content_from_cache(title, wp_lang, fresh=False):
+    # With fresh=True, pages that are due to be revalidated are not returned
+    return get_store(wp_lang).get(title, fresh)
 
-def add_page_content_to_cache(title, content, wp_lang):
-    key = title.encode('utf-8', 'xmlcharrefreplace').replace('/', '_')
-    dir = os.path.join('wiki-cache', wp_lang, key[0])
-    if not os.path.exists(dir):
-        os.mkdir(dir)
-    file = os.path.join(dir, key)
-    f = open(file, 'w')
-    f.write(content.encode('utf8'))
-    f.close()
 
+def add_page_content_to_cache(title, content, wp_lang, revid=None):
+    get_store(wp_lang).put(title, content, revid)
 
-def get_page_content(wp, title, wp_lang, use_cache=True):
+
+def parse_mw_timestamp(timestamp):
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
+
+
+def revalidate_cached_pages(wp, titles, wp_lang):
+    # Check the cached pages that haven't been checked for a while against
+    # the current revisions on the wiki, 50 titles per request. Unchanged
+    # pages are good for another WIKI_CACHE_MAX_AGE days, changed ones are
+    # removed from the cache so they are fetched again.
+    store = get_store(wp_lang)
+    stale = store.stale(titles).items()
+    for i in range(0, len(stale), 50):
+        batch = stale[i:i + 50]
+        resp = wp.call({'action': 'query', 'prop': 'info', 'titles': u'|'.join(t for (t, r) in batch).encode('utf8')})
+        normalized = dict((n['from'], n['to']) for n in resp['query'].get('normalized', []))
+        pages = dict((p['title'], p) for p in resp['query']['pages'].values())
+        fresh = {}
+        changed = []
+        for title, (revid, fetched) in batch:
+            page = pages.get(normalized.get(title, title), {})
+            if 'lastrevid' not in page:
+                changed.append(title)
+            elif revid is not None and revid == page['lastrevid']:
+                fresh[title] = revid
+            elif revid is None and parse_mw_timestamp(page['touched']) < fetched:
+                # from the old cache, without revision; unchanged since
+                fresh[title] = page['lastrevid']
+            else:
+                changed.append(title)
+        store.mark_fresh(fresh)
+        store.delete(changed)
+
+
+def get_page_contents(wp, titles, wp_lang, use_cache=True, follow_redirects=False):
+    # Returns {title: content} for the given titles, with None for pages
+    # that don't exist. Pages that aren't in the cache are fetched, 50 titles
+    # per request, and cached under the title they were asked for. Redirects
+    # are only followed with follow_redirects, otherwise the content of a
+    # redirect is the redirect itself; the target of a followed redirect is
+    # cached under its own title.
+    result = {}
+    seen = set()
+    titles = [t for t in titles if not (t in seen or seen.add(t))]
     if use_cache:
-        content = get_page_content_from_cache(title, wp_lang)
+        revalidate_cached_pages(wp, titles, wp_lang)
+    todo = []
+    for title in titles:
+        start = time.time()
+        content = get_page_content_from_cache(title, wp_lang) if use_cache else None
         if content:
-            return content
-    resp = wp.call({'action': 'query', 'prop': 'revisions', 'titles': title.encode('utf8'), 'rvprop': 'content'})
-    pages = resp['query']['pages'].values()
-    if not pages or 'revisions' not in pages[0]:
-        return None
-    content = pages[0]['revisions'][0].values()[0]
-    add_page_content_to_cache(title, content, wp_lang)
-    return content
+            trace.record('wiki-cache/%s' % (wp_lang,), time.time() - start, cache='hit')
+            result[title] = content
+        else:
+            todo.append(title)
+    batch_size = 50
+    while todo:
+        batch, todo = todo[:batch_size], todo[batch_size:]
+        params = {'action': 'query', 'prop': 'revisions', 'titles': u'|'.join(batch).encode('utf8'), 'rvprop': 'content|ids'}
+        if follow_redirects:
+            params['redirects'] = ''
+        query = wp.call(params)['query']
+        normalized = dict((n['from'], n['to']) for n in query.get('normalized', []))
+        redirects = dict((r['from'], r['to']) for r in query.get('redirects', []))
+        pages = dict((p['title'], p) for p in query.get('pages', {}).values())
+        retry = []
+        for title in batch:
+            name = normalized.get(title, title)
+            page = pages.get(redirects.get(name, name), {})
+            if 'revisions' in page:
+                revision = page['revisions'][0]
+                add_page_content_to_cache(page['title'] if name in redirects else title,
+                                          revision['*'], wp_lang, revision.get('revid'))
+                result[title] = revision['*']
+            elif page and 'missing' not in page and 'invalid' not in page:
+                # left out of the response because it got too big
+                retry.append(title)
+            else:
+                result[title] = None
+        # the time of the fetch is traced with the API request
+        for title in batch:
+            trace.record('wiki-cache/%s' % (wp_lang,), None, cache='miss')
+        if retry and len(retry) == len(batch):
+            if batch_size == 1:
+                result[batch[0]] = None
+                retry = []
+            batch_size = max(1, batch_size / 2)
+        todo = retry + todo
+    return result
+
+
+def get_page_content(wp, title, wp_lang, use_cache=True):
+    return get_page_contents(wp, [title], wp_lang, use_cache)[title]
 
 
 def extract_page_title(url, wp_lang, normalize=False):
@@ -224,6 +303,16 @@ def extract_mbid(url, entity):
         return None
     return m.group(1)
 
+def memory_usage():
+    # Current and peak resident memory of this process, for run summaries
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    try:
+        pages = int(open('/proc/self/statm').read().split()[1])
+        current = pages * resource.getpagesize() / 1048576.0
+    except (IOError, ValueError, IndexError):
+        return u'peak memory %.1f MB' % (peak,)
+    return u'memory %.1f MB (peak %.1f MB)' % (current, peak)
+
 def program_string(filename):
     path = os.path.realpath(filename)
     script = os.path.basename(path)
@@ -6,10 +6,9 @@ import os
 import datetime
 import re
 import sqlalchemy
-from editing import MusicBrainzClient
+from editqueue import EditQueue
 import pprint
 import urllib
-import time
 from mbbot.utils.pidfile import PIDFile
 from mbbot.wp.wikipage import WikiPage
 from mbbot.wp.analysis import determine_country, determine_type, determine_gender, determine_begin_date, determine_end_date
@@ -24,7 +23,7 @@ engine = sqlalchemy.create_engine(cfg.MB_DB)
 db = engine.connect()
 db.execute("SET search_path TO musicbrainz")
 
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 """
 CREATE TABLE bot_wp_artist_data (
@@ -84,9 +83,12 @@ artist_type_ids = {}
 for id, code in db.execute("SELECT id, lower(name) FROM artist_type"):
     artist_type_ids[code] = id
 
+def processed_row(artist):
+    return {'gid': artist['gid'], 'lang': wp_lang}
+
 def main():
     seen = set()
-    for artist in db.execute(query):
+    for artist in mb.skip_pending(db.execute(query), 'bot_wp_artist_data', processed_row):
         if artist['id'] in seen:
             continue
         seen.add(artist['id'])
@@ -147,15 +149,15 @@ def main():
                 update.add('end_date')
                 reasons.append(('END DATE', end_date_reasons))
 
+        queued = None
         if update:
             edit_note = 'From %s' % (artist['url'],)
             for field, reason in reasons:
                 edit_note += '\n\n%s:\n%s' % (field, ' '.join(reason))
             out(' * edit note:', edit_note.replace('\n', ' '))
-            time.sleep(10)
-            mb.edit_artist(artist, update, edit_note)
+            queued = mb.edit_artist(artist, update, edit_note)
 
-        db.execute("INSERT INTO bot_wp_artist_data (gid, lang) VALUES (%s, %s)", (artist['gid'], wp_lang))
+        mb.mark_processed(db, queued, 'bot_wp_artist_data', processed_row(artist))
         out()
 
 if __name__ == '__main__':
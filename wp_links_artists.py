@@ -3,15 +3,15 @@
 import sys
 import re
 import sqlalchemy
-import solr
-from simplemediawiki import MediaWiki
-from editing import MusicBrainzClient
+from editqueue import EditQueue
 import pprint
 import urllib
-import time
 from mbbot.wp.wikipage import WikiPage
+from mbbot.wp.prefetch import prefetch
+from mbbot.wp.fetch import PageFetchPool
 from mbbot.wp.analysis import determine_country
-from utils import mangle_name, join_names, out, colored_out, bcolors, escape_query, quote_page_title
+from utils import mangle_name, join_names, out, colored_out, bcolors, escape_query, quote_page_title, memory_usage
+from mbbot.wp.search import solr_connection
 import config as cfg
 
 engine = sqlalchemy.create_engine(cfg.MB_DB)
@@ -20,12 +20,9 @@ db.execute("SET search_path TO musicbrainz")
 
 wp_lang = sys.argv[1] if len(sys.argv) > 1 else 'en'
 
-wp = MediaWiki('http://%s.wikipedia.org/w/api.php' % wp_lang)
+wps = solr_connection(wp_lang)
 
-suffix = '_' + wp_lang if wp_lang != 'en' else ''
-wps = solr.SolrConnection('http://localhost:8983/solr/wikipedia'+suffix)
-
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 """
 
@@ -91,21 +88,33 @@ JOIN artist_credit_name acn ON r.artist_credit = acn.artist_credit
 WHERE acn.artist = %s
 """
 
-for artist in db.execute(query, query_params):
-    colored_out(bcolors.OKBLUE, 'Looking up artist "%s" http://musicbrainz.org/artist/%s' % (artist['name'], artist['gid']))
+def candidate_titles(artist):
     matches = wps.query(escape_query(artist['name']), defType='dismax', qf='name', rows=50).results
-    last_wp_request = time.time()
+    titles = []
     for match in matches:
         title = match['name']
         if title.endswith('album)') or title.endswith('song)'):
             continue
         if mangle_name(re.sub(' \(.+\)$', '', title)) != mangle_name(artist['name']) and mangle_name(title) != mangle_name(artist['name']):
             continue
-        delay = time.time() - last_wp_request
-        if delay < 1.0:
-            time.sleep(1.0 - delay)
-        last_wp_request = time.time()
-        wikipage = WikiPage.fetch('http://%s.wikipedia.org/wiki/%s' % (wp_lang, title))
+        titles.append(title)
+    return titles
+
+def processed_row(artist):
+    return {'gid': artist['gid'], 'lang': wp_lang}
+
+processed = 0
+linked = 0
+# artists with a link still waiting in the edit queue were already looked at
+artists = mb.skip_pending(db.execute(query, query_params), 'bot_wp_artist_link', processed_row)
+# the pages of the next artists are fetched in the background while the
+# current one is checked
+for artist, titles, contents in prefetch(PageFetchPool(), wp_lang, artists, candidate_titles):
+    processed += 1
+    queued = None
+    colored_out(bcolors.OKBLUE, 'Looking up artist "%s" http://musicbrainz.org/artist/%s' % (artist['name'], artist['gid']))
+    for title in titles:
+        wikipage = WikiPage(title, contents[title] or '', wp_lang)
         page_orig = wikipage.text
         if not page_orig:
             continue
@@ -162,8 +171,10 @@ for artist in db.execute(query, query_params):
         text = 'Matched based on the name. The page mentions %s.' % (join_names('album', found_albums),)
         colored_out(bcolors.OKGREEN, ' * linking to %s' % (url,))
         out(' * edit note: %s' % (text,))
-        time.sleep(60)
-        mb.add_url("artist", artist['gid'], 179, url, text)
+        queued = mb.add_url("artist", artist['gid'], 179, url, text)
+        linked += 1
         break
-    db.execute("INSERT INTO bot_wp_artist_link (gid, lang) VALUES (%s, %s)", (artist['gid'], wp_lang))
+    mb.mark_processed(db, queued, 'bot_wp_artist_link', processed_row(artist))
+
+out('processed %d artists, linked %d, %s' % (processed, linked, memory_usage()))
 
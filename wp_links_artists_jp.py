@@ -2,21 +2,20 @@
 
 import re
 import sqlalchemy
-import solr
-from simplemediawiki import MediaWiki
 from editing import MusicBrainzClient
 import pprint
 import urllib
-import time
-from utils import mangle_name, join_names, contains_text_in_script, quote_page_title
+from utils import mangle_name, join_names, contains_text_in_script, quote_page_title, get_page_contents
+from mbbot.wp.api import get_api
+from mbbot.wp.search import solr_connection
 import config as cfg
 
 engine = sqlalchemy.create_engine(cfg.MB_DB)
 db = engine.connect()
 db.execute("SET search_path TO musicbrainz")
 
-wp = MediaWiki('http://ja.wikipedia.org/w/api.php')
-wps = solr.SolrConnection('http://localhost:8983/solr/wikipedia_ja')
+wp = get_api('ja')
+wps = solr_connection('ja')
 
 mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
 
@@ -79,27 +78,25 @@ for id, gid, name in db.execute(query):
         continue
     print 'Looking up artist "%s" http://musicbrainz.org/artist/%s' % (name, gid)
     matches = wps.query(name, defType='dismax', qf='name', rows=50).results
-    last_wp_request = time.time()
+    titles = []
     for match in matches:
         title = match['name']
         if title.endswith('album)') or title.endswith('song)'):
             continue
         if mangle_name(re.sub(' \(.+\)$', '', title)) != mangle_name(name) and mangle_name(title) != mangle_name(name):
             continue
-        delay = time.time() - last_wp_request
-        if delay < 1.0:
-            time.sleep(1.0 - delay)
-        last_wp_request = time.time()
-        resp = wp.call({'action': 'query', 'prop': 'revisions', 'titles': title, 'rvprop': 'content'})
-        pages = resp['query']['pages'].values()
-        if not pages or 'revisions' not in pages[0]:
+        titles.append(title)
+    # all the candidates in one request, not one request each
+    contents = get_page_contents(wp, titles, 'ja')
+    for title in titles:
+        if not contents[title]:
             continue
-        page = mangle_name(pages[0]['revisions'][0].values()[0])
+        page = mangle_name(contents[title])
         if u'曖昧さ回避' in page:
             print ' * disambiguation, skipping'
             continue
         print ' * trying article "%s"' % (title,)
-        page_title = pages[0]['title']
+        page_title = title
         found_albums = []
         albums = set([r[0] for r in db.execute(query_artist_albums, (id, id))])
         albums_to_ignore = set()
@@ -1,22 +1,21 @@
 import re
 import sqlalchemy
-import solr
-from simplemediawiki import MediaWiki
-from editing import MusicBrainzClient
+from editqueue import EditQueue
 import pprint
 import urllib
-import time
 from utils import mangle_name, join_names, quote_page_title
+from mbbot.wp.prefetch import prefetch
+from mbbot.wp.fetch import PageFetchPool
+from mbbot.wp.search import solr_connection
 import config as cfg
 
 engine = sqlalchemy.create_engine(cfg.MB_DB)
 db = engine.connect()
 db.execute("SET search_path TO musicbrainz")
 
-wp = MediaWiki('http://en.wikipedia.org/w/api.php')
-wps = solr.SolrConnection('http://localhost:8983/solr/wikipedia')
+wps = solr_connection('en')
 
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 """
 CREATE TABLE bot_wp_label (
@@ -57,30 +56,38 @@ JOIN release_label rl ON rl.release = r.id
 WHERE rl.label = %s
 """
 
-for id, gid, name in db.execute(query):
-    print 'Looking up label "%s" http://musicbrainz.org/label/%s' % (name, gid)
+def candidate_titles(label):
+    name = label[2]
     matches = wps.query(name.lower(), defType='dismax', qf='name', rows=50).results
-    last_wp_request = time.time()
+    titles = []
     for match in matches:
         page_title = match['name']
         if mangle_name(re.sub(' \(.+\)$', '', page_title)) != mangle_name(name) and mangle_name(page_title) != mangle_name(name):
             continue
-        delay = time.time() - last_wp_request
-        if delay < 1.0:
-            time.sleep(1.0 - delay)
-        last_wp_request = time.time()
-        resp = wp.call({'action': 'query', 'prop': 'revisions', 'titles': page_title, 'rvprop': 'content'})
-        pages = resp['query']['pages'].values()
-        if not pages or 'revisions' not in pages[0]:
+        titles.append(page_title)
+    return titles
+
+def processed_row(label):
+    return {'gid': label[1]}
+
+# labels with a link still waiting in the edit queue were already looked at
+labels = mb.skip_pending(db.execute(query), 'bot_wp_label', processed_row)
+# the pages of the next labels are fetched in the background while the
+# current one is checked
+for label, titles, contents in prefetch(PageFetchPool(), 'en', labels, candidate_titles):
+    id, gid, name = label
+    queued = None
+    print 'Looking up label "%s" http://musicbrainz.org/label/%s' % (name, gid)
+    for page_title in titles:
+        if not contents[page_title]:
             continue
-        page = mangle_name(pages[0]['revisions'][0].values()[0])
+        page = mangle_name(contents[page_title])
         if 'disambiguationpages' in page:
             print ' * disambiguation or album page, skipping'
             continue
         if 'recordlabels' not in page:
             print ' * not a record label page, skipping'
             continue
-        page_title = pages[0]['title']
         print ' * trying article "%s"' % (page_title,)
         artists = set([r[0] for r in db.execute(query_label_artists, (id,))])
         if name in artists:
@@ -100,8 +107,7 @@ for id, gid, name in db.execute(query):
         text = 'Matched based on the name. The page mentions %s.' % (join_names('artist', found_artists),)
         print ' * linking to %s' % (url,)
         print ' * edit note: %s' % (text,)
-        time.sleep(60)
-        mb.add_url("label", gid, 216, url, text)
+        queued = mb.add_url("label", gid, 216, url, text)
         break
-    db.execute("INSERT INTO bot_wp_label (gid) VALUES (%s)", (gid,))
+    mb.mark_processed(db, queued, 'bot_wp_label', processed_row(label))
 
@@ -3,13 +3,13 @@
 import sys
 import re
 import sqlalchemy
-import solr
-from simplemediawiki import MediaWiki
-from editing import MusicBrainzClient
+from editqueue import EditQueue
 import pprint
 import urllib
-import time
-from utils import mangle_name, join_names, out, get_page_content, extract_page_title, colored_out, bcolors, escape_query, quote_page_title
+from utils import mangle_name, join_names, out, extract_page_title, colored_out, bcolors, escape_query, quote_page_title, memory_usage
+from mbbot.wp.prefetch import prefetch
+from mbbot.wp.fetch import PageFetchPool
+from mbbot.wp.search import solr_connection
 import config as cfg
 
 engine = sqlalchemy.create_engine(cfg.MB_DB)
@@ -18,12 +18,9 @@ db.execute("SET search_path TO musicbrainz")
 
 wp_lang = sys.argv[1] if len(sys.argv) > 1 else 'en'
 
-wp = MediaWiki('http://%s.wikipedia.org/w/api.php' % wp_lang)
+wps = solr_connection(wp_lang)
 
-suffix = '_' + wp_lang if wp_lang != 'en' else ''
-wps = solr.SolrConnection('http://localhost:8983/solr/wikipedia'+suffix)
-
-mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
+mb = EditQueue()
 
 """
 CREATE TABLE bot_wp_rg_link (
@@ -99,19 +96,33 @@ category_re = {}
 category_re['en'] = re.compile(r'\[\[Category:(.+?)(?:\|.*?)?\]\]')
 category_re['fr'] = re.compile(r'\[\[Cat\xe9gorie:(.+?)\]\]')
 
-for rg_id, rg_gid, rg_name, ac_name, rg_type in db.execute(query, query_params):
-    colored_out(bcolors.OKBLUE, 'Looking up release group "%s" http://musicbrainz.org/release-group/%s' % (rg_name, rg_gid))
+def candidate_titles(rg):
+    rg_name = rg[2]
     matches = wps.query(escape_query(rg_name), defType='dismax', qf='name', rows=100).results
-    last_wp_request = time.time()
+    titles = []
     for match in matches:
         title = match['name']
         if mangle_name(re.sub(' \(.+\)$', '', title)) != mangle_name(rg_name) and mangle_name(title) != mangle_name(rg_name):
             continue
-        delay = time.time() - last_wp_request
-        if delay < 1.0:
-            time.sleep(1.0 - delay)
-        last_wp_request = time.time()
-        page_orig = get_page_content(wp, title, wp_lang)
+        titles.append(title)
+    return titles
+
+def processed_row(rg):
+    return {'gid': rg[1], 'lang': wp_lang}
+
+processed = 0
+linked = 0
+# release groups with a link still waiting in the edit queue were already looked at
+rgs = mb.skip_pending(db.execute(query, query_params), 'bot_wp_rg_link', processed_row)
+# the pages of the next release groups are fetched in the background while the
+# current one is checked
+for rg, titles, contents in prefetch(PageFetchPool(), wp_lang, rgs, candidate_titles):
+    rg_id, rg_gid, rg_name, ac_name, rg_type = rg
+    processed += 1
+    queued = None
+    colored_out(bcolors.OKBLUE, 'Looking up release group "%s" http://musicbrainz.org/release-group/%s' % (rg_name, rg_gid))
+    for title in titles:
+        page_orig = contents[title]
         if not page_orig:
             continue
         page_title = title
@@ -180,8 +191,10 @@ for rg_id, rg_gid, rg_name, ac_name, rg_type in db.execute(query, query_params):
         text = 'Matched based on the name. The page mentions artist "%s" and %s.' % (ac_name, join_names('track', found_tracks),)
         colored_out(bcolors.OKGREEN, ' * linking to %s' % (url,))
         out(' * edit note: %s' % (text,))
-        time.sleep(5)
-        mb.add_url("release_group", rg_gid, 89, url, text, auto=auto)
+        queued = mb.add_url("release_group", rg_gid, 89, url, text, auto=auto)
+        linked += 1
         break
-    db.execute("INSERT INTO bot_wp_rg_link (gid, lang) VALUES (%s, %s)", (rg_gid, wp_lang))
+    mb.mark_processed(db, queued, 'bot_wp_rg_link', processed_row(rg))
+
+out('processed %d release groups, linked %d, %s' % (processed, linked, memory_usage()))
 
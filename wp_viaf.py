@@ -4,13 +4,12 @@
 import re
 import sys
 import sqlalchemy
-import time
 import sqlite3
-from simplemediawiki import MediaWiki
 
 from mbbot.utils.pidfile import PIDFile
 from editing import MusicBrainzClient
-from utils import extract_page_title
+from utils import extract_page_title, get_page_contents
+from mbbot.wp.api import get_api
 import config as cfg
 
 
@@ -33,7 +32,7 @@ CREATE TABLE IF NOT EXISTS viaf (
 """)
 
 wp_lang = sys.argv[1] if len(sys.argv) > 1 else 'en'
-wp = MediaWiki('http://%s.wikipedia.org/w/api.php' % wp_lang)
+wp = get_api(wp_lang)
 
 #mb = MusicBrainzClient(cfg.MB_USERNAME, cfg.MB_PASSWORD, cfg.MB_SITE)
 
@@ -87,33 +86,29 @@ def fetch_pages_with_viaf():
         else:
             has_more = False
         sdb.commit()
-        time.sleep(1.0)
 
 
-def fetch_viaf(page):
-    query = {
-        'action': 'query',
-        'titles': page,
-        'prop': 'revisions',
-        'rvprop': 'content'
-    }
-    result = wp.call(query)
-
-    normalized_titles = {}
-    if 'normalized' in result:
-        for n in result['query']['normalized']:
-            normalized_titles[n['from']] = n['to']
-
-    for p in result['query']['pages'].itervalues():
-        if p['title'] == normalized_titles.get(page, page):
-            m = re.search(r'{{Authority[_ ]control\s*\|([^}]+?)}}', p['revisions'][0]['*'])
-            if m is None:
-                print p
-                raise Exception
-            for pair in m.group(1).split('|'):
-                name, value = pair.replace(' ', '').split('=', 2)
-                if name == 'VIAF':
-                    return 'http://viaf.org/viaf/%d/' % (int(value), )
+def extract_viaf(page, content):
+    if content is None:
+        return None
+    m = re.search(r'{{Authority[_ ]control\s*\|([^}]+?)}}', content)
+    if m is None:
+        raise Exception('no authority control template on %s' % (page,))
+    for pair in m.group(1).split('|'):
+        name, value = pair.replace(' ', '').split('=', 2)
+        if name == 'VIAF':
+            return 'http://viaf.org/viaf/%d/' % (int(value), )
+
+
+def save_viafs(artists):
+    # artists is a list of (artist, page) tuples, their pages are fetched
+    # in one request
+    contents = get_page_contents(wp, [page for (artist, page) in artists], wp_lang)
+    for artist, page in artists:
+        viaf = extract_viaf(page, contents[page])
+        print artist, viaf
+        sdb.execute('INSERT INTO viaf (artist, url, viaf) VALUES (?, ?, ?)', (artist['id'], artist['url'], viaf))
+    sdb.commit()
 
 
 def main():
@@ -127,6 +122,7 @@ def main():
         artist_viaf[artist] = {'url': url, 'viaf': viaf, 'submitted': submitted}
 
     cnt = 0
+    todo = []
     for artist in db.execute(wp_url_query):
         if artist['id'] in artist_viaf:
             continue
@@ -134,10 +130,12 @@ def main():
         if page not in pages_with_viaf:
             continue
         cnt += 1
-        viaf = fetch_viaf(page)
-        print artist, viaf
-        sdb.execute('INSERT INTO viaf (artist, url, viaf) VALUES (?, ?, ?)', (artist['id'], artist['url'], viaf))
-        sdb.commit()
+        todo.append((artist, page))
+        if len(todo) == 50:
+            save_viafs(todo)
+            todo = []
+    if todo:
+        save_viafs(todo)
     print cnt
 
 